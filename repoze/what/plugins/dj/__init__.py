@@ -18,15 +18,67 @@ The :mod:`repoze.what` Django plugin.
 
 """
 
-# Let's import the stuff we want to make accessible from this namespace:
-from repoze.what.plugins.dj.middleware import RepozeWhatMiddleware
-from repoze.what.plugins.dj.utils import (is_met, not_met, enforce, require,
-                                          can_access)
-from repoze.what.plugins.dj.predicates import (IsStaff, IsActive, IsSuperuser,
-    IS_STAFF, IS_ACTIVE, IS_SUPERUSER)
+import sys
+from types import ModuleType
+
+from django.utils.importlib import import_module
 
 
 __all__ = ("RepozeWhatMiddleware", "is_met", "not_met", "enforce", "require",
-           "can_access", "IsStaff", "IsActive", "IsSuperuser", "IS_STAFF",
+           "can_access", "can_access_many", "can_access_view",
+           "accessible_urls", "IsStaff", "IsActive", "IsSuperuser", "IS_STAFF",
            "IS_ACTIVE", "IS_SUPERUSER")
 
+
+# The objects we want to make accessible from this namespace, by module. They
+# are only imported when they are first accessed, so that importing the
+# predicates (e.g., in the authz modules) doesn't load the middleware, the
+# in-view utilities and their dependencies on Django:
+_PUBLIC_OBJECTS = {
+    "repoze.what.plugins.dj.middleware": ("RepozeWhatMiddleware", ),
+    "repoze.what.plugins.dj.utils": ("is_met", "not_met", "enforce", "require",
+                                     "can_access", "can_access_many",
+                                     "can_access_view", "accessible_urls"),
+    "repoze.what.plugins.dj.predicates": ("IsStaff", "IsActive", "IsSuperuser",
+                                          "IS_STAFF", "IS_ACTIVE",
+                                          "IS_SUPERUSER"),
+    }
+
+_MODULE_NAMES_BY_OBJECT = dict([
+    (object_name, module_name)
+    for (module_name, object_names) in _PUBLIC_OBJECTS.items()
+    for object_name in object_names
+    ])
+
+
+class _LazyPackage(ModuleType):
+    """
+    Package whose public objects are imported from their modules the first
+    time they are accessed.
+    
+    """
+    
+    def __getattr__(self, name):
+        module_name = _MODULE_NAMES_BY_OBJECT.get(name)
+        if module_name is None:
+            raise AttributeError("module %r has no attribute %r" %
+                                 (self.__name__, name))
+        
+        value = getattr(import_module(module_name), name)
+        # The object is cached so that it's not looked up again:
+        setattr(self, name, value)
+        return value
+    
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(__all__))
+
+
+def _make_package_lazy(package):
+    lazy_package = _LazyPackage(package.__name__)
+    lazy_package.__dict__.update(package.__dict__)
+    # The original module must be kept, or its globals would be cleared:
+    lazy_package._original_package = package
+    sys.modules[package.__name__] = lazy_package
+
+
+_make_package_lazy(sys.modules[__name__])
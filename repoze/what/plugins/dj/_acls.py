@@ -0,0 +1,485 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2010, 2degrees Limited <gustavonarea@2degreesnetwork.com>.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the BSD-like license at
+# http://www.repoze.org/LICENSE.txt.  A copy of the license should accompany
+# this distribution.  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL
+# EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND
+# FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Introspection of :mod:`repoze.what` authorization controls.
+
+:mod:`repoze.what` doesn't provide an API to find out what's inside an ACL or
+an ACL collection, so we have to rely on their private attributes. Anything we
+can't make sense of is assumed to apply to every path and to depend on the
+whole request, so that the optimizations which rely on this module are simply
+not applied.
+
+"""
+
+from copy import copy
+from logging import getLogger
+
+from repoze.what.plugins.dj.predicates import REQUEST, get_dependencies
+from repoze.what.plugins.dj._utils import iter_views, iter_url_patterns
+
+__all__ = ("get_acls", "get_base_path", "get_predicates",
+           "get_control_dependencies", "get_path_dependencies",
+           "restrict_collection", "has_default_decision", "PathCoverage",
+           "replace_predicates", "PathIndex", "ViewIndex", "map_url_patterns")
+
+
+_LOGGER = getLogger(__name__)
+
+
+def get_acls(control):
+    """
+    Return the ACLs in the ``control`` collection, or ``None`` if ``control``
+    is not an ACL collection.
+    
+    """
+    return getattr(control, "_acls", None)
+
+
+def get_base_path(control):
+    """
+    Return the path under which ``control`` applies.
+    
+    ``None`` is returned if it's unknown, in which case it must be assumed
+    to apply anywhere.
+    
+    """
+    if get_acls(control) is not None:
+        return None
+    base_path = getattr(control, "_base_path", None)
+    if not isinstance(base_path, basestring):
+        return None
+    return base_path
+
+
+def get_predicates(control):
+    """
+    Return the predicates used in the access control entries of the
+    ``control`` ACL, or ``None`` if they cannot be found.
+    
+    Entries without a predicate are ignored.
+    
+    """
+    aces = getattr(control, "_aces", None)
+    if aces is None:
+        return None
+    
+    predicates = []
+    for ace in aces:
+        if not hasattr(ace, "predicate"):
+            return None
+        if ace.predicate is not None:
+            predicates.append(ace.predicate)
+    return predicates
+
+
+def get_control_dependencies(control):
+    """
+    Return the parts of the request the decisions made by ``control`` depend
+    on, apart from the path.
+    
+    :param control: An ACL or an ACL collection.
+    :rtype: :class:`frozenset`
+    
+    """
+    dependencies = set()
+    
+    acls = get_acls(control)
+    if acls is not None:
+        for acl in acls:
+            dependencies.update(get_control_dependencies(acl))
+        return frozenset(dependencies)
+    
+    predicates = get_predicates(control)
+    if predicates is None:
+        return frozenset([REQUEST])
+    for predicate in predicates:
+        dependencies.update(get_dependencies(predicate))
+    return frozenset(dependencies)
+
+
+def get_path_dependencies(collection, path):
+    """
+    Return the parts of the request the decisions made by the ACL
+    ``collection`` on ``path`` depend on, apart from the path itself.
+    
+    Only the ACLs which may apply to ``path`` are taken into account.
+    
+    """
+    acls = get_acls(collection)
+    if acls is None:
+        return get_control_dependencies(collection)
+    
+    dependencies = set()
+    for acl in acls:
+        base_path = get_base_path(acl)
+        if base_path is None or path.startswith(base_path):
+            dependencies.update(get_control_dependencies(acl))
+    return frozenset(dependencies)
+
+
+def replace_predicates(control, replace):
+    """
+    Replace the predicates used in ``control`` with the result of calling
+    ``replace`` with them.
+    
+    :param control: An ACL or an ACL collection.
+    :param replace: The callable which returns the new predicate.
+    
+    Entries which cannot be modified are left as is.
+    
+    """
+    acls = get_acls(control)
+    if acls is not None:
+        for acl in acls:
+            replace_predicates(acl, replace)
+        return
+    
+    for ace in getattr(control, "_aces", ()):
+        predicate = getattr(ace, "predicate", None)
+        if predicate is None:
+            continue
+        try:
+            ace.predicate = replace(predicate)
+        except AttributeError:
+            pass
+
+
+def restrict_collection(collection, acls):
+    """
+    Return a copy of the ACL ``collection`` which only contains ``acls``.
+    
+    The copy keeps the rest of the settings of the original collection (e.g.,
+    its default decision).
+    
+    """
+    restricted_collection = copy(collection)
+    restricted_collection._acls = list(acls)
+    return restricted_collection
+
+
+def has_default_decision(collection):
+    """
+    Report whether the ACL ``collection`` makes a decision when none of its
+    ACLs does.
+    
+    If that cannot be found out, it's assumed that it does.
+    
+    """
+    empty_collection = restrict_collection(collection, ())
+    try:
+        decision = empty_collection.decide_authorization({'PATH_INFO': "/"},
+                                                         None)
+    except Exception:
+        return True
+    return decision is not None
+
+
+class PathCoverage(object):
+    """
+    Report whether any ACL in a collection may apply to a given path.
+    
+    The base paths of the ACLs are computed once, but they are computed again
+    if ACLs are added to the collection.
+    
+    """
+    
+    def __init__(self, collection):
+        self.collection = collection
+        # The number of ACLs, whether the collection covers any path and the
+        # base paths of the ACLs, which are replaced at once so that other
+        # threads don't get inconsistent values:
+        self._coverage = (None, True, ())
+    
+    def __call__(self, path):
+        """Report whether an ACL may apply to ``path``."""
+        acls = get_acls(self.collection)
+        if acls is None:
+            return True
+        
+        (acl_count, covers_everything, base_paths) = self._coverage
+        if len(acls) != acl_count:
+            (acl_count, covers_everything, base_paths) = self._coverage = \
+                self._compute_coverage(acls)
+        
+        return covers_everything or path.startswith(base_paths)
+    
+    def _compute_coverage(self, acls):
+        base_paths = set([get_base_path(acl) for acl in acls])
+        covers_everything = (None in base_paths or
+                             has_default_decision(self.collection))
+        base_paths.discard(None)
+        return (len(acls), covers_everything, tuple(base_paths))
+
+
+class PathIndex(object):
+    """
+    Index of the ACLs in a collection by their base paths, so that the ACLs
+    which may apply to a path are found with a single traversal of a radix
+    tree instead of trying every ACL.
+    
+    The decisions are made by a copy of the collection which only contains
+    those ACLs, in their original order, so they are the same decisions the
+    whole collection would make.
+    
+    Like :class:`PathCoverage`, the index is built again if ACLs are added to
+    the collection.
+    
+    """
+    
+    def __init__(self, collection):
+        self.collection = collection
+        # The number of ACLs, the radix tree, the positions of the ACLs whose
+        # base path is unknown and the restricted collections built so far,
+        # which are replaced at once so that other threads don't get
+        # inconsistent values:
+        self._index = (None, None, (), {})
+    
+    def decide_authorization(self, environ, view):
+        """
+        Return the decision made by the collection on the request in
+        ``environ``.
+        
+        """
+        acls = get_acls(self.collection)
+        if acls is None:
+            return self.collection.decide_authorization(environ, view)
+        
+        (acl_count, tree, unknown_positions, collections) = self._index
+        if len(acls) != acl_count:
+            (acl_count, tree, unknown_positions, collections) = self._index = \
+                self._build_index(acls)
+        
+        positions = tree.find(environ['PATH_INFO'])
+        if unknown_positions:
+            positions = sorted(positions + list(unknown_positions))
+        else:
+            positions.sort()
+        positions = tuple(positions)
+        
+        restricted_collection = collections.get(positions)
+        if restricted_collection is None:
+            candidate_acls = [acls[position] for position in positions]
+            restricted_collection = restrict_collection(self.collection,
+                                                        candidate_acls)
+            collections[positions] = restricted_collection
+        
+        return restricted_collection.decide_authorization(environ, view)
+    
+    def _build_index(self, acls):
+        tree = _RadixNode()
+        unknown_positions = []
+        for (position, acl) in enumerate(acls):
+            base_path = get_base_path(acl)
+            if base_path is None:
+                unknown_positions.append(position)
+            else:
+                tree.insert(base_path, position)
+        return (len(acls), tree, tuple(unknown_positions), {})
+
+
+class ViewIndex(object):
+    """
+    Index of the ACLs in a collection by the views they may apply to.
+    
+    The views are found in the URL configuration: An ACL may apply to a view
+    if its base path and the literal prefix of a URL pattern the view is
+    mounted on are a prefix of one another. The views are indexed by the
+    callables in the URL patterns, which are the ones Django passes on to the
+    middleware, so views wrapped by decorators such as :func:`@require
+    <repoze.what.plugins.dj.require>` are found as is.
+    
+    The index is built on the first lookup, and again if ACLs are added to
+    the collection.
+    
+    """
+    
+    def __init__(self, collection, urlconf):
+        """
+        
+        :param collection: The ACL collection.
+        :param urlconf: The URL configuration module or its name.
+        
+        """
+        self.collection = collection
+        self.urlconf = urlconf
+        # The number of ACLs and the restricted collections by view, which
+        # are replaced at once so that other threads don't get inconsistent
+        # values:
+        self._index = (None, None)
+    
+    def get_collection(self, view):
+        """
+        Return a copy of the collection which only contains the ACLs which
+        may apply to ``view``, or ``None`` if ``view`` is not indexed.
+        
+        The copy makes the same decisions as the whole collection on the
+        paths where ``view`` is mounted.
+        
+        """
+        acls = get_acls(self.collection)
+        if acls is None:
+            return None
+        
+        (acl_count, collections_by_view) = self._index
+        if len(acls) != acl_count:
+            (acl_count, collections_by_view) = self._index = \
+                self._build_index(acls)
+        
+        if collections_by_view is None:
+            return None
+        try:
+            return collections_by_view.get(view)
+        except TypeError:
+            # The view is not hashable.
+            return None
+    
+    def _build_index(self, acls):
+        acl_base_paths = [get_base_path(acl) for acl in acls]
+        positions_by_view = {}
+        try:
+            for (view, path_prefix) in iter_views(self.urlconf):
+                try:
+                    positions = positions_by_view.setdefault(view, set())
+                except TypeError:
+                    # The view is not hashable, so it can't be looked up.
+                    continue
+                positions.update(_get_acl_positions(acl_base_paths,
+                                                    path_prefix))
+        except Exception, exc:
+            _LOGGER.warn("Views could not be indexed; authorization decisions "
+                         "will be made by path: %s", exc)
+            return (len(acls), None)
+        
+        # The views which may get the same ACLs share the same collection:
+        collections_by_positions = {}
+        collections_by_view = {}
+        for (view, positions) in positions_by_view.items():
+            positions = tuple(sorted(positions))
+            collection = collections_by_positions.get(positions)
+            if collection is None:
+                collection = restrict_collection(
+                    self.collection,
+                    [acls[position] for position in positions],
+                    )
+                collections_by_positions[positions] = collection
+            collections_by_view[view] = collection
+        
+        return (len(acls), collections_by_view)
+
+
+def map_url_patterns(collection, urlconf):
+    """
+    Return the ACLs in ``collection`` which may apply to each URL pattern in
+    ``urlconf``, as found by :class:`ViewIndex`.
+    
+    :param collection: The ACL collection.
+    :param urlconf: The URL configuration module or its name.
+    :return: The ``(regex, view, acls)`` triples for the URL patterns which
+        are mounted on a view, in the order Django tries them.
+    :raises Exception: Any exception raised by Django while importing the
+        URL patterns or the views.
+    
+    """
+    acls = get_acls(collection) or []
+    acl_base_paths = [get_base_path(acl) for acl in acls]
+    mapping = []
+    for (regex, view, path_prefix) in iter_url_patterns(urlconf):
+        positions = _get_acl_positions(acl_base_paths, path_prefix)
+        pattern_acls = [acls[position] for position in positions]
+        mapping.append((regex, view, pattern_acls))
+    return mapping
+
+
+def _get_acl_positions(acl_base_paths, path_prefix):
+    """
+    Return the positions of the ACLs which may apply to the paths starting
+    with ``path_prefix``.
+    
+    """
+    positions = []
+    for (position, base_path) in enumerate(acl_base_paths):
+        if (base_path is None or
+            base_path.startswith(path_prefix) or
+            path_prefix.startswith(base_path)):
+            positions.append(position)
+    return positions
+
+
+class _RadixNode(object):
+    """
+    Node in a radix tree of paths, whose edges are labeled with the longest
+    substrings shared by the paths below them.
+    
+    """
+    
+    __slots__ = ("values", "children")
+    
+    def __init__(self):
+        # The values of the paths which end in this node:
+        self.values = []
+        # The children, keyed by the first character of the edge label, along
+        # with the label:
+        self.children = {}
+    
+    def insert(self, path, value):
+        node = self
+        while path:
+            edge = node.children.get(path[0])
+            if edge is None:
+                child = _RadixNode()
+                node.children[path[0]] = (path, child)
+                node = child
+                break
+            
+            (label, child) = edge
+            common_length = _get_common_prefix_length(label, path)
+            if common_length < len(label):
+                # The edge must be split:
+                middle_node = _RadixNode()
+                middle_node.children[label[common_length]] = \
+                    (label[common_length:], child)
+                node.children[path[0]] = (label[:common_length], middle_node)
+                child = middle_node
+            node = child
+            path = path[common_length:]
+        node.values.append(value)
+    
+    def find(self, path):
+        """
+        Return the values of the paths which are a prefix of ``path``.
+        
+        """
+        values = list(self.values)
+        node = self
+        position = 0
+        path_length = len(path)
+        while position < path_length:
+            edge = node.children.get(path[position])
+            if edge is None:
+                break
+            (label, node) = edge
+            if not path.startswith(label, position):
+                break
+            position += len(label)
+            values.extend(node.values)
+        return values
+
+
+def _get_common_prefix_length(string1, string2):
+    length = min(len(string1), len(string2))
+    for index in xrange(length):
+        if string1[index] != string2[index]:
+            return index
+    return length
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2010, 2degrees Limited <gustavonarea@2degreesnetwork.com>.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the BSD-like license at
+# http://www.repoze.org/LICENSE.txt.  A copy of the license should accompany
+# this distribution.  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL
+# EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND
+# FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Discovery of the authorization controls of the Django applications.
+
+Every application in ``INSTALLED_APPS`` may have an ``authz`` module with a
+``control``, and finding out which ones do takes an import attempt for each
+application. The applications which are secured can be recorded in a
+manifest file, along with a hash of ``INSTALLED_APPS``, so that the following
+processes only import their ``authz`` modules. The other applications are
+only checked for an ``authz`` module in their own directory, and those which
+have one without a ``control`` are recorded along with the modification time
+of the module. The manifest is ignored and rewritten when it's stale.
+
+"""
+
+from hashlib import sha1
+import imp
+import json
+from logging import getLogger
+import os
+from tempfile import NamedTemporaryFile
+
+from django.utils.importlib import import_module
+
+__all__ = ("find_authz_controls", "load_authz_controls", "get_apps_hash",
+           "read_manifest", "write_manifest")
+
+
+_LOGGER = getLogger(__name__)
+
+
+def find_authz_controls(installed_apps):
+    """
+    Return the authorization control of each application in
+    ``installed_apps`` which has one.
+    
+    :param installed_apps: The names of the Django applications.
+    :return: The ``(app, control)`` pairs, in the order of
+        ``installed_apps``.
+    :rtype: :class:`list`
+    
+    """
+    authz_controls = []
+    for app in installed_apps:
+        control = _import_authz_control(app)
+        if control is not None:
+            authz_controls.append((app, control))
+    return authz_controls
+
+
+def load_authz_controls(manifest_path, installed_apps):
+    """
+    Return the authorization control of each application in
+    ``installed_apps`` which has one, only importing the ``authz`` modules of
+    the applications listed in the manifest at ``manifest_path``.
+    
+    :param manifest_path: The path to the manifest file.
+    :param installed_apps: The names of the Django applications.
+    :return: The ``(app, control)`` pairs, in the order of
+        ``installed_apps``.
+    :rtype: :class:`list`
+    
+    The manifest is stale if an application it lists as secured has no
+    authorization control, or if the ``authz`` module of another application
+    was added or modified since the manifest was written. If the manifest
+    doesn't exist, can't be read or is stale, every application is searched
+    and the manifest is written again.
+    
+    """
+    manifest = _read_manifest(manifest_path, installed_apps)
+    if manifest is not None:
+        (secured_apps, unsecured_authz_apps) = manifest
+        authz_controls = _load_listed_authz_controls(manifest_path,
+                                                     installed_apps,
+                                                     secured_apps,
+                                                     unsecured_authz_apps)
+        if authz_controls is not None:
+            return authz_controls
+    
+    authz_controls = find_authz_controls(installed_apps)
+    secured_apps = [app for (app, control) in authz_controls]
+    try:
+        write_manifest(manifest_path, installed_apps, secured_apps)
+    except (IOError, OSError), exc:
+        _LOGGER.warn("The authorization manifest could not be written to "
+                     "%s: %s", manifest_path, exc)
+    return authz_controls
+
+
+def get_apps_hash(installed_apps):
+    """
+    Return the hash of the names in ``installed_apps``, which identifies the
+    manifests written for them.
+    
+    """
+    return sha1("\n".join(installed_apps)).hexdigest()
+
+
+def read_manifest(manifest_path, installed_apps):
+    """
+    Return the secured applications listed in the manifest at
+    ``manifest_path``.
+    
+    :param manifest_path: The path to the manifest file.
+    :param installed_apps: The names of the Django applications.
+    :return: The names of the secured applications, or ``None`` if the
+        manifest doesn't exist, can't be read or was written for other
+        applications.
+    :rtype: :class:`list`
+    
+    """
+    manifest = _read_manifest(manifest_path, installed_apps)
+    if manifest is None:
+        return None
+    return manifest[0]
+
+
+def _read_manifest(manifest_path, installed_apps):
+    """
+    Return the secured applications and the modification times of the
+    ``authz`` modules of the unsecured applications listed in the manifest
+    at ``manifest_path``, or ``None`` if it can't be used.
+    
+    """
+    try:
+        manifest_file = open(manifest_path)
+        try:
+            manifest = json.load(manifest_file)
+        finally:
+            manifest_file.close()
+    except (IOError, OSError):
+        return None
+    except ValueError:
+        _LOGGER.warn("The authorization manifest at %s is corrupt",
+                     manifest_path)
+        return None
+    
+    if not isinstance(manifest, dict) or \
+       manifest.get("installed_apps_hash") != get_apps_hash(installed_apps):
+        _LOGGER.info("The authorization manifest at %s is stale",
+                     manifest_path)
+        return None
+    
+    secured_apps = manifest.get("secured_apps")
+    # The manifests written by previous versions don't have this item:
+    unsecured_authz_apps = manifest.get("unsecured_authz_apps", {})
+    if not isinstance(secured_apps, list) or \
+       not set(secured_apps).issubset(installed_apps) or \
+       not isinstance(unsecured_authz_apps, dict) or \
+       not set(unsecured_authz_apps).issubset(installed_apps):
+        _LOGGER.warn("The authorization manifest at %s is corrupt",
+                     manifest_path)
+        return None
+    
+    secured_apps = [str(app) for app in secured_apps]
+    unsecured_authz_apps = dict([(str(app), mtime) for (app, mtime) in
+                                 unsecured_authz_apps.items()])
+    return (secured_apps, unsecured_authz_apps)
+
+
+def write_manifest(manifest_path, installed_apps, secured_apps):
+    """
+    Record ``secured_apps`` as the applications with an authorization control
+    among ``installed_apps``.
+    
+    :param manifest_path: The path to the manifest file.
+    :param installed_apps: The names of the Django applications.
+    :param secured_apps: The names of the secured applications.
+    :raises IOError, OSError: If the manifest can't be written.
+    
+    The other applications which have an ``authz`` module are recorded along
+    with the modification time of the module, so that the manifest is known
+    to be stale when it changes.
+    
+    The manifest is written to a temporary file which then replaces the
+    previous manifest, so that processes starting at the same time never read
+    an incomplete manifest.
+    
+    """
+    unsecured_authz_apps = {}
+    for app in installed_apps:
+        if app not in secured_apps:
+            authz_module_mtime = _get_authz_module_mtime(app)
+            if authz_module_mtime is not None:
+                unsecured_authz_apps[app] = authz_module_mtime
+    
+    manifest = {
+        'installed_apps_hash': get_apps_hash(installed_apps),
+        'secured_apps': list(secured_apps),
+        'unsecured_authz_apps': unsecured_authz_apps,
+        }
+    manifest_directory = os.path.dirname(os.path.abspath(manifest_path))
+    manifest_file = NamedTemporaryFile(dir=manifest_directory, delete=False)
+    try:
+        try:
+            json.dump(manifest, manifest_file, indent=4)
+        finally:
+            manifest_file.close()
+        # Temporary files are only readable by their owner:
+        os.chmod(manifest_file.name, 0644)
+        os.rename(manifest_file.name, manifest_path)
+    except:
+        os.remove(manifest_file.name)
+        raise
+
+
+def _load_listed_authz_controls(manifest_path, installed_apps, secured_apps,
+                                unsecured_authz_apps):
+    """
+    Return the authorization controls of the ``secured_apps`` listed in the
+    manifest at ``manifest_path``, or ``None`` if the manifest is stale.
+    
+    """
+    authz_controls = []
+    for app in secured_apps:
+        control = _import_authz_control(app)
+        if control is None:
+            _LOGGER.warn("The authorization manifest at %s is stale: %s has "
+                         "no authorization control", manifest_path, app)
+            return None
+        authz_controls.append((app, control))
+    
+    for app in installed_apps:
+        if app in secured_apps:
+            continue
+        if _get_authz_module_mtime(app) != unsecured_authz_apps.get(app):
+            _LOGGER.warn("The authorization manifest at %s is stale: The "
+                         "authz module of %s was added or modified",
+                         manifest_path, app)
+            return None
+    
+    return authz_controls
+
+
+def _get_authz_module_mtime(app):
+    """
+    Return the modification time of the ``authz`` module of ``app``, or
+    ``None`` if there's none, without importing it.
+    
+    Only the directory of the application is searched, unlike a failed import
+    of the module.
+    
+    """
+    try:
+        app_package = import_module(app)
+    except ImportError:
+        return None
+    app_path = getattr(app_package, "__path__", None)
+    if app_path is None:
+        # The application is a module, so it can't contain other modules.
+        return None
+    
+    try:
+        (module_file, module_path, description) = imp.find_module("authz",
+                                                                  app_path)
+    except ImportError:
+        return None
+    if module_file is not None:
+        module_file.close()
+    
+    if description[2] == imp.PKG_DIRECTORY:
+        init_path = os.path.join(module_path, "__init__.py")
+        if os.path.exists(init_path):
+            module_path = init_path
+    return os.path.getmtime(module_path)
+
+
+def _import_authz_control(app):
+    """
+    Return the authorization control in the ``authz`` module of ``app``, or
+    ``None`` if there's none.
+    
+    """
+    try:
+        authz_module = import_module("%s.authz" % app)
+    except ImportError:
+        return None
+    return getattr(authz_module, "control", None)
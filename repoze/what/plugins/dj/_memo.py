@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2010, 2degrees Limited <gustavonarea@2degreesnetwork.com>.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the BSD-like license at
+# http://www.repoze.org/LICENSE.txt.  A copy of the license should accompany
+# this distribution.  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL
+# EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND
+# FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Memoization of the results of the predicates evaluated in a request.
+
+The same predicate is often evaluated several times in a request: By the ACLs
+on ingress, by :func:`@require <repoze.what.plugins.dj.require>` and then by
+the view and the templates. The results are stored in the WSGI environ, keyed
+by the predicate and the parts of the request it depends on, so that the
+predicate is evaluated once.
+
+Whole authorization decisions can be reused too, across requests, when they
+only depend on the credentials or the attributes of the user.
+
+"""
+
+from repoze.what.plugins.dj.predicates import (USERID, GROUPS, PERMISSIONS,
+    USER, REQUEST, VOLATILE)
+
+__all__ = ("get_memoized_result", "get_decision_dependencies",
+           "get_dependency_values", "UNCACHEABLE")
+
+
+#: The key in the WSGI environ for the results of the predicates.
+_RESULTS_KEY = "repoze.what.plugins.dj.predicate_results"
+
+#: The items in the WSGI environ which identify a (possibly forged) request.
+_REQUEST_KEYS = ("REQUEST_METHOD", "PATH_INFO", "QUERY_STRING")
+
+#: The dependencies of the decisions which can't be reused.
+UNCACHEABLE = object()
+
+
+def get_memoized_result(environ, predicate, dependencies, evaluate):
+    """
+    Return the result of ``predicate`` in the request, evaluating it with
+    ``evaluate`` if it's not known yet.
+    
+    :param environ: The WSGI environ.
+    :type environ: :class:`dict`
+    :param predicate: The predicate whose result is requested.
+    :param dependencies: The dependencies of ``predicate``.
+    :param evaluate: The callable which returns the result of ``predicate``,
+        without arguments.
+    :return: The result of ``predicate``.
+    
+    Results are not memoized if the predicate is :data:`VOLATILE`.
+    
+    """
+    if VOLATILE in dependencies:
+        return evaluate()
+    
+    results = environ.get(_RESULTS_KEY)
+    if results is None:
+        results = environ[_RESULTS_KEY] = {}
+    
+    try:
+        result_key = _make_result_key(environ, predicate, dependencies)
+        memoized_result = results.get(result_key)
+    except TypeError:
+        # The request can't be identified (e.g., the routing args are not
+        # hashable).
+        return evaluate()
+    
+    if memoized_result is None:
+        result = evaluate()
+        # The predicate is kept along with its result so that its id is not
+        # reused by another predicate during the request:
+        results[result_key] = (predicate, result)
+    else:
+        result = memoized_result[1]
+    return result
+
+
+def _make_result_key(environ, predicate, dependencies):
+    """
+    Return the key for the result of ``predicate`` in the request.
+    
+    Requests forged from this one (e.g., by
+    :func:`~repoze.what.plugins.dj.can_access`) may share the same results, so
+    the key includes the path of the request if the predicate depends on it.
+    
+    """
+    credentials = environ.get("repoze.what.credentials") or {}
+    result_key = (id(predicate), credentials.get(USERID))
+    if REQUEST in dependencies:
+        request_items = [environ.get(key) for key in _REQUEST_KEYS]
+        routing_args = environ.get("wsgiorg.routing_args")
+        if routing_args:
+            (positional_args, named_args) = routing_args
+            routing_args = (tuple(positional_args),
+                            frozenset(named_args.items()))
+        result_key += tuple(request_items) + (routing_args, )
+    return result_key
+
+
+#{ Decision caching
+
+
+def get_decision_dependencies(dependencies):
+    """
+    Return the ``dependencies`` of a decision in a predictable order, or
+    :data:`UNCACHEABLE` if the decision can't be reused.
+    
+    Decisions can be reused for the requests with the same values for their
+    dependencies if they only depend on the credentials or the attributes of
+    the user.
+    
+    """
+    for dependency in dependencies:
+        if dependency in (USERID, GROUPS, PERMISSIONS):
+            continue
+        if (not isinstance(dependency, basestring) or
+            not dependency.startswith(USER + ".")):
+            return UNCACHEABLE
+    return tuple(sorted(dependencies))
+
+
+def get_dependency_values(dependencies, request):
+    """Return the values of the ``dependencies`` in the ``request``."""
+    credentials = request.environ['repoze.what.credentials']
+    values = []
+    for dependency in dependencies:
+        if dependency == USERID:
+            value = credentials.get(USERID)
+        elif dependency in (GROUPS, PERMISSIONS):
+            names = credentials.get(dependency) or ()
+            # Bitsets are cheaper to hash and compare than sets of names:
+            value = getattr(names, "bits", None)
+            if value is None:
+                value = frozenset(names)
+        else:
+            attribute_name = dependency[len(USER) + 1:]
+            value = getattr(request.user, attribute_name, None)
+        values.append(value)
+    return tuple(values)
+
+
+#}
@@ -17,10 +17,16 @@ Internal utilities for the :mod:`repoze.what` Django plugin.
 
 """
 
+from collections import OrderedDict
+from threading import Lock
+from time import time
+
+from django.core.urlresolvers import RegexURLResolver
 from django.utils.importlib import import_module
 
 
-__all__ = ("resolve_object", )
+__all__ = ("resolve_object", "LRUCache", "get_literal_prefix", "iter_views",
+           "iter_url_patterns", "iter_view_defaults")
 
 
 def resolve_object(object_string):
@@ -50,3 +56,244 @@ def resolve_object(object_string):
                         (module_name, object_name))
     
     return getattr(module, object_name)
+
+
+class LRUCache(object):
+    """
+    Thread-safe mapping with a bounded size and optional expiration of its
+    items.
+    
+    When the cache is full, the least recently used item is evicted to make
+    room for the new one.
+    
+    The number of hits, misses and evictions is recorded in the ``hits``,
+    ``misses`` and ``evictions`` attributes, respectively.
+    
+    """
+    
+    _clock = staticmethod(time)
+    
+    def __init__(self, max_size, timeout=None):
+        """
+        
+        :param max_size: The maximum number of items in the cache.
+        :type max_size: :class:`int`
+        :param timeout: The number of seconds an item is valid for, if it
+            should expire at all.
+        :type timeout: :class:`int`
+        :raises ValueError: If ``max_size`` is not a positive number.
+        
+        """
+        if max_size < 1:
+            raise ValueError("The size of the cache must be a positive number")
+        self.max_size = max_size
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = Lock()
+    
+    def get(self, key, default=None):
+        """
+        Return the value for ``key`` if it's cached and hasn't expired, or
+        ``default`` otherwise.
+        
+        """
+        self._lock.acquire()
+        try:
+            try:
+                (value, expiration_time) = self._items.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            
+            if expiration_time is not None and expiration_time <= self._clock():
+                self.misses += 1
+                return default
+            
+            # Re-inserting the item makes it the most recently used one:
+            self._items[key] = (value, expiration_time)
+            self.hits += 1
+            return value
+        finally:
+            self._lock.release()
+    
+    def set(self, key, value):
+        """Cache ``value`` under ``key``, evicting another item if necessary."""
+        if self.timeout is None:
+            expiration_time = None
+        else:
+            expiration_time = self._clock() + self.timeout
+        
+        self._lock.acquire()
+        try:
+            self._items.pop(key, None)
+            while len(self._items) >= self.max_size:
+                self._items.popitem(last=False)
+                self.evictions += 1
+            self._items[key] = (value, expiration_time)
+        finally:
+            self._lock.release()
+    
+    def delete(self, key):
+        """Remove ``key`` from the cache, if it's there."""
+        self._lock.acquire()
+        try:
+            self._items.pop(key, None)
+        finally:
+            self._lock.release()
+    
+    def clear(self):
+        """Remove all the items in the cache."""
+        self._lock.acquire()
+        try:
+            self._items.clear()
+        finally:
+            self._lock.release()
+    
+    def __len__(self):
+        return len(self._items)
+
+
+#{ URL patterns
+
+
+#: The characters with a special meaning in regular expressions.
+_REGEX_METACHARACTERS = ".^$*+?{}[]()|"
+
+#: The quantifiers which make the preceding item optional.
+_OPTIONAL_QUANTIFIERS = ("?", "*", "{")
+
+
+def get_literal_prefix(regex):
+    """
+    Return the literal text at the start of every string matched by ``regex``.
+    
+    :param regex: The regular expression of a URL pattern.
+    :type regex: :class:`basestring`
+    :return: The literal prefix and whether ``regex`` only matches that text.
+    :rtype: :class:`tuple`
+    
+    The prefix is empty if ``regex`` is not anchored at the start, because
+    Django would then match it anywhere in the path.
+    
+    """
+    if not regex.startswith("^") or "|" in regex:
+        return ("", False)
+    
+    prefix = []
+    position = 1
+    regex_length = len(regex)
+    while position < regex_length:
+        char = regex[position]
+        if char == "\\":
+            char = regex[position + 1:position + 2]
+            if not char or char.isalnum():
+                # It's a character class (e.g., "\d") or a back-reference.
+                return ("".join(prefix), False)
+            position += 2
+        elif char in _REGEX_METACHARACTERS:
+            is_complete = char == "$" and position == regex_length - 1
+            return ("".join(prefix), is_complete)
+        else:
+            position += 1
+        
+        next_char = regex[position:position + 1]
+        if next_char in _OPTIONAL_QUANTIFIERS:
+            return ("".join(prefix), False)
+        prefix.append(char)
+        if next_char == "+":
+            return ("".join(prefix), False)
+    
+    return ("".join(prefix), True)
+
+
+def iter_views(urlconf):
+    """
+    Iterate over the views in ``urlconf`` and the literal prefix of the paths
+    they are mounted on.
+    
+    :param urlconf: The URL configuration module or its name.
+    :return: ``(view, path_prefix)`` pairs; a view will be found as many times
+        as it's mounted.
+    :raises Exception: Any exception raised by Django while importing the
+        URL patterns or the views.
+    
+    """
+    for (regex, view, path_prefix) in iter_url_patterns(urlconf):
+        yield (view, path_prefix)
+
+
+def iter_url_patterns(urlconf):
+    """
+    Iterate over the URL patterns in ``urlconf`` which are mounted on a view.
+    
+    :param urlconf: The URL configuration module or its name.
+    :return: ``(regex, view, path_prefix)`` triples, where ``regex`` is made
+        of the regular expressions of the pattern and the patterns which
+        include it.
+    :raises Exception: Any exception raised by Django while importing the
+        URL patterns or the views.
+    
+    """
+    resolver = RegexURLResolver(r"^/", urlconf)
+    return _iter_url_patterns(resolver, "", "", True)
+
+
+def _iter_url_patterns(pattern, regex, path_prefix, is_prefix_complete):
+    pattern_regex = pattern.regex.pattern
+    if regex:
+        # Django matches the included patterns against the rest of the path:
+        pattern_regex = pattern_regex.lstrip("^")
+    regex += pattern_regex
+    
+    if is_prefix_complete:
+        (pattern_prefix, is_prefix_complete) = \
+            get_literal_prefix(pattern.regex.pattern)
+        path_prefix += pattern_prefix
+    
+    if hasattr(pattern, "url_patterns"):
+        for subpattern in pattern.url_patterns:
+            subpatterns = _iter_url_patterns(subpattern, regex, path_prefix,
+                                             is_prefix_complete)
+            for subpattern_triple in subpatterns:
+                yield subpattern_triple
+    else:
+        yield (regex, pattern.callback, path_prefix)
+
+
+def iter_view_defaults(urlconf):
+    """
+    Iterate over the URL patterns in ``urlconf`` which are mounted on a view,
+    along with the default named arguments Django passes on to the view.
+    
+    :param urlconf: The URL configuration module or its name.
+    :return: ``(pattern, default_kwargs)`` pairs, where ``default_kwargs``
+        are the extra arguments of the pattern and the patterns which include
+        it.
+    :raises Exception: Any exception raised by Django while importing the
+        URL patterns or the views.
+    
+    """
+    resolver = RegexURLResolver(r"^/", urlconf)
+    return _iter_view_defaults(resolver, {})
+
+
+def _iter_view_defaults(pattern, default_kwargs):
+    if hasattr(pattern, "url_patterns"):
+        default_kwargs = dict(default_kwargs)
+        default_kwargs.update(pattern.default_kwargs)
+        for subpattern in pattern.url_patterns:
+            for subpattern_pair in _iter_view_defaults(subpattern,
+                                                       default_kwargs):
+                yield subpattern_pair
+    else:
+        # The extra arguments of the innermost pattern take precedence, as in
+        # Django's resolver:
+        default_kwargs = dict(default_kwargs)
+        default_kwargs.update(pattern.default_args)
+        yield (pattern, default_kwargs)
+
+
+#}
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2010, 2degrees Limited <gustavonarea@2degreesnetwork.com>.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the BSD-like license at
+# http://www.repoze.org/LICENSE.txt.  A copy of the license should accompany
+# this distribution.  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL
+# EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND
+# FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Caches for the groups and permissions of Django users.
+
+A credentials cache stores the group names and the permission names of a user,
+keyed by the user's id, and must provide the following methods:
+
+- ``load(user_id, loader)``, which returns the ``(groups, permissions)`` of
+  the user from the cache or, if they are not cached, it calls ``loader`` to
+  retrieve them and caches the result. The result must not be cached if the
+  credentials were invalidated while ``loader`` was running.
+- ``invalidate(user_id)``, to discard the credentials of one user.
+- ``clear()``, to discard the credentials of all the users.
+
+The group names and the permission names are cached as
+:class:`~repoze.what.plugins.dj.credentials.InternedSet` objects, so that
+their bitsets are only built once.
+
+"""
+
+from threading import Lock
+from time import time
+
+from django.core.cache import get_cache
+from django.db.models.signals import post_save, post_delete
+
+from repoze.what.plugins.dj.credentials import make_interned_set
+from repoze.what.plugins.dj._utils import LRUCache
+
+__all__ = ("LocalCredentialsCache", "SharedCredentialsCache",
+           "connect_invalidation_signals")
+
+
+class LocalCredentialsCache(object):
+    """
+    In-process credentials cache.
+    
+    The least recently used credentials are discarded when the cache is full,
+    and every entry expires after ``timeout`` seconds.
+    
+    It's safe to use it from multiple threads, but every process gets its own
+    copy of the cache.
+    
+    """
+    
+    def __init__(self, max_size=1000, timeout=300):
+        """
+        
+        :param max_size: The maximum number of users whose credentials may be
+            cached.
+        :type max_size: :class:`int`
+        :param timeout: The number of seconds the credentials are valid for.
+        :type timeout: :class:`int`
+        
+        """
+        self._cache = LRUCache(max_size, timeout)
+        # The number of invalidations so far, so we know whether the
+        # credentials changed while they were being loaded:
+        self._generation = 0
+        self._lock = Lock()
+    
+    @property
+    def hits(self):
+        """The number of times the credentials were found in the cache."""
+        return self._cache.hits
+    
+    @property
+    def misses(self):
+        """The number of times the credentials were not found in the cache."""
+        return self._cache.misses
+    
+    def get(self, user_id):
+        return self._cache.get(user_id)
+    
+    def set(self, user_id, groups, permissions):
+        self._cache.set(user_id, (make_interned_set(groups),
+                                  make_interned_set(permissions)))
+    
+    def load(self, user_id, loader):
+        credentials = self._cache.get(user_id)
+        if credentials is None:
+            generation = self._generation
+            (groups, permissions) = loader()
+            credentials = (make_interned_set(groups),
+                           make_interned_set(permissions))
+            self._lock.acquire()
+            try:
+                if generation == self._generation:
+                    self._cache.set(user_id, credentials)
+            finally:
+                self._lock.release()
+        return credentials
+    
+    def invalidate(self, user_id):
+        self._lock.acquire()
+        try:
+            self._generation += 1
+            self._cache.delete(user_id)
+        finally:
+            self._lock.release()
+    
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._generation += 1
+            self._cache.clear()
+        finally:
+            self._lock.release()
+
+
+class SharedCredentialsCache(object):
+    """
+    Credentials cache backed by Django's cache framework, so that it can be
+    shared by several processes.
+    
+    The credentials of every user are stored along with two generation
+    numbers: One for the user and one for all the users. Invalidating the
+    credentials increments the relevant generation, instead of deleting the
+    cached credentials, so that they can be validated with a single request to
+    the cache backend.
+    
+    """
+    
+    key_prefix = "repoze.what.credentials"
+    
+    def __init__(self, cache, timeout=300):
+        """
+        
+        :param cache: The Django cache object, or the name of the cache (or
+            the backend URI) to be passed to
+            :func:`django.core.cache.get_cache`.
+        :param timeout: The number of seconds the credentials are valid for.
+        :type timeout: :class:`int`
+        
+        """
+        if isinstance(cache, basestring):
+            cache = get_cache(cache)
+        self._cache = cache
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        self._global_generation_key = "%s.generation" % self.key_prefix
+    
+    def load(self, user_id, loader):
+        snapshot_key = "%s.%s" % (self.key_prefix, user_id)
+        generation_keys = (self._global_generation_key,
+                           "%s.generation.%s" % (self.key_prefix, user_id))
+        
+        cached_items = self._cache.get_many((snapshot_key, ) + generation_keys)
+        generations = self._get_generations(generation_keys, cached_items)
+        
+        snapshot = cached_items.get(snapshot_key)
+        if snapshot is not None and snapshot[0] == generations:
+            self._count_hit()
+            return snapshot[1]
+        
+        self._count_miss()
+        (groups, permissions) = loader()
+        credentials = (make_interned_set(groups),
+                       make_interned_set(permissions))
+        # If the credentials were invalidated in the mean time, the
+        # generations stored along with them won't be valid anymore:
+        self._cache.set(snapshot_key, (generations, credentials), self.timeout)
+        return credentials
+    
+    def invalidate(self, user_id):
+        self._increment_generation("%s.generation.%s" % (self.key_prefix,
+                                                         user_id))
+    
+    def clear(self):
+        self._increment_generation(self._global_generation_key)
+    
+    def _get_generations(self, generation_keys, cached_items):
+        """
+        Return the current generations in ``generation_keys``, initializing
+        the ones which are not set.
+        
+        """
+        missing_keys = [k for k in generation_keys if k not in cached_items]
+        if missing_keys:
+            for key in missing_keys:
+                self._cache.add(key, _new_generation(), _GENERATION_TIMEOUT)
+            # Another process may have initialized them first:
+            cached_items = dict(cached_items)
+            cached_items.update(self._cache.get_many(missing_keys))
+        return tuple([cached_items.get(k) for k in generation_keys])
+    
+    def _increment_generation(self, key):
+        try:
+            self._cache.incr(key)
+        except ValueError:
+            # The generation is not set, so it's initialized with a value
+            # which no existing snapshot could have been stored with.
+            self._cache.set(key, _new_generation(), _GENERATION_TIMEOUT)
+    
+    def _count_hit(self):
+        self._lock.acquire()
+        try:
+            self.hits += 1
+        finally:
+            self._lock.release()
+    
+    def _count_miss(self):
+        self._lock.acquire()
+        try:
+            self.misses += 1
+        finally:
+            self._lock.release()
+
+
+#: The number of seconds the generation numbers are kept (30 days, the longest
+#: relative timeout supported by memcached).
+_GENERATION_TIMEOUT = 60 * 60 * 24 * 30
+
+
+def _new_generation():
+    """
+    Return a generation number for a key which is not cached.
+    
+    Starting from zero would be unsafe: If the key is evicted from the cache,
+    the old snapshots could become valid again.
+    
+    """
+    return int(time() * 1000000)
+
+
+#{ Cache invalidation
+
+
+def connect_invalidation_signals(cache):
+    """
+    Discard the credentials in ``cache`` when the groups or permissions of the
+    users change.
+    
+    :param cache: The credentials cache.
+    
+    The credentials of a single user are discarded when the user is saved or
+    deleted, or when its groups or permissions are changed from either side of
+    the relationship. All the credentials are discarded when a group or a
+    permission is saved or deleted, or when the permissions of a group change.
+    
+    This requires Django 1.2 or later, which introduced the signals for the
+    changes in many-to-many relationships.
+    
+    """
+    # These are imported here so that the rest of the plugin can be used on
+    # Django 1.1, when no credentials cache is set:
+    from django.db.models.signals import m2m_changed
+    from django.contrib.auth.models import User, Group, Permission
+    
+    invalidator = _CacheInvalidator(cache)
+    dispatch_uid = "repoze.what.plugins.dj.cache-%s" % id(cache)
+    
+    for sender in (User.groups.through, User.user_permissions.through):
+        m2m_changed.connect(invalidator.user_relationship_changed, sender,
+                            weak=False, dispatch_uid=dispatch_uid)
+    m2m_changed.connect(invalidator.clear, Group.permissions.through,
+                        weak=False, dispatch_uid=dispatch_uid)
+    
+    for signal in (post_save, post_delete):
+        signal.connect(invalidator.user_changed, User, weak=False,
+                       dispatch_uid=dispatch_uid)
+        for sender in (Group, Permission):
+            signal.connect(invalidator.clear, sender, weak=False,
+                           dispatch_uid=dispatch_uid)
+
+
+class _CacheInvalidator(object):
+    """Signal handlers which discard the credentials in a cache."""
+    
+    def __init__(self, cache):
+        self.cache = cache
+    
+    def user_relationship_changed(self, instance, action, reverse, pk_set,
+                                  **kwargs):
+        if not action.startswith("post_"):
+            return
+        
+        if not reverse:
+            # The groups/permissions were changed from the user side.
+            self.cache.invalidate(instance.pk)
+        elif pk_set is None:
+            # All the users were removed from the group/permission, so we
+            # don't know which ones were affected.
+            self.cache.clear()
+        else:
+            for user_id in pk_set:
+                self.cache.invalidate(user_id)
+    
+    def user_changed(self, instance, **kwargs):
+        self.cache.invalidate(instance.pk)
+    
+    def clear(self, **kwargs):
+        self.cache.clear()
+
+
+#}
@@ -0,0 +1,504 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2010, 2degrees Limited <gustavonarea@2degreesnetwork.com>.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the BSD-like license at
+# http://www.repoze.org/LICENSE.txt.  A copy of the license should accompany
+# this distribution.  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL
+# EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND
+# FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Compilation of :mod:`repoze.what` predicates.
+
+Compound predicates (:class:`~repoze.what.predicates.All`,
+:class:`~repoze.what.predicates.Any` and :class:`~repoze.what.predicates.Not`,
+which are also the result of the ``&``, ``|`` and ``~`` operators) are
+evaluated by calling every predicate inside them recursively. Compiling a
+predicate turns it into a flat sequence of closures, where the predicates
+inside nested compound predicates of the same type are merged and the cheapest
+predicates are evaluated first, so that the expensive ones can be skipped.
+
+Predicates can also be compiled in adaptive mode, where the order of the
+predicates inside :class:`~repoze.what.predicates.All` and
+:class:`~repoze.what.predicates.Any` is updated periodically according to the
+rate at which each predicate is met and the time it takes to evaluate it.
+
+The built-in predicates which check the groups or the permissions of the user
+(e.g., :class:`~repoze.what.predicates.in_any_group`) are compiled into
+bitwise operations on the credentials, whose names are represented as
+bitsets by :class:`~repoze.what.plugins.dj.credentials.InternedSet`.
+
+"""
+
+from time import time
+
+from repoze.what import predicates as core_predicates
+from repoze.what.predicates import Predicate
+
+from repoze.what.plugins.dj.credentials import NAME_INTERNER
+from repoze.what.plugins.dj.predicates import (USERID, GROUPS, PERMISSIONS,
+    USER, get_dependencies, _get_sub_predicates, _COMPOUND_PREDICATES)
+from repoze.what.plugins.dj._memo import get_memoized_result
+
+__all__ = ("CompiledPredicate", "compile_predicate", "get_evaluation_cost",
+           "ATTRIBUTE_COST", "CREDENTIALS_COST", "DEFAULT_COST")
+
+
+#{ Evaluation costs
+
+
+ATTRIBUTE_COST = 1
+"""
+The cost of a predicate which reads an attribute of the user or the user id.
+
+"""
+
+CREDENTIALS_COST = 2
+"""
+The cost of a predicate which looks up the groups or the permissions of the
+user, which may have to be loaded.
+
+"""
+
+DEFAULT_COST = 10
+"""
+The cost of a predicate whose dependencies are unknown, which may run queries.
+
+"""
+
+
+def get_evaluation_cost(predicate):
+    """
+    Return the relative cost of evaluating ``predicate``.
+    
+    :param predicate: The :mod:`repoze.what` predicate.
+    :type predicate: :class:`repoze.what.predicates.Predicate`
+    :rtype: :class:`int`
+    
+    Predicates may declare their cost in the ``evaluation_cost`` attribute;
+    for example, predicates which run database queries could set it to a
+    number greater than :data:`DEFAULT_COST`. Otherwise, it's found from the
+    dependencies of the predicate, and the cost of a compound predicate is the
+    sum of the costs of the predicates inside it.
+    
+    """
+    cost = getattr(predicate, "evaluation_cost", None)
+    if cost is not None:
+        return cost
+    
+    if type(predicate) in _COMPOUND_PREDICATES:
+        sub_predicates = _get_sub_predicates(predicate)
+        return sum([get_evaluation_cost(p) for p in sub_predicates])
+    
+    cost = 0
+    for dependency in get_dependencies(predicate):
+        if dependency == USERID or dependency.startswith(USER + "."):
+            dependency_cost = ATTRIBUTE_COST
+        elif dependency in (GROUPS, PERMISSIONS):
+            dependency_cost = CREDENTIALS_COST
+        else:
+            dependency_cost = DEFAULT_COST
+        cost = max(cost, dependency_cost)
+    return cost
+
+
+#}
+
+
+class CompiledPredicate(Predicate):
+    """
+    Predicate which evaluates the compiled form of another predicate.
+    
+    It's met in the same requests as the original predicate, and it has the
+    same dependencies.
+    
+    Its result is reused if the original predicate is evaluated again in the
+    same request, with :func:`~repoze.what.plugins.dj.is_met` or another
+    compiled form of it.
+    
+    """
+    
+    def __init__(self, predicate, reordering_interval=None):
+        """
+        
+        :param predicate: The predicate to be compiled.
+        :type predicate: :class:`repoze.what.predicates.Predicate`
+        :param reordering_interval: The number of evaluations of each compound
+            predicate after which the predicates inside it are reordered, if
+            they should be reordered at all.
+        :type reordering_interval: :class:`int`
+        
+        """
+        super(CompiledPredicate, self).__init__()
+        self.predicate = predicate
+        self.environ_dependencies = get_dependencies(predicate)
+        self.evaluation_cost = get_evaluation_cost(predicate)
+        self._evaluate = _compile(predicate, reordering_interval)
+    
+    def check(self, request, credentials):
+        return get_memoized_result(
+            request.environ,
+            self.predicate,
+            self.environ_dependencies,
+            lambda: self._evaluate(request, credentials),
+            )
+    
+    def describe(self):
+        """
+        Return the current order of the predicates inside this one, along with
+        the statistics recorded in adaptive mode.
+        
+        :rtype: :class:`basestring`
+        
+        """
+        if hasattr(self._evaluate, "describe"):
+            lines = self._evaluate.describe()
+        else:
+            lines = [_describe_predicate(self.predicate)]
+        return "\n".join(lines)
+    
+    def __repr__(self):
+        return "<%s %r>" % (self.__class__.__name__, self.predicate)
+
+
+def compile_predicate(predicate, reordering_interval=None):
+    """
+    Return the compiled form of ``predicate``.
+    
+    :param predicate: The :mod:`repoze.what` predicate.
+    :type predicate: :class:`repoze.what.predicates.Predicate`
+    :param reordering_interval: The number of evaluations of each compound
+        predicate after which the predicates inside it are reordered, if they
+        should be reordered at all (i.e., adaptive mode).
+    :type reordering_interval: :class:`int`
+    :rtype: :class:`CompiledPredicate`
+    
+    Predicates which are already compiled are returned as is.
+    
+    In adaptive mode, the number of times each predicate inside a compound
+    predicate is met and the time it takes to evaluate it are recorded, and
+    every ``reordering_interval`` evaluations the predicates are sorted so
+    that the expected cost of evaluating the compound predicate is the
+    lowest. The statistics are updated without locks, so they are approximate
+    when several threads evaluate the same predicate, but the order is always
+    replaced at once.
+    
+    """
+    if isinstance(predicate, CompiledPredicate):
+        return predicate
+    return CompiledPredicate(predicate, reordering_interval)
+
+
+#{ Internal stuff
+
+
+_ALL = getattr(core_predicates, "All", None)
+
+_ANY = getattr(core_predicates, "Any", None)
+
+_NOT = getattr(core_predicates, "Not", None)
+
+
+def _get_membership_predicates():
+    """
+    Return the item in the credentials checked by the built-in predicates on
+    groups and permissions, and whether all the names are required, by
+    predicate class.
+    
+    """
+    membership_predicates = {}
+    for (class_name, credentials_key, require_all) in (
+        ("in_group", GROUPS, True),
+        ("in_all_groups", GROUPS, True),
+        ("in_any_group", GROUPS, False),
+        ("has_permission", PERMISSIONS, True),
+        ("has_all_permissions", PERMISSIONS, True),
+        ("has_any_permission", PERMISSIONS, False),
+        ):
+        predicate_class = getattr(core_predicates, class_name, None)
+        if predicate_class is not None:
+            membership_predicates[predicate_class] = (credentials_key,
+                                                      require_all)
+    return membership_predicates
+
+
+_MEMBERSHIP_PREDICATES = _get_membership_predicates()
+
+
+def _compile(predicate, reordering_interval=None):
+    """
+    Return the function which evaluates ``predicate``, given the request and
+    the credentials.
+    
+    """
+    predicate_class = type(predicate)
+    
+    if isinstance(predicate, CompiledPredicate):
+        return predicate._evaluate
+    
+    if predicate_class is _NOT:
+        evaluate = _compile(predicate.predicate, reordering_interval)
+        if reordering_interval:
+            return _Negation(predicate.predicate, evaluate)
+        return lambda request, credentials: not evaluate(request, credentials)
+    
+    if predicate_class in _MEMBERSHIP_PREDICATES:
+        names = _get_member_names(predicate)
+        if names is not None:
+            (credentials_key, require_all) = \
+                _MEMBERSHIP_PREDICATES[predicate_class]
+            return _compile_membership(credentials_key, names, require_all)
+    
+    if predicate_class not in (_ALL, _ANY):
+        return predicate.check
+    
+    sub_predicates = _flatten(predicate_class, predicate.predicates)
+    # The sort is stable, so predicates with the same cost keep their order:
+    sub_predicates.sort(key=get_evaluation_cost)
+    evaluators = tuple([_compile(p, reordering_interval)
+                        for p in sub_predicates])
+    
+    if reordering_interval:
+        return _AdaptiveBranches(predicate_class is _ALL, sub_predicates,
+                                 evaluators, reordering_interval)
+    
+    if predicate_class is _ALL:
+        def evaluate(request, credentials):
+            for evaluate_sub_predicate in evaluators:
+                if not evaluate_sub_predicate(request, credentials):
+                    return False
+            return True
+    else:
+        def evaluate(request, credentials):
+            for evaluate_sub_predicate in evaluators:
+                if evaluate_sub_predicate(request, credentials):
+                    return True
+            return False
+    
+    return evaluate
+
+
+def _compile_membership(credentials_key, names, require_all):
+    """
+    Return the function which checks that all or any of ``names`` are in the
+    ``credentials_key`` item of the credentials.
+    
+    The check is a bitwise operation if the names in the credentials can be
+    represented as a bitset.
+    
+    """
+    names = frozenset(names)
+    mask = NAME_INTERNER.get_mask(names)
+    
+    def evaluate(request, credentials):
+        credential_names = credentials.get(credentials_key) or ()
+        bits = getattr(credential_names, "bits", None)
+        if bits is None:
+            if require_all:
+                return names.issubset(credential_names)
+            return not names.isdisjoint(credential_names)
+        if require_all:
+            return bits & mask == mask
+        return bits & mask != 0
+    
+    return evaluate
+
+
+def _get_member_names(predicate):
+    """
+    Return the group or permission names required by the built-in
+    ``predicate``, or ``None`` if they can't be found.
+    
+    """
+    if hasattr(predicate, "predicates"):
+        names = []
+        for sub_predicate in predicate.predicates:
+            sub_predicate_names = _get_member_names(sub_predicate)
+            if sub_predicate_names is None:
+                return None
+            names.extend(sub_predicate_names)
+        return names
+    
+    for attribute_name in ("group_name", "permission_name"):
+        if hasattr(predicate, attribute_name):
+            return [getattr(predicate, attribute_name)]
+    return None
+
+
+def _flatten(predicate_class, predicates):
+    """
+    Return ``predicates``, replacing the predicates of ``predicate_class``
+    with the predicates inside them.
+    
+    """
+    flat_predicates = []
+    for predicate in predicates:
+        if type(predicate) is predicate_class:
+            flat_predicates.extend(_flatten(predicate_class,
+                                            predicate.predicates))
+        else:
+            flat_predicates.append(predicate)
+    return flat_predicates
+
+
+class _AdaptiveBranches(object):
+    """
+    Evaluator of the predicates inside :class:`~repoze.what.predicates.All`
+    or :class:`~repoze.what.predicates.Any` which reorders them according to
+    their outcomes and evaluation times.
+    
+    """
+    
+    _clock = staticmethod(time)
+    
+    def __init__(self, require_all, predicates, evaluators,
+                 reordering_interval):
+        self.require_all = require_all
+        self.reordering_interval = reordering_interval
+        self.evaluations = 0
+        # The branches are replaced at once when they are reordered, so that
+        # other threads can keep iterating over the previous ones:
+        self.branches = tuple([_Branch(p, e) for (p, e) in
+                               zip(predicates, evaluators)])
+    
+    def __call__(self, request, credentials):
+        # "All" stops at the first unmet predicate and "Any" at the first met
+        # one:
+        decisive_outcome = not self.require_all
+        result = self.require_all
+        for branch in self.branches:
+            start_time = self._clock()
+            outcome = bool(branch.evaluate(request, credentials))
+            branch.record(outcome, self._clock() - start_time)
+            if outcome == decisive_outcome:
+                result = outcome
+                break
+        
+        self.evaluations += 1
+        if not self.evaluations % self.reordering_interval:
+            self.reorder()
+        return result
+    
+    def reorder(self):
+        """
+        Sort the branches by their expected cost and reduce the weight of the
+        statistics recorded so far, so that the order adapts to changes.
+        
+        """
+        branches = sorted(self.branches, key=self._get_expected_cost)
+        for branch in branches:
+            branch.decay()
+        self.branches = tuple(branches)
+    
+    def _get_expected_cost(self, branch):
+        """
+        Return the average time spent on ``branch`` for every time it stops
+        the evaluation.
+        
+        Branches which have not been evaluated come first, so that their
+        statistics can be recorded.
+        
+        """
+        if not branch.evaluations:
+            return 0.0
+        average_time = branch.total_time / branch.evaluations
+        success_rate = (branch.successes + 1.0) / (branch.evaluations + 2.0)
+        if self.require_all:
+            decisive_rate = 1.0 - success_rate
+        else:
+            decisive_rate = success_rate
+        return average_time / decisive_rate
+    
+    def describe(self, indentation=""):
+        if self.require_all:
+            predicate_type = "All"
+        else:
+            predicate_type = "Any"
+        lines = ["%s%s (%s evaluations)" % (indentation, predicate_type,
+                                            self.evaluations)]
+        for branch in self.branches:
+            lines.append("%s  - %s" % (indentation, branch.describe()))
+            if hasattr(branch.evaluate, "describe"):
+                lines.extend(branch.evaluate.describe(indentation + "    "))
+        return lines
+
+
+class _Branch(object):
+    """A predicate inside a compound predicate, with its statistics."""
+    
+    __slots__ = ("predicate", "evaluate", "evaluations", "successes",
+                 "total_time")
+    
+    def __init__(self, predicate, evaluate):
+        self.predicate = predicate
+        self.evaluate = evaluate
+        self.evaluations = 0
+        self.successes = 0
+        self.total_time = 0.0
+    
+    def record(self, outcome, evaluation_time):
+        self.evaluations += 1
+        if outcome:
+            self.successes += 1
+        self.total_time += evaluation_time
+    
+    def decay(self):
+        self.evaluations /= 2.0
+        self.successes /= 2.0
+        self.total_time /= 2.0
+    
+    def describe(self):
+        if self.evaluations:
+            success_rate = self.successes * 100.0 / self.evaluations
+            average_time = self.total_time * 1000.0 / self.evaluations
+            statistics = "met %.1f%%, %.3f ms" % (success_rate, average_time)
+        else:
+            statistics = "not evaluated"
+        return "%s: %s" % (_describe_predicate(self.predicate), statistics)
+
+
+class _Negation(object):
+    """Evaluator of :class:`~repoze.what.predicates.Not` in adaptive mode."""
+    
+    def __init__(self, predicate, evaluate):
+        self.predicate = predicate
+        self.evaluate = evaluate
+    
+    def __call__(self, request, credentials):
+        return not self.evaluate(request, credentials)
+    
+    def describe(self, indentation=""):
+        lines = ["%sNot" % indentation]
+        if hasattr(self.evaluate, "describe"):
+            lines.extend(self.evaluate.describe(indentation + "  "))
+        else:
+            lines.append("%s  %s" % (indentation,
+                                     _describe_predicate(self.predicate)))
+        return lines
+
+
+def _describe_predicate(predicate):
+    """
+    Return the name of the class of ``predicate`` along with its public
+    attributes.
+    
+    """
+    attributes = []
+    for (name, value) in sorted(getattr(predicate, "__dict__", {}).items()):
+        if name.startswith("_"):
+            continue
+        if isinstance(value, (tuple, list)):
+            is_simple_value = all([isinstance(v, basestring) for v in value])
+        else:
+            is_simple_value = isinstance(value, (basestring, int))
+        if is_simple_value:
+            attributes.append("%s=%r" % (name, value))
+    return "%s(%s)" % (predicate.__class__.__name__, ", ".join(attributes))
+
+
+#}
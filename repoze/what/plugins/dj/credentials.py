@@ -0,0 +1,471 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2010, 2degrees Limited <gustavonarea@2degreesnetwork.com>.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the BSD-like license at
+# http://www.repoze.org/LICENSE.txt.  A copy of the license should accompany
+# this distribution.  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL
+# EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND
+# FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+:mod:`repoze.what` credentials for Django users.
+
+"""
+
+from collections import Mapping, Set
+from threading import Lock
+
+from django.db.models import Q
+
+__all__ = ("NameInterner", "NAME_INTERNER", "InternedSet", "make_interned_set",
+           "LazyCredentialSet", "FrozenCredentials", "make_lazy_credentials",
+           "BaseCredentialsLoader", "BackendCredentialsLoader",
+           "ORMCredentialsLoader")
+
+
+#{ Interned names
+
+
+class NameInterner(object):
+    """
+    Registry of the small integers which stand for group and permission names.
+    
+    Each name gets the next integer the first time it's seen, and keeps it for
+    the life of the process, so that sets of names can be represented as
+    bitsets where the bit at that position is set for each name.
+    
+    """
+    
+    def __init__(self):
+        self._indexes = {}
+        self._lock = Lock()
+    
+    def __len__(self):
+        return len(self._indexes)
+    
+    def get_index(self, name):
+        """Return the integer which stands for ``name``."""
+        index = self._indexes.get(name)
+        if index is None:
+            self._lock.acquire()
+            try:
+                index = self._indexes.setdefault(name, len(self._indexes))
+            finally:
+                self._lock.release()
+        return index
+    
+    def get_mask(self, names):
+        """
+        Return the bitset which represents ``names``.
+        
+        :rtype: :class:`int` or :class:`long`
+        
+        """
+        indexes = [self.get_index(name) for name in names]
+        if not indexes:
+            return 0
+        # Building the binary representation is linear, unlike setting the
+        # bits one by one on a long integer:
+        digits = ["0"] * (max(indexes) + 1)
+        for index in indexes:
+            digits[-1 - index] = "1"
+        return int("".join(digits), 2)
+
+
+NAME_INTERNER = NameInterner()
+"""The interner shared by all the group and permission names."""
+
+
+class InternedSet(frozenset):
+    """
+    Frozen set of group or permission names which can also be represented as
+    a bitset.
+    
+    The bitset is only built when it's first needed, with
+    :data:`NAME_INTERNER`, and then it's kept along with the set. So the same
+    instance should be reused as long as the names don't change (e.g., by
+    caching it), so that membership tests on several names become bitwise
+    operations.
+    
+    """
+    
+    __slots__ = ("_bits", )
+    
+    @property
+    def bits(self):
+        """The bitset which represents the names in the set."""
+        bits = getattr(self, "_bits", None)
+        if bits is None:
+            bits = self._bits = NAME_INTERNER.get_mask(self)
+        return bits
+
+
+def make_interned_set(names):
+    """
+    Return ``names`` as an :class:`InternedSet`, or as is if they already are.
+    
+    """
+    if type(names) is InternedSet:
+        return names
+    return InternedSet(names)
+
+
+#}
+
+
+class LazyCredentialSet(Set):
+    """
+    Immutable set whose items are only loaded when they are first needed.
+    
+    The groups and the permissions of a Django user live in the database, but
+    most requests won't evaluate any predicate which reads them, so there's no
+    point in retrieving them upfront.
+    
+    Instances behave like :class:`frozenset` objects: They support membership
+    tests, iteration, comparisons with other sets and the usual set
+    operations.
+    
+    """
+    
+    def __init__(self, loader):
+        """
+        
+        :param loader: The callable which returns the items in the set; it
+            will be called once at most, without arguments.
+        
+        """
+        self._loader = loader
+        self._items = None
+    
+    @property
+    def loaded(self):
+        """Whether the items in the set have been retrieved."""
+        return self._items is not None
+    
+    @property
+    def bits(self):
+        """
+        The bitset which represents the items in the set (see
+        :class:`InternedSet`).
+        
+        """
+        return self._get_items().bits
+    
+    def _get_items(self):
+        if self._items is None:
+            self._items = make_interned_set(self._loader())
+            # The loader is no longer needed, so let's not keep a reference to
+            # the objects it may be bound to (e.g., the user):
+            self._loader = None
+        return self._items
+    
+    @classmethod
+    def _from_iterable(cls, iterable):
+        # Set operations (e.g., "&", "|") must return regular frozen sets.
+        return frozenset(iterable)
+    
+    def __contains__(self, item):
+        return item in self._get_items()
+    
+    def __iter__(self):
+        return iter(self._get_items())
+    
+    def __len__(self):
+        return len(self._get_items())
+    
+    def __hash__(self):
+        return hash(self._get_items())
+    
+    def __repr__(self):
+        if self.loaded:
+            items = sorted(self._items)
+        else:
+            items = "not loaded"
+        return "<%s %r>" % (self.__class__.__name__, items)
+    
+    #{ Methods from the built-in set API, which predicates may use
+    
+    def issubset(self, other):
+        return self._get_items().issubset(other)
+    
+    def issuperset(self, other):
+        return self._get_items().issuperset(other)
+    
+    def union(self, *others):
+        return self._get_items().union(*others)
+    
+    def intersection(self, *others):
+        return self._get_items().intersection(*others)
+    
+    def difference(self, *others):
+        return self._get_items().difference(*others)
+    
+    def symmetric_difference(self, other):
+        return self._get_items().symmetric_difference(other)
+    
+    def copy(self):
+        return self._get_items()
+    
+    #}
+
+
+class FrozenCredentials(object):
+    """
+    Read-only :mod:`repoze.what` credentials dictionary.
+    
+    Because they cannot be modified, the same credentials can be shared by
+    several requests (e.g., those made by anonymous users) and they can be
+    used as cache keys.
+    
+    The user id, the groups and the permissions are kept in slots instead of a
+    dictionary, so the credentials of each request take less memory. Instances
+    behave like read-only :class:`dict` objects otherwise.
+    
+    """
+    
+    __slots__ = ("_userid", "_groups", "_permissions", "_extra_items", "user")
+    
+    def __init__(self, credentials, user=None, **items):
+        """
+        
+        :param credentials: The items in the credentials.
+        :type credentials: :class:`dict`
+        :param user: The Django user the credentials belong to, if any; it's
+            not one of the items.
+        :param items: Items which take precedence over those in
+            ``credentials``.
+        
+        """
+        set_attribute = super(FrozenCredentials, self).__setattr__
+        for (key, slot_name) in _CREDENTIALS_SLOTS:
+            set_attribute(slot_name, _MISSING)
+        set_attribute("_extra_items", None)
+        set_attribute("user", user)
+        
+        for item_source in (credentials, items):
+            for (key, value) in item_source.items():
+                slot_name = _CREDENTIALS_SLOT_NAMES.get(key)
+                if slot_name:
+                    set_attribute(slot_name, value)
+                else:
+                    if self._extra_items is None:
+                        set_attribute("_extra_items", {})
+                    self._extra_items[key] = value
+    
+    def __getitem__(self, key):
+        slot_name = _CREDENTIALS_SLOT_NAMES.get(key)
+        if slot_name is None:
+            if self._extra_items is None:
+                raise KeyError(key)
+            return self._extra_items[key]
+        
+        value = getattr(self, slot_name)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+    
+    def __setitem__(self, key, value):
+        raise TypeError("The credentials cannot be modified")
+    
+    def __delitem__(self, key):
+        raise TypeError("The credentials cannot be modified")
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("The credentials cannot be modified")
+    
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+    
+    def __iter__(self):
+        for (key, slot_name) in _CREDENTIALS_SLOTS:
+            if getattr(self, slot_name) is not _MISSING:
+                yield key
+        if self._extra_items is not None:
+            for key in self._extra_items:
+                yield key
+    
+    def __len__(self):
+        return len([key for key in self])
+    
+    def __eq__(self, other):
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+    
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+    
+    def __hash__(self):
+        return hash(frozenset(self.items()))
+    
+    def __repr__(self):
+        return "<%s %r>" % (self.__class__.__name__, self.copy())
+    
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+    
+    def keys(self):
+        return [key for key in self]
+    
+    def values(self):
+        return [self[key] for key in self]
+    
+    def items(self):
+        return [(key, self[key]) for key in self]
+    
+    def iterkeys(self):
+        return iter(self)
+    
+    def itervalues(self):
+        for key in self:
+            yield self[key]
+    
+    def iteritems(self):
+        for key in self:
+            yield (key, self[key])
+    
+    def copy(self):
+        """Return a regular, mutable copy of the credentials."""
+        return dict(self.items())
+
+
+Mapping.register(FrozenCredentials)
+
+
+_CREDENTIALS_SLOTS = (
+    ("repoze.what.userid", "_userid"),
+    ("groups", "_groups"),
+    ("permissions", "_permissions"),
+    )
+
+_CREDENTIALS_SLOT_NAMES = dict(_CREDENTIALS_SLOTS)
+
+_MISSING = object()
+
+
+def make_lazy_credentials(loader):
+    """
+    Return the groups and permissions returned by ``loader`` as
+    :class:`LazyCredentialSet` objects.
+    
+    :param loader: The callable which returns the groups and the permissions
+        as a ``(groups, permissions)`` tuple.
+    :return: The groups and the permissions.
+    :rtype: :class:`tuple`
+    
+    ``loader`` will be called once at most, when either set is accessed for
+    the first time.
+    
+    """
+    snapshot = []
+    
+    def load(index):
+        if not snapshot:
+            snapshot.extend(loader())
+        return snapshot[index]
+    
+    groups = LazyCredentialSet(lambda: load(0))
+    permissions = LazyCredentialSet(lambda: load(1))
+    return (groups, permissions)
+
+
+#{ Loaders
+
+
+class BaseCredentialsLoader(object):
+    """
+    Base class for the objects which retrieve the groups and permissions of
+    authenticated users.
+    
+    The loader to be used by the middleware can be set in the
+    ``CREDENTIALS_LOADER`` setting, so you can write one which takes advantage
+    of your custom user model or your database.
+    
+    """
+    
+    def load(self, user):
+        """
+        Return the groups and permissions of ``user``.
+        
+        :param user: The authenticated Django user.
+        :return: The group names and the permission names (in the
+            ``"app_label.codename"`` format) as a ``(groups, permissions)``
+            tuple.
+        :rtype: :class:`tuple`
+        
+        """
+        raise NotImplementedError
+    
+    def __call__(self, user):
+        return self.load(user)
+
+
+class BackendCredentialsLoader(BaseCredentialsLoader):
+    """
+    Load the groups of the user from its model and the permissions from the
+    authentication backends.
+    
+    This is the default loader because it takes custom authentication backends
+    into account, but it may run several queries per user.
+    
+    """
+    
+    def load(self, user):
+        return (get_group_names(user), user.get_all_permissions())
+
+
+class ORMCredentialsLoader(BaseCredentialsLoader):
+    """
+    Load the groups and permissions of the user straight from the database,
+    with two queries.
+    
+    The first query retrieves the groups of the user and the second one
+    retrieves the permissions assigned to the user or its groups, along with
+    the label of their application.
+    
+    This loader reads the same tables as Django's ``ModelBackend``, so it must
+    not be used along with authentication backends which grant other
+    permissions.
+    
+    """
+    
+    def load(self, user):
+        from django.contrib.auth.models import Group, Permission
+        
+        groups = Group.objects.filter(user__pk=user.pk)
+        groups = list(groups.values_list("pk", "name"))
+        group_ids = [group_id for (group_id, group_name) in groups]
+        group_names = [group_name for (group_id, group_name) in groups]
+        
+        permission_filter = Q(user__pk=user.pk)
+        if group_ids:
+            permission_filter |= Q(group__pk__in=group_ids)
+        permissions = Permission.objects.filter(permission_filter).distinct()
+        permissions = permissions.values_list("content_type__app_label",
+                                              "codename")
+        permission_names = ["%s.%s" % permission for permission in permissions]
+        
+        return (group_names, permission_names)
+
+
+def get_group_names(user):
+    """Return the names of the groups ``user`` belongs to."""
+    return [group.name for group in user.groups.all()]
+
+
+#}
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2010, 2degrees Limited <gustavonarea@2degreesnetwork.com>.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the BSD-like license at
+# http://www.repoze.org/LICENSE.txt.  A copy of the license should accompany
+# this distribution.  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL
+# EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND
+# FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Management command to write the manifest of the secured applications.
+
+"""
+
+from django.conf import settings
+from django.core.management.base import CommandError, NoArgsCommand
+
+from repoze.what.plugins.dj._manifest import (find_authz_controls,
+    write_manifest)
+
+__all__ = ("Command", )
+
+
+class Command(NoArgsCommand):
+    """
+    Write the applications in ``INSTALLED_APPS`` which have an authorization
+    control to the manifest set in the ``AUTHZ_MANIFEST`` setting.
+    
+    """
+    
+    help = ("Write the applications which have an authorization control to "
+            "the manifest set in AUTHZ_MANIFEST.")
+    
+    def handle_noargs(self, **options):
+        manifest_path = getattr(settings, "AUTHZ_MANIFEST", None)
+        if not manifest_path:
+            raise CommandError("The AUTHZ_MANIFEST setting is not defined")
+        
+        authz_controls = find_authz_controls(settings.INSTALLED_APPS)
+        secured_apps = [app for (app, control) in authz_controls]
+        try:
+            write_manifest(manifest_path, settings.INSTALLED_APPS,
+                           secured_apps)
+        except (IOError, OSError), exc:
+            raise CommandError("The manifest could not be written to %s: %s" %
+                               (manifest_path, exc))
+        
+        return "Secured applications written to %s: %s\n" % (
+            manifest_path, ", ".join(secured_apps) or "None")
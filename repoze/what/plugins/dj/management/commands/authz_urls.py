@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2010, 2degrees Limited <gustavonarea@2degreesnetwork.com>.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the BSD-like license at
+# http://www.repoze.org/LICENSE.txt.  A copy of the license should accompany
+# this distribution.  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL
+# EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND
+# FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Management command to display the ACLs which may apply to each URL pattern.
+
+"""
+
+from django.conf import settings
+from django.core.management.base import NoArgsCommand
+
+from repoze.what.plugins.dj.middleware import RepozeWhatMiddleware
+from repoze.what.plugins.dj._acls import (get_acls, get_base_path,
+    map_url_patterns)
+
+__all__ = ("Command", "describe_url_mapping")
+
+
+class Command(NoArgsCommand):
+    """
+    Display the ACLs in the global ACL collection which may apply to each URL
+    pattern in ``ROOT_URLCONF``, followed by the ACLs which apply to none.
+    
+    """
+    
+    help = ("Display the ACLs which may apply to each URL pattern and the "
+            "ACLs which are unreachable.")
+    
+    def handle_noargs(self, **options):
+        acl_collection = RepozeWhatMiddleware().acl_collection
+        return describe_url_mapping(acl_collection, settings.ROOT_URLCONF)
+
+
+def describe_url_mapping(collection, urlconf):
+    """
+    Describe the ACLs in ``collection`` which may apply to each URL pattern
+    in ``urlconf``.
+    
+    :param collection: The ACL collection.
+    :param urlconf: The URL configuration module or its name.
+    :return: The description.
+    :rtype: :class:`basestring`
+    
+    The ACLs whose base path is not covered by any URL pattern are listed
+    at the end, as they can't make any authorization decision.
+    
+    """
+    lines = []
+    reachable_acl_ids = set()
+    for (regex, view, acls) in map_url_patterns(collection, urlconf):
+        lines.append("%s (%s):" % (regex, _get_view_name(view)))
+        for acl in acls:
+            lines.append("    %s" % _get_acl_name(acl))
+            reachable_acl_ids.add(id(acl))
+        if not acls:
+            lines.append("    No ACL applies")
+    
+    unreachable_acls = [acl for acl in get_acls(collection) or []
+                        if id(acl) not in reachable_acl_ids]
+    if unreachable_acls:
+        lines.append("")
+        lines.append("Unreachable ACLs:")
+        for acl in unreachable_acls:
+            lines.append("    %s" % _get_acl_name(acl))
+    
+    return "\n".join(lines) + "\n"
+
+
+def _get_view_name(view):
+    view_name = getattr(view, "__name__", None)
+    if view_name is None:
+        return repr(view)
+    return "%s.%s" % (getattr(view, "__module__", None), view_name)
+
+
+def _get_acl_name(acl):
+    return "ACL at %s" % (get_base_path(acl) or "(unknown base path)")
@@ -19,22 +19,43 @@ Django middleware for :mod:`repoze.what`.
 """
 
 from logging import getLogger
+import re
 
 from django.conf import settings
-from django.utils.importlib import import_module
 
 from repoze.what.middleware import setup_request
 from repoze.what.acl import ACLCollection
 
+from repoze.what.plugins.dj.compiler import compile_predicate
+from repoze.what.plugins.dj.cache import (LocalCredentialsCache,
+    SharedCredentialsCache, connect_invalidation_signals)
+from repoze.what.plugins.dj.credentials import (FrozenCredentials,
+    InternedSet, BackendCredentialsLoader, make_lazy_credentials)
 from repoze.what.plugins.dj.denial_handlers import default_denial_handler
+from repoze.what.plugins.dj.predicates import USERID
 from repoze.what.plugins.dj.utils import _AuthorizationDenial
-from repoze.what.plugins.dj._utils import resolve_object
+from repoze.what.plugins.dj._acls import (get_acls, get_path_dependencies,
+    replace_predicates, PathCoverage, PathIndex, ViewIndex)
+from repoze.what.plugins.dj._memo import (get_decision_dependencies,
+    get_dependency_values, UNCACHEABLE)
+from repoze.what.plugins.dj._manifest import (find_authz_controls,
+    load_authz_controls)
+from repoze.what.plugins.dj._utils import resolve_object, LRUCache
 
 __all__ = ("RepozeWhatMiddleware", )
 
 
 _LOGGER = getLogger(__name__)
 
+_DECISION_CACHE_SIZE = 1000
+
+_MISSING = object()
+
+#: The items in the environ which are set by :func:`setup_request`; the rest
+#: of the items may be specific to the request.
+_SETUP_REQUEST_KEYS = ("repoze.what.credentials", "repoze.what.adapters",
+                       "repoze.what.global_control")
+
 
 class RepozeWhatMiddleware(object):
     """
@@ -50,6 +71,42 @@ class RepozeWhatMiddleware(object):
         If there's an ACL collection set in the ``GLOBAL_ACL_COLLECTION``
         setting, then use it instead.
         
+        The predicates in the ACLs are compiled with
+        :func:`~repoze.what.plugins.dj.compiler.compile_predicate`, in
+        adaptive mode if the ``AUTHZ_ADAPTIVE_REORDERING_INTERVAL`` setting
+        is defined.
+        
+        The groups and permissions of the users will be retrieved with the
+        loader class set in the ``CREDENTIALS_LOADER`` setting, if any, or
+        :class:`~repoze.what.plugins.dj.credentials.BackendCredentialsLoader`.
+        
+        The credentials of the users will be cached in the Django cache named
+        in the ``CREDENTIALS_CACHE`` setting, if any. Otherwise, they will be
+        cached in this process if the ``CREDENTIALS_CACHE_SIZE`` setting is
+        defined. Either way, they will be cached for the number of seconds in
+        the ``CREDENTIALS_CACHE_TIMEOUT`` setting (5 minutes by default).
+        
+        The authorization decisions made on ingress are cached in
+        :attr:`decision_cache`, whose size is set in the
+        ``AUTHZ_DECISION_CACHE_SIZE`` setting (1000 decisions by default, or
+        ``0`` to disable it).
+        
+        No authorization check is made on the media files, under
+        ``MEDIA_URL`` and ``ADMIN_MEDIA_PREFIX``, nor on the paths in the
+        ``AUTHZ_EXEMPT_PATHS`` setting. The paths in this setting are matched
+        exactly, unless they end with an asterisk (e.g., ``"/static/*"``), in
+        which case they are matched as prefixes.
+        
+        If the ``AUTHZ_EARLY_REJECTION`` setting is ``True``, the requests
+        which are denied regardless of the view are rejected before the URL
+        is resolved (see :meth:`process_request`).
+        
+        The applications with an authorization control are found by importing
+        the ``authz`` module of every application in ``INSTALLED_APPS``,
+        unless the ``AUTHZ_MANIFEST`` setting is defined: In that case, they
+        are read from the manifest file at that path, which is written (or
+        rewritten if it's stale) when it can't be used.
+        
         """
         # If there's no global ACL collection, create one:
         if hasattr(settings, "GLOBAL_ACL_COLLECTION"):
@@ -58,24 +115,79 @@ class RepozeWhatMiddleware(object):
             self.acl_collection = ACLCollection()
         
         # Let's get the authorization controls for every Django application:
+        manifest_path = getattr(settings, "AUTHZ_MANIFEST", None)
+        if manifest_path:
+            authz_controls = load_authz_controls(manifest_path,
+                                                 settings.INSTALLED_APPS)
+        else:
+            authz_controls = find_authz_controls(settings.INSTALLED_APPS)
         secured_apps = []
-        for app in settings.INSTALLED_APPS:
-            authz_module_name = "%s.authz" % app
-            try:
-                authz_module = import_module(authz_module_name)
-            except ImportError:
-                continue
-            if not hasattr(authz_module, "control"):
-                continue
-            self.acl_collection.add_acl(authz_module.control)
+        for (app, control) in authz_controls:
+            self.acl_collection.add_acl(control)
             secured_apps.append(app)
         
+        reordering_interval = getattr(settings,
+                                      "AUTHZ_ADAPTIVE_REORDERING_INTERVAL",
+                                      None)
+        replace_predicates(
+            self.acl_collection,
+            lambda predicate: compile_predicate(predicate, reordering_interval),
+            )
+        
         if secured_apps:
             secured_apps = ", ".join(secured_apps)
             _LOGGER.info("The following applications are secured: %s",
                          secured_apps)
         else:
             _LOGGER.warn("No application is secured")
+        
+        if hasattr(settings, "CREDENTIALS_LOADER"):
+            loader_class = resolve_object(settings.CREDENTIALS_LOADER)
+        else:
+            loader_class = BackendCredentialsLoader
+        self.credentials_loader = loader_class()
+        
+        # Let's set up the credentials cache, if requested:
+        self.credentials_cache = None
+        cache_name = getattr(settings, "CREDENTIALS_CACHE", None)
+        cache_size = getattr(settings, "CREDENTIALS_CACHE_SIZE", None)
+        cache_timeout = getattr(settings, "CREDENTIALS_CACHE_TIMEOUT", 300)
+        if cache_name:
+            self.credentials_cache = SharedCredentialsCache(cache_name,
+                                                            cache_timeout)
+        elif cache_size:
+            self.credentials_cache = LocalCredentialsCache(cache_size,
+                                                           cache_timeout)
+        if self.credentials_cache is not None:
+            connect_invalidation_signals(self.credentials_cache)
+        
+        exempt_paths = [settings.MEDIA_URL + "*",
+                        settings.ADMIN_MEDIA_PREFIX + "*"]
+        exempt_paths.extend(getattr(settings, "AUTHZ_EXEMPT_PATHS", ()))
+        self._exempt_path_matcher = _compile_exempt_paths(exempt_paths)
+        
+        self._early_rejection = getattr(settings, "AUTHZ_EARLY_REJECTION",
+                                        False)
+        self._inplace_environ = getattr(settings, "AUTHZ_INPLACE_ENVIRON",
+                                        False)
+        
+        self._path_coverage = PathCoverage(self.acl_collection)
+        self._path_index = PathIndex(self.acl_collection)
+        self._view_index = ViewIndex(self.acl_collection, settings.ROOT_URLCONF)
+        
+        # The repoze.what items in the environ for anonymous users, which are
+        # built on the first anonymous request:
+        self._anonymous_environ_items = None
+        
+        decision_cache_size = getattr(settings, "AUTHZ_DECISION_CACHE_SIZE",
+                                      _DECISION_CACHE_SIZE)
+        if decision_cache_size:
+            self.decision_cache = LRUCache(decision_cache_size)
+            # The parts of the request the decisions on each path depend on:
+            self._decision_dependencies = LRUCache(decision_cache_size)
+        else:
+            self.decision_cache = None
+            self._decision_dependencies = None
     
     def _set_request_up(self, request):
         """
@@ -97,27 +209,282 @@ class RepozeWhatMiddleware(object):
         Well, after all it's not that bad because we can take advantage of this
         to insert the user object in the :mod:`repoze.what` credentials dict.
         
+        The groups and permissions are not retrieved here: They are
+        :class:`~repoze.what.plugins.dj.credentials.LazyCredentialSet` objects
+        which are only loaded when a predicate reads them, from the credentials
+        cache if possible.
+        
+        The credentials are
+        :class:`~repoze.what.plugins.dj.credentials.FrozenCredentials`
+        objects, which keep the Django user as their ``user`` attribute.
+        
         """
-        username = None
-        permissions = set()
-        groups = set([g.name for g in request.user.groups.all()])
+        user = request.user
+        if not user.is_authenticated():
+            self._set_anonymous_request_up(request)
+            return
         
-        if request.user.is_authenticated():
-            username = request.user.username
-            permissions = set(request.user.get_all_permissions())
+        (groups, permissions) = make_lazy_credentials(
+            lambda: self._load_credentials(user))
+        
+        if self._inplace_environ:
+            self._set_request_up_in_place(request, groups, permissions)
+            return
         
         new_environ = setup_request(
             request.environ,
-            username,
+            user.username,
             None,
             None,
             self.acl_collection
             ).environ
-        new_environ['repoze.what.credentials']['groups'] = groups
-        new_environ['repoze.what.credentials']['permissions'] = permissions
+        new_environ['repoze.what.credentials'] = FrozenCredentials(
+            new_environ['repoze.what.credentials'],
+            user,
+            groups=groups,
+            permissions=permissions,
+            )
         # Finally, let's update the Django environ:
         request.environ = new_environ
     
+    def _set_request_up_in_place(self, request, groups, permissions):
+        """
+        Define the :mod:`repoze.what` credentials for an authenticated user
+        in the current environ, without calling :func:`setup_request`.
+        
+        The :mod:`repoze.what` items which don't depend on the user are those
+        built for the anonymous requests, so only the credentials are built
+        here.
+        
+        """
+        environ_items = self._get_anonymous_environ_items(request)
+        request.environ.update(environ_items)
+        
+        user = request.user
+        credentials = environ_items['repoze.what.credentials'].copy()
+        credentials[USERID] = user.username
+        request.environ['repoze.what.credentials'] = FrozenCredentials(
+            credentials,
+            user,
+            groups=groups,
+            permissions=permissions,
+            )
+    
+    def _set_anonymous_request_up(self, request):
+        """
+        Define the :mod:`repoze.what` credentials for an anonymous user.
+        
+        The :mod:`repoze.what` items in the environ are the same for all the
+        anonymous requests, so they are only built once. The credentials are
+        shared by all these requests and therefore they are immutable.
+        
+        """
+        request.environ.update(self._get_anonymous_environ_items(request))
+    
+    def _get_anonymous_environ_items(self, request):
+        """
+        Return the :mod:`repoze.what` items in the environ for an anonymous
+        user.
+        
+        """
+        if self._anonymous_environ_items is None:
+            environ = setup_request(
+                dict(request.environ),
+                None,
+                None,
+                None,
+                self.acl_collection
+                ).environ
+            environ_items = dict([(key, environ[key]) for key in
+                                  _SETUP_REQUEST_KEYS if key in environ])
+            environ_items['repoze.what.credentials'] = FrozenCredentials(
+                environ['repoze.what.credentials'],
+                groups=InternedSet(),
+                permissions=InternedSet(),
+                )
+            self._anonymous_environ_items = environ_items
+        
+        return self._anonymous_environ_items
+    
+    def _decide_authorization(self, request, view_func):
+        """
+        Return the authorization decision made by the global ACL collection.
+        
+        Only the ACLs which may apply to the view or the requested path are
+        evaluated.
+        
+        The decisions are reused for the same path and view when the
+        predicates which may make them only depend on the user id, the
+        groups, the permissions or attributes of the user, as long as those
+        are the same too.
+        
+        The groups and the permissions of the user are loaded to look up the
+        decisions which depend on them, from the credentials cache if
+        possible, since making the decision would need them anyway.
+        
+        """
+        if self.decision_cache is None:
+            return self._decide_authorization_by_view(request, view_func)
+        
+        path = request.environ['PATH_INFO']
+        # The ACLs in the collection may be extended at any time:
+        acl_count = len(get_acls(self.acl_collection) or ())
+        route_key = (path, view_func, acl_count)
+        try:
+            dependencies = self._decision_dependencies.get(route_key, _MISSING)
+        except TypeError:
+            # The view is not hashable.
+            return self._decide_authorization_by_view(request, view_func)
+        
+        if dependencies is _MISSING:
+            dependencies = self._get_path_decision_dependencies(path)
+            self._decision_dependencies.set(route_key, dependencies)
+        
+        if dependencies is UNCACHEABLE:
+            return self._decide_authorization_by_view(request, view_func)
+        
+        cache_key = route_key + get_dependency_values(dependencies, request)
+        try:
+            authz_decision = self.decision_cache.get(cache_key, _MISSING)
+        except TypeError:
+            # An attribute of the user is not hashable.
+            return self._decide_authorization_by_view(request, view_func)
+        
+        if authz_decision is _MISSING:
+            authz_decision = self._decide_authorization_by_view(request,
+                                                                view_func)
+            self.decision_cache.set(cache_key, authz_decision)
+        return authz_decision
+    
+    def _decide_authorization_early(self, request):
+        """
+        Return the authorization decision made by the global ACL collection
+        regardless of the view, or ``None`` if the decision depends on more
+        than the path and whether the user is anonymous.
+        
+        The decisions which don't depend on the user at all are made for
+        every user, and those which depend on the credentials are only made
+        for anonymous users, whose credentials are always the same.
+        
+        The credentials of authenticated users are never loaded here and the
+        request is not set up for :mod:`repoze.what`.
+        
+        """
+        path = request.environ['PATH_INFO']
+        acl_count = len(get_acls(self.acl_collection) or ())
+        # The decisions made without the view are the same as the decisions
+        # made with an unknown view:
+        route_key = (path, None, acl_count)
+        
+        if self._decision_dependencies is None:
+            dependencies = self._get_path_decision_dependencies(path)
+        else:
+            dependencies = self._decision_dependencies.get(route_key, _MISSING)
+            if dependencies is _MISSING:
+                dependencies = self._get_path_decision_dependencies(path)
+                self._decision_dependencies.set(route_key, dependencies)
+        
+        if dependencies is UNCACHEABLE:
+            return None
+        if dependencies:
+            if request.user.is_authenticated():
+                return None
+            cache_key = route_key + (None, )
+        else:
+            cache_key = route_key
+        
+        if self.decision_cache is None:
+            authz_decision = _MISSING
+        else:
+            authz_decision = self.decision_cache.get(cache_key, _MISSING)
+        
+        if authz_decision is _MISSING:
+            # The request is set up later, so the environ must not be changed:
+            environ = dict(request.environ)
+            environ.update(self._get_anonymous_environ_items(request))
+            authz_decision = self._path_index.decide_authorization(environ,
+                                                                   None)
+            if self.decision_cache is not None:
+                self.decision_cache.set(cache_key, authz_decision)
+        return authz_decision
+    
+    def _get_path_decision_dependencies(self, path):
+        """
+        Return the dependencies of the decisions made at ``path`` in a
+        predictable order, or :data:`UNCACHEABLE` if the decisions can't be
+        reused.
+        
+        """
+        return get_decision_dependencies(
+            get_path_dependencies(self.acl_collection, path))
+    
+    def _decide_authorization_by_view(self, request, view_func):
+        """
+        Return the authorization decision made by the ACLs which may apply to
+        ``view_func``, or by those which may apply to the path if the view is
+        unknown.
+        
+        Views are only looked up when the request uses the default URL
+        configuration, because that's where they are indexed from.
+        
+        """
+        collection = None
+        if not hasattr(request, "urlconf"):
+            collection = self._view_index.get_collection(view_func)
+        
+        if collection is None:
+            return self._path_index.decide_authorization(request.environ,
+                                                         view_func)
+        return collection.decide_authorization(request.environ, view_func)
+    
+    def _load_credentials(self, user):
+        """
+        Return the groups and permissions of ``user``, from the credentials
+        cache if possible.
+        
+        """
+        if self.credentials_cache is None:
+            return self.credentials_loader(user)
+        return self.credentials_cache.load(
+            user.pk,
+            lambda: self.credentials_loader(user),
+            )
+    
+    def process_request(self, request):
+        """
+        Reject the request before its URL is resolved if authorization is
+        denied regardless of the view, when the ``AUTHZ_EARLY_REJECTION``
+        setting is ``True``.
+        
+        Only the decisions which depend on nothing but the path, or on the
+        path and the credentials of anonymous users, are made here. The rest
+        are left to :meth:`process_view`. This saves the URL resolution and
+        the rest of the middleware on the requests made to denied paths, like
+        those from scanners and bots.
+        
+        This middleware must come after Django's
+        ``AuthenticationMiddleware`` when this feature is enabled.
+        
+        """
+        if not self._early_rejection:
+            return
+        
+        if (self._exempt_path_matcher is not None and
+            self._exempt_path_matcher(request.path)):
+            return
+        
+        if not self._path_coverage(request.environ['PATH_INFO']):
+            return
+        
+        authz_decision = self._decide_authorization_early(request)
+        if authz_decision is None or authz_decision.allow:
+            return
+        
+        _LOGGER.warn(u"Authorization denied before URL resolution to %s at "
+                     "%s: %s", request.user, request.environ['PATH_INFO'],
+                     authz_decision.reason)
+        return self._handle_denial(request, authz_decision)
+    
     def process_view(self, request, view_func, view_args, view_kwargs):
         """
         Check if authorization should be granted for this request or reject
@@ -134,19 +501,27 @@ class RepozeWhatMiddleware(object):
         Whatever happens will be logged every time. Denials will be logged as
         warnings and the rest as informational logs.
         
-        It does nothing when requested media files.
+        It does nothing when requested media files or any other exempt path.
+        It doesn't set the request up either when no ACL in the global
+        collection may apply to the path: That will be done by the in-view
+        utilities, if they are used.
         
         """
-        if (request.path.startswith(settings.MEDIA_URL) or
-            request.path.startswith(settings.ADMIN_MEDIA_PREFIX)):
-            _LOGGER.debug("Authorization checks disabled for media file at %s",
+        if (self._exempt_path_matcher is not None and
+            self._exempt_path_matcher(request.path)):
+            _LOGGER.debug("Authorization checks disabled for exempt path %s",
                           request.environ['PATH_INFO'])
             return
         
+        if not self._path_coverage(request.environ['PATH_INFO']):
+            _LOGGER.debug("No authorization decision made on ingress at %s",
+                          request.environ['PATH_INFO'])
+            request._repoze_what_deferred_setup = self._set_request_up
+            return
+        
         self._set_request_up(request)
         
-        authz_decision = self.acl_collection.decide_authorization(request.environ,
-                                                                  view_func)
+        authz_decision = self._decide_authorization(request, view_func)
         if authz_decision is None:
             _LOGGER.debug("No authorization decision made on ingress at %s",
                           request.environ['PATH_INFO'])
@@ -163,12 +538,22 @@ class RepozeWhatMiddleware(object):
                      request.user, request.environ['PATH_INFO'],
                      authz_decision.reason)
         
-        if authz_decision.denial_handler is None:
+        return self._handle_denial(request, authz_decision)
+    
+    def _handle_denial(self, request, authz_decision):
+        """
+        Return the response generated by the denial handler for the negative
+        ``authz_decision``.
+        
+        """
+        # The decision may be reused, so it must not be modified:
+        denial_handler = authz_decision.denial_handler
+        if denial_handler is None:
             _LOGGER.debug("No custom denial handler defined; using the default "
                           "one")
-            authz_decision.denial_handler = default_denial_handler
+            denial_handler = default_denial_handler
         
-        return authz_decision.denial_handler(request, authz_decision.reason)
+        return denial_handler(request, authz_decision.reason)
     
     def process_exception(self, request, exception):
         """
@@ -197,3 +582,32 @@ class RepozeWhatMiddleware(object):
             
             return exception.handler(request, exception.reason)
 
+
+#{ Exempt paths
+
+
+def _compile_exempt_paths(exempt_paths):
+    """
+    Return a function which tells whether a path is one of the
+    ``exempt_paths``, or ``None`` if there are none.
+    
+    The paths ending with an asterisk are prefixes. Empty paths and prefixes
+    are ignored because they would exempt everything.
+    
+    """
+    patterns = []
+    for exempt_path in exempt_paths:
+        if exempt_path.endswith("*"):
+            exempt_path = exempt_path[:-1]
+            pattern_suffix = ""
+        else:
+            pattern_suffix = r"\Z"
+        if exempt_path:
+            patterns.append(re.escape(exempt_path) + pattern_suffix)
+    
+    if not patterns:
+        return None
+    return re.compile("|".join(patterns)).match
+
+
+#}
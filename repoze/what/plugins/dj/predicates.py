@@ -17,10 +17,135 @@ Django-specific :mod:`repoze.what` predicates.
 
 """
 
+from repoze.what import predicates as core_predicates
 from repoze.what.predicates import Predicate
 
 __all__ = ("IsStaff", "IsActive", "IsSuperuser", "IS_STAFF", "IS_ACTIVE",
-           "IS_SUPERUSER")
+           "IS_SUPERUSER", "USERID", "GROUPS", "PERMISSIONS", "USER",
+           "REQUEST", "VOLATILE", "user_attribute", "get_dependencies")
+
+
+#{ Predicate dependencies
+
+
+USERID = "repoze.what.userid"
+"""The predicate reads the user id in the credentials."""
+
+GROUPS = "groups"
+"""The predicate reads the groups in the credentials."""
+
+PERMISSIONS = "permissions"
+"""The predicate reads the permissions in the credentials."""
+
+USER = "user"
+"""The predicate reads any attribute of the Django user."""
+
+REQUEST = "request"
+"""
+The predicate reads something else from the request (e.g., the IP address, a
+header, the path) or depends on something external which doesn't change during
+the request.
+
+"""
+
+VOLATILE = "volatile"
+"""
+The result of the predicate may change even if the request doesn't (e.g., it
+depends on the time), so it must not be reused within the request.
+
+"""
+
+
+def user_attribute(attribute_name):
+    """
+    Return the dependency on the ``attribute_name`` attribute of the Django
+    user.
+    
+    """
+    return "%s.%s" % (USER, attribute_name)
+
+
+def get_dependencies(predicate):
+    """
+    Return the parts of the request ``predicate`` depends on.
+    
+    :param predicate: The :mod:`repoze.what` predicate.
+    :type predicate: :class:`repoze.what.predicates.Predicate`
+    :return: The dependencies of the predicate.
+    :rtype: :class:`frozenset`
+    
+    Predicates may declare their dependencies in the ``environ_dependencies``
+    attribute; for example::
+    
+        class IsDeveloper(Predicate):
+        
+            environ_dependencies = frozenset([GROUPS])
+            
+            def check(self, request, credentials):
+                return "developers" in credentials['groups']
+    
+    Predicates which don't declare them are assumed to depend on the whole
+    request (:data:`REQUEST`), unless they are the built-in :mod:`repoze.what`
+    predicates, whose dependencies are known.
+    
+    Knowing the dependencies of a predicate makes it possible to reuse the
+    authorization decisions made with it. The result of a predicate is also
+    reused when it's evaluated again in the same request, unless it depends
+    on :data:`VOLATILE`.
+    
+    """
+    dependencies = getattr(predicate, "environ_dependencies", None)
+    if dependencies is not None:
+        return frozenset(dependencies)
+    
+    predicate_class = type(predicate)
+    
+    if predicate_class in _CORE_DEPENDENCIES:
+        return _CORE_DEPENDENCIES[predicate_class]
+    
+    if predicate_class in _COMPOUND_PREDICATES:
+        dependencies = set()
+        for sub_predicate in _get_sub_predicates(predicate):
+            dependencies.update(get_dependencies(sub_predicate))
+        return frozenset(dependencies)
+    
+    return frozenset([REQUEST])
+
+
+def _get_core_predicate_classes(*class_names):
+    """Return the built-in predicate classes available in ``class_names``."""
+    classes = [getattr(core_predicates, n, None) for n in class_names]
+    return [c for c in classes if c is not None]
+
+
+def _get_sub_predicates(predicate):
+    """Return the predicates inside the compound ``predicate``."""
+    if hasattr(predicate, "predicates"):
+        return predicate.predicates
+    return (predicate.predicate, )
+
+
+def _get_core_dependencies():
+    """Return the dependencies of the built-in non-compound predicates."""
+    dependencies_by_class = {}
+    for (class_names, dependencies) in (
+        (("is_user", "not_anonymous", "is_anonymous"), (USERID, )),
+        (("in_group", "in_all_groups", "in_any_group"), (GROUPS, )),
+        (("has_permission", "has_all_permissions", "has_any_permission"),
+         (PERMISSIONS, )),
+        ):
+        for predicate_class in _get_core_predicate_classes(*class_names):
+            dependencies_by_class[predicate_class] = frozenset(dependencies)
+    return dependencies_by_class
+
+
+_CORE_DEPENDENCIES = _get_core_dependencies()
+
+_COMPOUND_PREDICATES = frozenset(_get_core_predicate_classes("All", "Any",
+                                                             "Not"))
+
+
+#}
 
 
 class IsStaff(Predicate):
@@ -31,6 +156,8 @@ class IsStaff(Predicate):
     
     """
     
+    environ_dependencies = frozenset([user_attribute("is_staff")])
+    
     def check(self, request, credentials):
         return request.user.is_staff
 
@@ -43,6 +170,8 @@ class IsActive(Predicate):
     
     """
     
+    environ_dependencies = frozenset([user_attribute("is_active")])
+    
     def check(self, request, credentials):
         return request.user.is_active
 
@@ -55,6 +184,8 @@ class IsSuperuser(Predicate):
     
     """
     
+    environ_dependencies = frozenset([user_attribute("is_superuser")])
+    
     def check(self, request, credentials):
         return request.user.is_superuser
 
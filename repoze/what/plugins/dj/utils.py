@@ -18,20 +18,58 @@ In-view utilities for the :mod:`repoze.what` Django plugin.
 
 """
 
+from collections import MutableMapping
 from logging import getLogger
 from functools import wraps
 
 from django.conf import settings
-from django.core.urlresolvers import RegexURLResolver
+from django.core.urlresolvers import (get_callable, get_resolver, reverse,
+    RegexURLResolver, Resolver404)
 
 from repoze.what.internals import forge_request
 
+from repoze.what.plugins.dj.compiler import (CompiledPredicate,
+    compile_predicate)
+from repoze.what.plugins.dj.predicates import get_dependencies
+from repoze.what.plugins.dj._acls import (get_acls, get_path_dependencies,
+    PathIndex)
+from repoze.what.plugins.dj._memo import (get_memoized_result,
+    get_decision_dependencies, get_dependency_values, UNCACHEABLE,
+    _RESULTS_KEY)
+from repoze.what.plugins.dj._utils import LRUCache, iter_view_defaults
 
-__all__ = ("is_met", "not_met", "enforce", "require", "can_access")
+
+__all__ = ("is_met", "not_met", "enforce", "require", "can_access",
+           "can_access_many", "can_access_view", "accessible_urls")
 
 
 _LOGGER = getLogger(__name__)
 
+_RESOLUTION_CACHE_SIZE = 1000
+
+# The views resolved by path and URL configuration, or the arguments of the
+# Resolver404 exceptions raised on the paths which don't exist:
+_RESOLUTION_CACHE = LRUCache(_RESOLUTION_CACHE_SIZE)
+
+# The views and their default named arguments by name and URL configuration:
+_VIEW_CACHE = LRUCache(_RESOLUTION_CACHE_SIZE)
+
+_ACCESSIBLE_URLS_CACHE_SIZE = 1000
+
+# The candidates whose access can be reused, along with the dependencies of
+# their decisions, by global control, URL configuration and candidates:
+_CANDIDATE_DEPENDENCIES_CACHE = LRUCache(_ACCESSIBLE_URLS_CACHE_SIZE)
+
+# The access to the candidates, by global control, URL configuration,
+# candidates and the values of the dependencies of their decisions:
+_ACCESSIBLE_URLS_CACHE = LRUCache(_ACCESSIBLE_URLS_CACHE_SIZE)
+
+_PATH_INDEX_CACHE_SIZE = 100
+
+# The indexes of the ACLs by global control; each index is built again if ACLs
+# are added to its collection:
+_PATH_INDEX_CACHE = LRUCache(_PATH_INDEX_CACHE_SIZE)
+
 
 #{ Predicate evaluation functions
 
@@ -68,8 +106,18 @@ def is_met(predicate, request):
                                                 "can see it.")
             return HttpResponse("Hi there!")
     
+    The result of ``predicate`` is reused if it's evaluated again in the same
+    request, unless it depends on
+    :data:`~repoze.what.plugins.dj.predicates.VOLATILE`.
+    
     """
-    return predicate(request)
+    _run_deferred_setup(request)
+    if isinstance(predicate, CompiledPredicate):
+        # It reuses the result on its own.
+        return predicate(request)
+    return get_memoized_result(request.environ, predicate,
+                               get_dependencies(predicate),
+                               lambda: predicate(request))
 
 
 def not_met(predicate, request):
@@ -106,7 +154,7 @@ def not_met(predicate, request):
             return HttpResponse(", ".join(rights))
     
     """
-    return not predicate(request)
+    return not is_met(predicate, request)
 
 
 def enforce(predicate, request, msg=None, denial_handler=None):
@@ -194,7 +242,13 @@ def require(predicate, msg=None, denial_handler=None):
     inside the view won't get executed and authorization will be denied using
     the default handler.
     
+    ``predicate`` is compiled with
+    :func:`~repoze.what.plugins.dj.compiler.compile_predicate` when the view is
+    decorated.
+    
     """
+    predicate = compile_predicate(predicate)
+    
     def decorator(view_func):
         def _wrapped_view(request, *args, **kwargs):
             enforce(predicate, request, msg, denial_handler)
@@ -249,6 +303,11 @@ def can_access(path, request, view_func=None, view_args=(),
             
             return HttpResponse("You're staying here in the mean time!")
     
+    If the ``AUTHZ_LIGHTWEIGHT_FORGED_REQUESTS`` setting is ``True``, the
+    environ of the forged request only holds the path, the query string and
+    the routing arguments, and the rest of the items are read from the current
+    environ.
+    
     .. note::
         Only access rules available in the global ACL collection will be taken
         into account. Rules set with :func:`@require
@@ -262,13 +321,295 @@ def can_access(path, request, view_func=None, view_args=(),
     
     # At this point ``path`` does exist, so it's safe to move on.
     
+    _run_deferred_setup(request)
+    authz_control = request.environ['repoze.what.global_control']
+    return _can_access(path, request, authz_control, view_func, view_args,
+                       view_kwargs)
+
+
+def can_access_many(paths, request):
+    """
+    Report whether authorization would be granted on ingress to each path in
+    ``paths``.
+    
+    :param paths: The paths to other places in the website; they may include
+        the query string.
+    :param request: The Django request to be used as an starting point to forge
+        the requests.
+    :type request: :class:`django.http.HttpRequest`
+    :return: Whether authorization would be granted, by path.
+    :rtype: :class:`dict`
+    :raises django.core.urlresolvers.Resolver404: If a path does not exist.
+    
+    The result is the same as calling :func:`can_access` on each path, but
+    the request is set up and forged once, the ACLs which may apply to each
+    path are looked up in an index which is reused across requests and the
+    predicates which don't depend on the path are only evaluated once. Use it
+    to display navigation menus; e.g.::
+    
+        from repoze.what.plugins.dj import can_access_many
+        
+        MENU = (("/", "Home"), ("/blog/", "Blog"), ("/admin/", "Admin"))
+        
+        def menu(request):
+            access = can_access_many([path for (path, title) in MENU], request)
+            return [(path, title) for (path, title) in MENU if access[path]]
+    
+    """
+    _run_deferred_setup(request)
+    authz_control = _get_path_index(
+        request.environ['repoze.what.global_control'])
+    # The requests forged from this one share the results of the predicates:
+    request.environ.setdefault(_RESULTS_KEY, {})
+    # The request is forged once, and then copied for each path:
+    if getattr(settings, "AUTHZ_LIGHTWEIGHT_FORGED_REQUESTS", False):
+        base_environ = request.environ
+    else:
+        base_environ = forge_request(request.environ, "/", (), {}).environ
+    
+    access_by_path = {}
+    for path in paths:
+        if path in access_by_path:
+            continue
+        (view_func, view_args, view_kwargs) = _get_view_and_args(path, request)
+        access_by_path[path] = _can_access(path, request, authz_control,
+                                           view_func, view_args, view_kwargs,
+                                           base_environ)
+    return access_by_path
+
+
+def can_access_view(viewname, request, args=(), kwargs={}):
+    """
+    Report whether authorization would be granted on ingress to the view
+    ``viewname``.
+    
+    :param viewname: The view, its import path or the name of its URL
+        pattern, as in :func:`django.core.urlresolvers.reverse`.
+    :param request: The Django request to be used as an starting point to forge
+        the request.
+    :type request: :class:`django.http.HttpRequest`
+    :param args: The positional arguments for the view.
+    :type args: :class:`tuple`
+    :param kwargs: The named arguments for the view.
+    :type kwargs: :class:`dict`
+    :raises django.core.urlresolvers.NoReverseMatch: If the view is not in
+        the URL configuration or doesn't take these arguments.
+    
+    The request is forged to the path returned by
+    :func:`~django.core.urlresolvers.reverse`, like :func:`can_access` does,
+    but the path is not resolved back to the view: The view and the default
+    named arguments of its URL pattern are found once for each name and URL
+    configuration, and the arguments passed here are used along with them::
+    
+        if can_access_view("blog-post", request, kwargs={'post_id': 16}):
+            # The current user can access blog post #16.
+            pass
+    
+    If ``viewname`` matches several URL patterns with different views or
+    default arguments, the path is resolved as in :func:`can_access`.
+    
+    """
+    urlconf = getattr(request, "urlconf", settings.ROOT_URLCONF)
+    path = reverse(viewname, urlconf, args or None, kwargs or None,
+                   prefix="/")
+    (view_func, default_kwargs) = _get_view(viewname, urlconf)
+    if view_func is None:
+        return can_access(path, request)
+    
+    view_kwargs = dict(kwargs)
+    view_kwargs.update(default_kwargs)
+    
+    _run_deferred_setup(request)
     authz_control = request.environ['repoze.what.global_control']
-    forged_request = forge_request(request.environ, path, view_args,
-                                   view_kwargs)
+    return _can_access(path, request, authz_control, view_func, tuple(args),
+                       view_kwargs)
+
+
+def accessible_urls(request, candidates):
+    """
+    Return the paths in ``candidates`` to which authorization would be granted
+    on ingress.
+    
+    :param request: The Django request to be used as an starting point to forge
+        the requests.
+    :type request: :class:`django.http.HttpRequest`
+    :param candidates: The paths to other places in the website; they may
+        include the query string.
+    :return: The accessible paths, in the same order as in ``candidates``.
+    :rtype: :class:`list`
+    :raises django.core.urlresolvers.Resolver404: If a path does not exist.
+    
+    The access to the candidates is checked with :func:`can_access_many`, and
+    it's reused for the users with the same credentials as long as the
+    decisions on those paths only depend on the credentials (e.g., on the
+    groups and permissions). The paths on which the decisions depend on
+    anything else in the request are checked every time.
+    
+    The access is cached for the same candidates, so it's meant to be used
+    with fixed sets of paths, like those in a navigation menu or a sitemap::
+    
+        from repoze.what.plugins.dj import accessible_urls
+        
+        MENU = ("/", "/blog/", "/forum/", "/admin/")
+        
+        def menu(request):
+            return accessible_urls(request, MENU)
+    
+    """
+    _run_deferred_setup(request)
+    authz_control = request.environ['repoze.what.global_control']
+    candidates = tuple(candidates)
+    # The ACLs in the collection may be extended at any time:
+    acl_count = len(get_acls(authz_control) or ())
+    # The same paths may lead to different views in other URL configurations:
+    urlconf = getattr(request, "urlconf", settings.ROOT_URLCONF)
+    candidates_key = (authz_control, acl_count, urlconf, candidates)
+    
+    try:
+        candidate_dependencies = _CANDIDATE_DEPENDENCIES_CACHE.get(
+            candidates_key)
+    except TypeError:
+        # The global control, the URL configuration or a candidate is not
+        # hashable.
+        candidate_dependencies = None
+        candidates_key = None
+    if candidate_dependencies is None:
+        candidate_dependencies = _get_candidate_dependencies(authz_control,
+                                                             candidates)
+        if candidates_key is not None:
+            _CANDIDATE_DEPENDENCIES_CACHE.set(candidates_key,
+                                              candidate_dependencies)
+    (cacheable_paths, dependencies, live_paths) = candidate_dependencies
+    
+    access_by_path = {}
+    if cacheable_paths:
+        access_key = None
+        cached_access = None
+        if candidates_key is not None:
+            access_key = candidates_key + \
+                get_dependency_values(dependencies, request)
+            try:
+                cached_access = _ACCESSIBLE_URLS_CACHE.get(access_key)
+            except TypeError:
+                # An attribute of the user is not hashable.
+                access_key = None
+        if cached_access is None:
+            cached_access = can_access_many(cacheable_paths, request)
+            if access_key is not None:
+                _ACCESSIBLE_URLS_CACHE.set(access_key, cached_access)
+        access_by_path.update(cached_access)
+    if live_paths:
+        access_by_path.update(can_access_many(live_paths, request))
+    
+    return [path for path in candidates if access_by_path[path]]
+
+
+#{ Internal stuff
+
+
+def _get_candidate_dependencies(authz_control, candidates):
+    """
+    Return the ``candidates`` whose access can be reused, the dependencies
+    of the decisions made on them and the rest of the candidates.
+    
+    """
+    cacheable_paths = []
+    dependencies = set()
+    live_paths = []
+    for path in candidates:
+        path_dependencies = get_decision_dependencies(
+            get_path_dependencies(authz_control, path.split("?", 1)[0]))
+        if path_dependencies is UNCACHEABLE:
+            live_paths.append(path)
+        else:
+            cacheable_paths.append(path)
+            dependencies.update(path_dependencies)
+    return (tuple(cacheable_paths), tuple(sorted(dependencies)),
+            tuple(live_paths))
+
+
+def _get_view(viewname, urlconf):
+    """
+    Return the view called ``viewname`` in ``urlconf`` and the default named
+    arguments of its URL pattern, or ``(None, None)`` if they can't be told
+    apart from those of other patterns.
+    
+    """
+    cache_key = (urlconf, viewname)
+    try:
+        view = _VIEW_CACHE.get(cache_key)
+    except TypeError:
+        # The URL configuration or the view is not hashable.
+        return _find_view(viewname, urlconf)
+    
+    if view is None:
+        view = _find_view(viewname, urlconf)
+        _VIEW_CACHE.set(cache_key, view)
+    return view
+
+
+def _find_view(viewname, urlconf):
+    """
+    Find the view called ``viewname`` in ``urlconf`` and the default named
+    arguments of its URL pattern.
+    
+    The names of URL patterns are looked up first, like
+    :func:`~django.core.urlresolvers.reverse` does, so that names with dots
+    are not mistaken for import paths.
+    
+    """
+    if callable(viewname):
+        view_func = viewname
+    elif viewname in get_resolver(urlconf).reverse_dict:
+        # It's the name of a URL pattern.
+        view_func = None
+    else:
+        view_func = get_callable(viewname, True)
+        if not callable(view_func):
+            return (None, None)
+    
+    views = []
+    try:
+        for (pattern, default_kwargs) in iter_view_defaults(urlconf):
+            if view_func is None:
+                is_match = pattern.name == viewname
+            else:
+                is_match = pattern.callback == view_func
+            view = (pattern.callback, default_kwargs)
+            if is_match and view not in views:
+                views.append(view)
+    except Exception, exc:
+        _LOGGER.warn("The URL patterns of %s could not be found; its path "
+                     "will be resolved: %s", viewname, exc)
+        return (None, None)
+    
+    if len(views) != 1:
+        # We can't tell which pattern reverse() used.
+        return (None, None)
+    return views[0]
+
+
+def _can_access(path, request, authz_control, view_func, view_args,
+                view_kwargs, base_environ=None):
+    """
+    Report whether ``authz_control`` would grant authorization on ingress to
+    ``path``.
+    
+    If ``base_environ`` is passed, the request is forged on top of it instead
+    of forging it from the ``request``.
+    
+    """
+    if base_environ is not None:
+        forged_environ = _forge_environ(path, base_environ, view_args,
+                                        view_kwargs)
+    elif getattr(settings, "AUTHZ_LIGHTWEIGHT_FORGED_REQUESTS", False):
+        forged_environ = _forge_environ(path, request.environ, view_args,
+                                        view_kwargs)
+    else:
+        forged_environ = forge_request(request.environ, path, view_args,
+                                       view_kwargs).environ
+    decision = authz_control.decide_authorization(forged_environ, view_func)
     
-    # Finally, let's verify if authorization would be granted:
-    decision = authz_control.decide_authorization(forged_request.environ,
-                                                  view_func)
     if decision is None or decision.allow:
         # Authorization would be granted.
         _LOGGER.debug("Authorization would be granted on ingress to %s at %s",
@@ -283,7 +624,125 @@ def can_access(path, request, view_func=None, view_args=(),
     return would_access
 
 
-#{ Internal stuff
+def _forge_environ(path, environ, view_args, view_kwargs):
+    """
+    Return the environ for a request to ``path`` forged from ``environ``.
+    
+    Only the path, the query string and the routing arguments are replaced,
+    and the rest of the items are read from ``environ``, which is left
+    untouched.
+    
+    """
+    if "?" in path:
+        (path_info, query_string) = path.split("?", 1)
+    else:
+        (path_info, query_string) = (path, "")
+    return _ForgedEnviron(environ, {
+        'PATH_INFO': path_info,
+        'QUERY_STRING': query_string,
+        'wsgiorg.routing_args': (view_args, view_kwargs),
+        })
+
+
+class _ForgedEnviron(MutableMapping):
+    """
+    WSGI environ of a forged request, which only holds the items replaced or
+    set in that request and reads the rest from the original environ.
+    
+    The original environ is never modified: The items deleted from the forged
+    environ are only hidden.
+    
+    """
+    
+    __slots__ = ("_base_environ", "_items")
+    
+    def __init__(self, base_environ, items):
+        self._base_environ = base_environ
+        self._items = items
+    
+    def __getitem__(self, key):
+        if key in self._items:
+            value = self._items[key]
+            if value is _DELETED:
+                raise KeyError(key)
+            return value
+        return self._base_environ[key]
+    
+    def get(self, key, default=None):
+        # The predicates read the environ with this method, so it's faster
+        # than the generic one, which catches a KeyError:
+        if key in self._items:
+            value = self._items[key]
+            if value is _DELETED:
+                return default
+            return value
+        return self._base_environ.get(key, default)
+    
+    def __setitem__(self, key, value):
+        self._items[key] = value
+    
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._items[key] = _DELETED
+    
+    def __contains__(self, key):
+        if key in self._items:
+            return self._items[key] is not _DELETED
+        return key in self._base_environ
+    
+    def __iter__(self):
+        for key in self._base_environ:
+            if key not in self._items:
+                yield key
+        for (key, value) in self._items.iteritems():
+            if value is not _DELETED:
+                yield key
+    
+    def __len__(self):
+        return len([key for key in self])
+    
+    def __repr__(self):
+        return "<%s %r>" % (self.__class__.__name__, self.copy())
+    
+    def copy(self):
+        """Return a regular copy of the environ."""
+        return dict(self.iteritems())
+
+
+_DELETED = object()
+
+
+def _get_path_index(authz_control):
+    """
+    Return the index of the ACLs in ``authz_control``.
+    
+    The index is reused for the same global control, unless it's not hashable.
+    
+    """
+    try:
+        path_index = _PATH_INDEX_CACHE.get(authz_control)
+    except TypeError:
+        return PathIndex(authz_control)
+    
+    if path_index is None:
+        path_index = PathIndex(authz_control)
+        _PATH_INDEX_CACHE.set(authz_control, path_index)
+    return path_index
+
+
+def _run_deferred_setup(request):
+    """
+    Set the :mod:`repoze.what` environ up if the middleware deferred it.
+    
+    The middleware doesn't set the request up when no ACL applies to the path,
+    so that it's only done when the request is checked in the view.
+    
+    """
+    deferred_setup = getattr(request, "_repoze_what_deferred_setup", None)
+    if deferred_setup is not None:
+        del request._repoze_what_deferred_setup
+        deferred_setup(request)
 
 
 def _get_view_and_args(path, request):
@@ -292,11 +751,37 @@ def _get_view_and_args(path, request):
     
     Django will raise a Resolver404 exception if ``path`` doesn't exist.
     
+    The resolvers are reused for the same URL configuration, and so are the
+    views (or the exceptions) found at the most recently resolved paths.
+    
     """
     # Let's use urlconf from request object, if available:
     urlconf = getattr(request, "urlconf", settings.ROOT_URLCONF)
-    resolver = RegexURLResolver(r"^/", urlconf)
-    return resolver.resolve(path)
+    cache_key = (urlconf, path)
+    try:
+        resolution = _RESOLUTION_CACHE.get(cache_key)
+    except TypeError:
+        # The URL configuration is not hashable, so it can't be cached.
+        resolver = RegexURLResolver(r"^/", urlconf)
+        return resolver.resolve(path)
+    
+    if resolution is None:
+        try:
+            (view_func, view_args, view_kwargs) = \
+                get_resolver(urlconf).resolve(path)
+        except Resolver404, exc:
+            resolution = (False, exc.args)
+        else:
+            resolution = (True, (view_func, tuple(view_args), view_kwargs))
+        _RESOLUTION_CACHE.set(cache_key, resolution)
+    
+    (path_exists, result) = resolution
+    if not path_exists:
+        raise Resolver404(*result)
+    
+    (view_func, view_args, view_kwargs) = result
+    # The named arguments are copied because they may be modified:
+    return (view_func, view_args, dict(view_kwargs))
 
 
 #}
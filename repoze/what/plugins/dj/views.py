@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2010, 2degrees Limited <gustavonarea@2degreesnetwork.com>.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the BSD-like license at
+# http://www.repoze.org/LICENSE.txt.  A copy of the license should accompany
+# this distribution.  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL
+# EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND
+# FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Django views for the :mod:`repoze.what` Django plugin.
+
+"""
+
+from django.http import HttpResponse
+
+from repoze.what.plugins.dj.compiler import CompiledPredicate
+from repoze.what.plugins.dj.predicates import IS_SUPERUSER
+from repoze.what.plugins.dj.utils import require
+from repoze.what.plugins.dj._acls import (get_acls, get_base_path,
+    get_predicates)
+
+__all__ = ("predicate_order", )
+
+
+@require(IS_SUPERUSER)
+def predicate_order(request):
+    """
+    Display the current order of the compiled predicates in the global ACL
+    collection, along with the statistics recorded in adaptive mode.
+    
+    Only superusers can access this view. To enable it, add it to your URL
+    configuration::
+    
+        urlpatterns = patterns('',
+            # ...
+            (r'^authz/predicates/$',
+             "repoze.what.plugins.dj.views.predicate_order"),
+        )
+    
+    """
+    global_control = request.environ['repoze.what.global_control']
+    acls = get_acls(global_control) or []
+    
+    lines = []
+    for acl in acls:
+        base_path = get_base_path(acl) or "(unknown base path)"
+        predicates = get_predicates(acl) or []
+        descriptions = [p.describe() for p in predicates
+                        if isinstance(p, CompiledPredicate)]
+        if not descriptions:
+            continue
+        lines.append("ACL at %s:" % base_path)
+        for description in descriptions:
+            for line in description.splitlines():
+                lines.append("    %s" % line)
+        lines.append("")
+    
+    if not lines:
+        lines.append("There are no compiled predicates in the global ACLs.")
+    
+    return HttpResponse("\n".join(lines), mimetype="text/plain")
@@ -79,6 +79,7 @@ class BaseUser(object):
 class User(BaseUser):
     def __init__(self, username, groups, permissions):
         self.username = username
+        self.pk = username
         self.permissions = permissions
         self.message_set = MockMessageSet()
         super(User, self).__init__(groups)
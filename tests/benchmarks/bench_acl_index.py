@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2010, 2degrees Limited <gustavonarea@2degreesnetwork.com>.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the BSD-like license at
+# http://www.repoze.org/LICENSE.txt.  A copy of the license should accompany
+# this distribution.  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL
+# EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND
+# FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Latency of the authorization decisions made on ingress, as the number of ACLs
+in the global collection grows.
+
+"""
+
+from timeit import Timer
+
+from repoze.what.acl import ACL, ACLCollection
+
+from repoze.what.plugins.dj._acls import PathIndex
+
+
+ACL_COUNTS = (10, 100, 500, 1000)
+
+RULES_PER_ACL = 20
+
+REPETITIONS = 1000
+
+
+def make_collection(acl_count):
+    collection = ACLCollection()
+    for acl_number in range(acl_count):
+        acl = ACL("/app%s" % acl_number)
+        for rule_number in range(RULES_PER_ACL):
+            acl.allow("/view%s" % rule_number)
+        acl.deny("/", reason="Unknown view")
+        collection.add_acl(acl)
+    return collection
+
+
+def time_decisions(decide_authorization, path):
+    environ = {'PATH_INFO': path}
+    timer = Timer(lambda: decide_authorization(environ, None))
+    return min(timer.repeat(3, REPETITIONS)) / REPETITIONS
+
+
+def main():
+    print "%6s  %14s  %14s" % ("ACLs", "Linear (us)", "Indexed (us)")
+    for acl_count in ACL_COUNTS:
+        collection = make_collection(acl_count)
+        index = PathIndex(collection)
+        # The last ACL is the worst case for the linear walk:
+        path = "/app%s/view%s" % (acl_count - 1, RULES_PER_ACL - 1)
+        linear_time = time_decisions(collection.decide_authorization, path)
+        indexed_time = time_decisions(index.decide_authorization, path)
+        print "%6s  %14.2f  %14.2f" % (acl_count, linear_time * 1000000,
+                                       indexed_time * 1000000)
+
+
+if __name__ == "__main__":
+    main()
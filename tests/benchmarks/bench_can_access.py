@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2010, 2degrees Limited <gustavonarea@2degreesnetwork.com>.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the BSD-like license at
+# http://www.repoze.org/LICENSE.txt.  A copy of the license should accompany
+# this distribution.  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL
+# EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND
+# FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Time taken to check the access to the links in a navigation menu, one by one
+and all at once.
+
+"""
+
+from timeit import Timer
+
+# The Django settings are defined by the test suite:
+from tests import Request, make_user
+
+from repoze.what.acl import ACL, ACLCollection
+
+from repoze.what.plugins.dj import (RepozeWhatMiddleware, can_access,
+    can_access_many)
+from tests.fixtures.sampledjango.app1.authz import control as app1_control
+from tests.fixtures.sampledjango.app2.authz import control as app2_control
+
+
+LINK_COUNT = 100
+
+ACL_COUNT = 100
+
+REPETITIONS = 100
+
+
+def make_collection():
+    collection = ACLCollection()
+    for acl_number in range(ACL_COUNT):
+        acl = ACL("/other-app%s" % acl_number)
+        acl.deny("/", reason="Unknown view")
+        collection.add_acl(acl)
+    collection.add_acl(app1_control)
+    collection.add_acl(app2_control)
+    return collection
+
+
+def make_request():
+    request = Request({'PATH_INFO': "/"}, make_user(None))
+    RepozeWhatMiddleware()._set_request_up(request)
+    request.environ['repoze.what.global_control'] = make_collection()
+    return request
+
+
+def check_one_by_one(paths, request):
+    return dict([(path, can_access(path, request)) for path in paths])
+
+
+def time_checks(check, paths, request):
+    timer = Timer(lambda: check(paths, request))
+    return min(timer.repeat(3, REPETITIONS)) / REPETITIONS
+
+
+def main():
+    paths = ["/app1/blog/%s" % number for number in range(LINK_COUNT / 2)]
+    paths.extend(["/app2/nothing/%s" % number
+                  for number in range(LINK_COUNT / 2)])
+    request = make_request()
+    assert check_one_by_one(paths, request) == can_access_many(paths, request)
+    
+    print "%16s  %16s" % ("One by one (ms)", "All at once (ms)")
+    one_by_one_time = time_checks(check_one_by_one, paths, request)
+    all_at_once_time = time_checks(can_access_many, paths, request)
+    print "%16.2f  %16.2f" % (one_by_one_time * 1000, all_at_once_time * 1000)
+
+
+if __name__ == "__main__":
+    main()
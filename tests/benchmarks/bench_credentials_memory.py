@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2010, 2degrees Limited <gustavonarea@2degreesnetwork.com>.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the BSD-like license at
+# http://www.repoze.org/LICENSE.txt.  A copy of the license should accompany
+# this distribution.  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL
+# EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND
+# FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Memory taken by the credentials of each request, as a dictionary and as
+:class:`FrozenCredentials`.
+
+The groups and the permissions are shared by all the credentials, so only the
+container is measured. The memory allocated is measured with
+:mod:`tracemalloc` if it's available (it's included in Python 3.4+ and can be
+installed with ``pytracemalloc`` on older versions), or estimated with
+:func:`sys.getsizeof` otherwise.
+
+"""
+
+import sys
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from repoze.what.plugins.dj.credentials import (FrozenCredentials,
+    make_lazy_credentials)
+
+
+REPETITIONS = 10000
+
+
+def make_dictionary(groups, permissions):
+    credentials = {'repoze.what.userid': "foo"}
+    credentials['groups'] = groups
+    credentials['permissions'] = permissions
+    return credentials
+
+
+def make_frozen_credentials(groups, permissions):
+    return FrozenCredentials({'repoze.what.userid': "foo"}, None,
+                             groups=groups, permissions=permissions)
+
+
+def measure_allocations(factory):
+    (groups, permissions) = make_lazy_credentials(lambda: ((), ()))
+    if tracemalloc is None:
+        credentials = factory(groups, permissions)
+        return sys.getsizeof(credentials)
+    
+    tracemalloc.start()
+    try:
+        (initial_size, initial_peak) = tracemalloc.get_traced_memory()
+        all_credentials = [factory(groups, permissions) for repetition in
+                           range(REPETITIONS)]
+        (final_size, peak) = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # The list which keeps the credentials alive is not taken into account:
+    return (final_size - initial_size - sys.getsizeof(all_credentials)) / \
+        float(REPETITIONS)
+
+
+def main():
+    print "%20s  %22s" % ("Credentials", "Memory per request (B)")
+    for (name, factory) in (("Dictionary", make_dictionary),
+                            ("FrozenCredentials", make_frozen_credentials)):
+        print "%20s  %22.1f" % (name, measure_allocations(factory))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2010, 2degrees Limited <gustavonarea@2degreesnetwork.com>.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the BSD-like license at
+# http://www.repoze.org/LICENSE.txt.  A copy of the license should accompany
+# this distribution.  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL
+# EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND
+# FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+CPU time spent on the requests denied regardless of the view, with and
+without early rejection.
+
+"""
+
+from timeit import Timer
+
+from django.conf import settings
+from django.core.urlresolvers import resolve
+
+# The Django settings are defined by the test suite:
+from tests import Request, make_user
+
+from repoze.what.plugins.dj import RepozeWhatMiddleware
+
+
+REPETITIONS = 1000
+
+DENIED_PATH = "/app1/admin"
+
+
+def make_middleware(early_rejection):
+    settings.AUTHZ_EARLY_REJECTION = early_rejection
+    try:
+        return RepozeWhatMiddleware()
+    finally:
+        del settings.AUTHZ_EARLY_REJECTION
+
+
+def handle_request(middleware):
+    request = Request({'PATH_INFO': DENIED_PATH}, make_user(None))
+    response = middleware.process_request(request)
+    if response is None:
+        (view, view_args, view_kwargs) = resolve(request.path_info)
+        response = middleware.process_view(request, view, view_args,
+                                           view_kwargs)
+    assert response is not None
+
+
+def time_requests(middleware):
+    timer = Timer(lambda: handle_request(middleware))
+    return min(timer.repeat(3, REPETITIONS)) / REPETITIONS
+
+
+def main():
+    print "%14s  %14s" % ("Late (us)", "Early (us)")
+    late_time = time_requests(make_middleware(False))
+    early_time = time_requests(make_middleware(True))
+    print "%14.2f  %14.2f" % (late_time * 1000000, early_time * 1000000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2010, 2degrees Limited <gustavonarea@2degreesnetwork.com>.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the BSD-like license at
+# http://www.repoze.org/LICENSE.txt.  A copy of the license should accompany
+# this distribution.  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL
+# EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND
+# FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Time and memory taken by :func:`can_access`, with requests forged by
+:func:`forge_request` and with environs which read from the current one.
+
+The memory allocated is only measured if :mod:`tracemalloc` is available
+(it's included in Python 3.4+ and can be installed with ``pytracemalloc`` on
+older versions).
+
+"""
+
+from timeit import Timer
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from django.conf import settings
+
+# The Django settings are defined by the test suite:
+from tests import Request, make_user
+from tests.fixtures.sampledjango import mock_view
+
+from repoze.what.plugins.dj import RepozeWhatMiddleware, can_access
+
+
+HEADER_COUNT = 50
+
+REPETITIONS = 1000
+
+PATH = "/app1/blog"
+
+
+def make_request():
+    environ = {'PATH_INFO': "/"}
+    for header_number in range(HEADER_COUNT):
+        environ['HTTP_X_HEADER_%s' % header_number] = "x" * 100
+    request = Request(environ, make_user(None))
+    RepozeWhatMiddleware()._set_request_up(request)
+    return request
+
+
+def check_access(request):
+    can_access(PATH, request, mock_view, (), {})
+
+
+def time_checks(request):
+    timer = Timer(lambda: check_access(request))
+    return min(timer.repeat(3, REPETITIONS)) / REPETITIONS
+
+
+def measure_allocations(request):
+    if tracemalloc is None:
+        return None
+    tracemalloc.start()
+    try:
+        (initial_size, initial_peak) = tracemalloc.get_traced_memory()
+        for repetition in range(REPETITIONS):
+            check_access(request)
+        (final_size, peak) = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - initial_size
+
+
+def main():
+    print "%12s  %10s  %16s" % ("Mode", "Time (us)", "Peak memory (KB)")
+    for lightweight in (False, True):
+        settings.AUTHZ_LIGHTWEIGHT_FORGED_REQUESTS = lightweight
+        request = make_request()
+        check_time = time_checks(request)
+        allocations = measure_allocations(request)
+        if allocations is None:
+            allocations = "n/a"
+        else:
+            allocations = "%.2f" % (allocations / 1024.0)
+        mode = lightweight and "Lightweight" or "Default"
+        print "%12s  %10.2f  %16s" % (mode, check_time * 1000000, allocations)
+    del settings.AUTHZ_LIGHTWEIGHT_FORGED_REQUESTS
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2010, 2degrees Limited <gustavonarea@2degreesnetwork.com>.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the BSD-like license at
+# http://www.repoze.org/LICENSE.txt.  A copy of the license should accompany
+# this distribution.  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL
+# EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND
+# FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Time taken to import the public objects of the plugin, each in a new
+interpreter, along with the number of modules loaded by the import.
+
+"""
+
+import os
+from subprocess import PIPE, Popen
+import sys
+
+
+REPETITIONS = 10
+
+IMPORT_STATEMENTS = (
+    "import repoze.what.plugins.dj",
+    "from repoze.what.plugins.dj import IS_STAFF",
+    "from repoze.what.plugins.dj import require",
+    "from repoze.what.plugins.dj import RepozeWhatMiddleware",
+    )
+
+_PROJECT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+_CODE_TEMPLATE = """
+import sys
+from time import time
+initial_module_count = len(sys.modules)
+start = time()
+%s
+print time() - start, len(sys.modules) - initial_module_count
+"""
+
+
+def time_import(import_statement):
+    code = _CODE_TEMPLATE % import_statement
+    environ = dict(os.environ)
+    environ['DJANGO_SETTINGS_MODULE'] = "tests.fixtures.sampledjango.settings"
+    process = Popen([sys.executable, "-c", code], stdout=PIPE,
+                    cwd=_PROJECT_DIRECTORY, env=environ)
+    (output, error_output) = process.communicate()
+    (import_time, module_count) = output.split()
+    return (float(import_time), int(module_count))
+
+
+def main():
+    print "%58s  %10s  %7s" % ("Import", "Time (ms)", "Modules")
+    for import_statement in IMPORT_STATEMENTS:
+        measurements = [time_import(import_statement) for repetition in
+                        range(REPETITIONS)]
+        import_time = min([import_time for (import_time, module_count) in
+                           measurements])
+        module_count = measurements[0][1]
+        print "%58s  %10.2f  %7d" % (import_statement, import_time * 1000,
+                                     module_count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2010, 2degrees Limited <gustavonarea@2degreesnetwork.com>.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the BSD-like license at
+# http://www.repoze.org/LICENSE.txt.  A copy of the license should accompany
+# this distribution.  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL
+# EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND
+# FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Time and memory taken to set up the requests of authenticated users for
+:mod:`repoze.what`, with :func:`setup_request` and in place.
+
+The memory allocated is only measured if :mod:`tracemalloc` is available
+(it's included in Python 3.4+ and can be installed with ``pytracemalloc`` on
+older versions).
+
+"""
+
+from timeit import Timer
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from django.conf import settings
+
+# The Django settings are defined by the test suite:
+from tests import Request, make_user
+
+from repoze.what.plugins.dj import RepozeWhatMiddleware
+
+
+HEADER_COUNT = 50
+
+REPETITIONS = 1000
+
+
+def make_environ():
+    environ = {'PATH_INFO': "/app1/blog"}
+    for header_number in range(HEADER_COUNT):
+        environ['HTTP_X_HEADER_%s' % header_number] = "x" * 100
+    return environ
+
+
+def set_request_up(middleware, environ, user):
+    request = Request(dict(environ), user)
+    middleware._set_request_up(request)
+
+
+def time_setup(middleware, environ, user):
+    timer = Timer(lambda: set_request_up(middleware, environ, user))
+    return min(timer.repeat(3, REPETITIONS)) / REPETITIONS
+
+
+def measure_allocations(middleware, environ, user):
+    if tracemalloc is None:
+        return None
+    tracemalloc.start()
+    try:
+        (initial_size, initial_peak) = tracemalloc.get_traced_memory()
+        for repetition in range(REPETITIONS):
+            set_request_up(middleware, environ, user)
+        (final_size, peak) = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - initial_size
+
+
+def main():
+    environ = make_environ()
+    user = make_user("foo", ("g1", ), ("p1", ))
+    print "%12s  %10s  %16s" % ("Mode", "Time (us)", "Peak memory (KB)")
+    for inplace_environ in (False, True):
+        settings.AUTHZ_INPLACE_ENVIRON = inplace_environ
+        middleware = RepozeWhatMiddleware()
+        setup_time = time_setup(middleware, environ, user)
+        allocations = measure_allocations(middleware, environ, user)
+        if allocations is None:
+            allocations = "n/a"
+        else:
+            allocations = "%.2f" % (allocations / 1024.0)
+        mode = inplace_environ and "In place" or "setup_request"
+        print "%12s  %10.2f  %16s" % (mode, setup_time * 1000000, allocations)
+    del settings.AUTHZ_INPLACE_ENVIRON
+
+
+if __name__ == "__main__":
+    main()
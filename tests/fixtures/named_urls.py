@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2010, 2degrees Limited <gustavonarea@2degreesnetwork.com>.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the BSD-like license at
+# http://www.repoze.org/LICENSE.txt.  A copy of the license should accompany
+# this distribution.  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL
+# EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND
+# FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+URL configuration with named URL patterns, for the tests of
+:func:`repoze.what.plugins.dj.can_access_view`.
+
+"""
+
+from django.conf.urls.defaults import patterns, url
+
+
+def blog_post_view(request, post_id):
+    return "Blog post"
+
+
+def blog_index_view(request, page):
+    return "Blog index"
+
+
+def blog_archive_view(request):
+    return "Blog archive"
+
+
+def admin_view(request):
+    return "Admin"
+
+
+urlpatterns = patterns('',
+    url(r'^blog/(?P<post_id>\d+)/$', blog_post_view, name="blog-post"),
+    url(r'^blog/$', blog_index_view, {'page': "1"}, name="blog-index"),
+    url(r'^blog/archive/$', blog_archive_view, name="blog.archive"),
+    url(r'^admin/$', admin_view, name="admin"),
+    )
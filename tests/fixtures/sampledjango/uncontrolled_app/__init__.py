@@ -0,0 +1 @@
+"""Mock app with an authz module but no authz control."""
\ No newline at end of file
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""
+Authorization module without a control, for mock app 3.
+
+"""
+
+from repoze.what.predicates import not_anonymous
+
+authenticated = not_anonymous()
@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2010, 2degrees Limited <gustavonarea@2degreesnetwork.com>.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the BSD-like license at
+# http://www.repoze.org/LICENSE.txt.  A copy of the license should accompany
+# this distribution.  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL
+# EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND
+# FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Tests for the introspection of the authorization controls.
+
+"""
+
+from nose.tools import eq_, ok_, assert_false
+
+from django.core.urlresolvers import RegexURLPattern, RegexURLResolver
+from repoze.what.acl import ACL, ACLCollection
+from repoze.what.predicates import in_group, has_permission
+
+from repoze.what.plugins.dj.predicates import GROUPS, PERMISSIONS, REQUEST
+from repoze.what.plugins.dj._acls import (get_acls, get_base_path,
+    get_predicates, get_control_dependencies, get_path_dependencies,
+    replace_predicates, restrict_collection, has_default_decision, PathCoverage, PathIndex,
+    ViewIndex, map_url_patterns)
+
+from tests import MockPredicate
+
+
+class TestIntrospection(object):
+    """Tests for the functions which find what's inside the controls."""
+    
+    def setUp(self):
+        self.admins_predicate = in_group("admins")
+        self.acl = ACL("/blog")
+        self.acl.allow("/posts")
+        self.acl.deny("/admin", self.admins_predicate)
+        self.collection = ACLCollection()
+        self.collection.add_acl(self.acl)
+    
+    def test_acls(self):
+        eq_(get_acls(self.collection), [self.acl])
+        eq_(get_acls(self.acl), None)
+    
+    def test_base_path(self):
+        eq_(get_base_path(self.acl), "/blog")
+        eq_(get_base_path(self.collection), None)
+        eq_(get_base_path(object()), None)
+    
+    def test_predicates(self):
+        eq_(get_predicates(self.acl), [self.admins_predicate])
+        eq_(get_predicates(self.collection), None)
+    
+    def test_control_dependencies(self):
+        eq_(get_control_dependencies(self.acl), set([GROUPS]))
+        eq_(get_control_dependencies(self.collection), set([GROUPS]))
+        eq_(get_control_dependencies(object()), set([REQUEST]))
+    
+    def test_path_dependencies(self):
+        other_acl = ACL("/forum")
+        other_acl.allow("/", has_permission("post"))
+        self.collection.add_acl(other_acl)
+        eq_(get_path_dependencies(self.collection, "/blog/admin"),
+            set([GROUPS]))
+        eq_(get_path_dependencies(self.collection, "/forum/"),
+            set([PERMISSIONS]))
+        eq_(get_path_dependencies(self.collection, "/"), set())
+    
+    def test_path_dependencies_with_unknown_acl(self):
+        self.collection.add_acl(object())
+        eq_(get_path_dependencies(self.collection, "/"), set([REQUEST]))
+    
+    def test_path_dependencies_with_request_dependent_predicate(self):
+        self.acl.allow("/feed", MockPredicate())
+        eq_(get_path_dependencies(self.collection, "/blog/feed"),
+            set([GROUPS, REQUEST]))
+    
+    def test_replaced_predicates(self):
+        replaced_predicate = MockPredicate()
+        replace_predicates(self.collection, lambda p: replaced_predicate)
+        eq_(get_predicates(self.acl), [replaced_predicate])
+    
+    def test_restricted_collection(self):
+        other_acl = ACL("/forum")
+        self.collection.add_acl(other_acl)
+        restricted_collection = restrict_collection(self.collection,
+                                                    [other_acl])
+        eq_(get_acls(restricted_collection), [other_acl])
+        eq_(get_acls(self.collection), [self.acl, other_acl])
+    
+    def test_default_decision(self):
+        assert_false(has_default_decision(self.collection))
+        ok_(has_default_decision(MockCollection()))
+
+
+class TestPathCoverage(object):
+    """Tests for :class:`PathCoverage`."""
+    
+    def setUp(self):
+        self.collection = ACLCollection()
+        self.collection.add_acl(ACL("/blog"))
+        self.collection.add_acl(ACL("/forum"))
+        self.coverage = PathCoverage(self.collection)
+    
+    def test_covered_paths(self):
+        ok_(self.coverage("/blog"))
+        ok_(self.coverage("/blog/posts"))
+        ok_(self.coverage("/forum/"))
+    
+    def test_uncovered_paths(self):
+        assert_false(self.coverage("/"))
+        assert_false(self.coverage("/wiki/blog"))
+    
+    def test_acls_added_later(self):
+        assert_false(self.coverage("/wiki"))
+        self.collection.add_acl(ACL("/wiki"))
+        ok_(self.coverage("/wiki"))
+    
+    def test_unknown_acl(self):
+        self.collection.add_acl(object())
+        ok_(self.coverage("/wiki"))
+    
+    def test_unknown_collection(self):
+        ok_(PathCoverage(object())("/wiki"))
+    
+    def test_collection_with_default_decision(self):
+        collection = MockCollection()
+        collection.add_acl(ACL("/blog"))
+        ok_(PathCoverage(collection)("/wiki"))
+
+
+class TestPathIndex(object):
+    """Tests for :class:`PathIndex`."""
+    
+    def setUp(self):
+        self.collection = ACLCollection()
+        self.blog_acl = ACL("/blog")
+        self.blog_acl.allow("/posts")
+        self.blog_acl.deny("/", reason="blog")
+        self.blog_admin_acl = ACL("/blog/admin")
+        self.blog_admin_acl.deny("/", reason="blog admin")
+        self.blogs_acl = ACL("/blogs")
+        self.blogs_acl.deny("/", reason="blogs")
+        self.collection.add_acl(self.blog_acl)
+        self.collection.add_acl(self.blog_admin_acl)
+        self.collection.add_acl(self.blogs_acl)
+        self.index = PathIndex(self.collection)
+    
+    def test_same_decisions_as_collection(self):
+        paths = ("/", "/b", "/blog", "/blog/posts", "/blog/admin",
+                 "/blog/admin/users", "/blogs", "/blogs/1", "/forum")
+        for path in paths:
+            environ = {'PATH_INFO': path}
+            expected_decision = self.collection.decide_authorization(environ,
+                                                                     None)
+            decision = self.index.decide_authorization(environ, None)
+            eq_(_get_decision_summary(decision),
+                _get_decision_summary(expected_decision))
+    
+    def test_acls_are_evaluated_in_original_order(self):
+        decision = self.index.decide_authorization(
+            {'PATH_INFO': "/blog/admin/users"}, None)
+        eq_(decision.reason, "blog")
+    
+    def test_acls_added_later(self):
+        eq_(self.index.decide_authorization({'PATH_INFO': "/wiki"}, None),
+            None)
+        wiki_acl = ACL("/wiki")
+        wiki_acl.deny("/", reason="wiki")
+        self.collection.add_acl(wiki_acl)
+        decision = self.index.decide_authorization({'PATH_INFO': "/wiki"},
+                                                   None)
+        eq_(decision.reason, "wiki")
+    
+    def test_unknown_acl(self):
+        acl = MockACL()
+        self.collection.add_acl(acl)
+        self.index.decide_authorization({'PATH_INFO': "/wiki"}, None)
+        eq_(acl.paths, ["/wiki"])
+    
+    def test_unknown_collection(self):
+        collection = MockACL()
+        PathIndex(collection).decide_authorization({'PATH_INFO': "/"}, None)
+        eq_(collection.paths, ["/"])
+
+
+class TestViewIndex(object):
+    """Tests for :class:`ViewIndex`."""
+    
+    def setUp(self):
+        self.collection = ACLCollection()
+        self.blog_acl = ACL("/blog")
+        self.blog_acl.deny("/admin", reason="blog")
+        self.forum_acl = ACL("/forum/admin")
+        self.forum_acl.deny("/", reason="forum")
+        self.collection.add_acl(self.blog_acl)
+        self.collection.add_acl(self.forum_acl)
+        self.urlconf = [
+            RegexURLResolver(r"^blog/", [
+                RegexURLPattern(r"^admin/$", blog_view),
+                ]),
+            RegexURLResolver(r"^forum/", [
+                RegexURLPattern(r"^(?P<section>\w+)/$", forum_view),
+                ]),
+            RegexURLPattern(r"^about/$", about_view),
+            ]
+        self.index = ViewIndex(self.collection, self.urlconf)
+    
+    def test_view_under_acl_base_path(self):
+        eq_(get_acls(self.index.get_collection(blog_view)), [self.blog_acl])
+    
+    def test_view_above_acl_base_path(self):
+        eq_(get_acls(self.index.get_collection(forum_view)), [self.forum_acl])
+    
+    def test_view_without_acls(self):
+        eq_(get_acls(self.index.get_collection(about_view)), [])
+    
+    def test_same_decisions_as_collection(self):
+        paths_and_views = (("/blog/admin/", blog_view),
+                           ("/forum/admin/", forum_view),
+                           ("/forum/general/", forum_view),
+                           ("/about/", about_view))
+        for (path, view) in paths_and_views:
+            environ = {'PATH_INFO': path}
+            expected_decision = self.collection.decide_authorization(environ,
+                                                                     view)
+            decision = self.index.get_collection(view).decide_authorization(
+                environ, view)
+            eq_(_get_decision_summary(decision),
+                _get_decision_summary(expected_decision))
+    
+    def test_unknown_view(self):
+        eq_(self.index.get_collection(object()), None)
+    
+    def test_unhashable_view(self):
+        eq_(self.index.get_collection([]), None)
+    
+    def test_acls_added_later(self):
+        about_acl = ACL("/about")
+        self.collection.add_acl(about_acl)
+        eq_(get_acls(self.index.get_collection(about_view)), [about_acl])
+    
+    def test_acl_with_unknown_base_path(self):
+        acl = MockACL()
+        self.collection.add_acl(acl)
+        eq_(get_acls(self.index.get_collection(about_view)), [acl])
+    
+    def test_broken_urlconf(self):
+        index = ViewIndex(self.collection, "tests.non_existing_urls")
+        eq_(index.get_collection(blog_view), None)
+    
+    def test_unknown_collection(self):
+        eq_(ViewIndex(object(), self.urlconf).get_collection(blog_view), None)
+
+
+class TestURLPatternMapping(object):
+    """Tests for :func:`map_url_patterns`."""
+    
+    def setUp(self):
+        self.collection = ACLCollection()
+        self.blog_acl = ACL("/blog")
+        self.collection.add_acl(self.blog_acl)
+        self.urlconf = [
+            RegexURLResolver(r"^blog/", [
+                RegexURLPattern(r"^admin/$", blog_view),
+                ]),
+            RegexURLPattern(r"^about/$", about_view),
+            ]
+    
+    def test_mapping(self):
+        eq_(map_url_patterns(self.collection, self.urlconf),
+            [(r"^/blog/admin/$", blog_view, [self.blog_acl]),
+             (r"^/about/$", about_view, [])])
+    
+    def test_acl_with_unknown_base_path(self):
+        acl = MockACL()
+        self.collection.add_acl(acl)
+        mapping = map_url_patterns(self.collection, self.urlconf)
+        eq_([acls for (regex, view, acls) in mapping],
+            [[self.blog_acl, acl], [acl]])
+    
+    def test_unknown_collection(self):
+        mapping = map_url_patterns(object(), self.urlconf)
+        eq_([acls for (regex, view, acls) in mapping], [[], []])
+
+
+def _get_decision_summary(decision):
+    if decision is None:
+        return None
+    return (decision.allow, decision.reason)
+
+
+#{ Mock objects
+
+
+def blog_view(request):
+    pass
+
+
+def forum_view(request):
+    pass
+
+
+def about_view(request):
+    pass
+
+
+
+class MockACL(object):
+    """
+    Authorization control whose type is unknown and which records the paths
+    it gets.
+    
+    """
+    
+    def __init__(self):
+        self.paths = []
+    
+    def decide_authorization(self, environ, view):
+        self.paths.append(environ['PATH_INFO'])
+        return None
+
+
+
+class MockCollection(ACLCollection):
+    """ACL collection which denies authorization by default."""
+    
+    def decide_authorization(self, environ, view):
+        decision = super(MockCollection, self).decide_authorization(environ,
+                                                                    view)
+        if decision is None:
+            decision = object()
+        return decision
+
+
+#}
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2010, 2degrees Limited <gustavonarea@2degreesnetwork.com>.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the BSD-like license at
+# http://www.repoze.org/LICENSE.txt.  A copy of the license should accompany
+# this distribution.  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL
+# EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND
+# FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Tests for the credentials caches.
+
+"""
+
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from nose.tools import eq_, ok_
+
+from django.contrib.auth.models import User, Group, Permission
+from django.core.cache import get_cache
+from django.db.models.signals import m2m_changed, post_save, post_delete
+
+from repoze.what.plugins.dj.cache import (LocalCredentialsCache,
+    SharedCredentialsCache, connect_invalidation_signals)
+from repoze.what.plugins.dj.credentials import InternedSet
+
+
+class TestLocalCredentialsCache(object):
+    """Tests for :class:`LocalCredentialsCache`."""
+    
+    def setUp(self):
+        self.cache = LocalCredentialsCache(2, 60)
+    
+    def test_miss(self):
+        eq_(self.cache.get(1), None)
+        eq_(self.cache.misses, 1)
+    
+    def test_hit(self):
+        self.cache.set(1, ["g1"], ["p1", "p2"])
+        eq_(self.cache.get(1), (frozenset(["g1"]), frozenset(["p1", "p2"])))
+        eq_(self.cache.hits, 1)
+    
+    def test_names_are_interned(self):
+        """The cached names must keep their bitsets between requests."""
+        self.cache.set(1, ["g1"], ["p1"])
+        (groups, permissions) = self.cache.get(1)
+        ok_(isinstance(groups, InternedSet))
+        ok_(isinstance(permissions, InternedSet))
+        ok_(self.cache.get(1)[0] is groups)
+    
+    def test_size_is_bounded(self):
+        self.cache.set(1, [], [])
+        self.cache.set(2, [], [])
+        self.cache.set(3, [], [])
+        eq_(self.cache.get(1), None)
+        ok_(self.cache.get(3) is not None)
+    
+    def test_invalidation(self):
+        self.cache.set(1, [], [])
+        self.cache.set(2, [], [])
+        self.cache.invalidate(1)
+        eq_(self.cache.get(1), None)
+        ok_(self.cache.get(2) is not None)
+    
+    def test_clearing(self):
+        self.cache.set(1, [], [])
+        self.cache.set(2, [], [])
+        self.cache.clear()
+        eq_(self.cache.get(1), None)
+        eq_(self.cache.get(2), None)
+    
+    def test_loading(self):
+        loader = MockLoader(["g1"], ["p1"])
+        eq_(self.cache.load(1, loader), (frozenset(["g1"]), frozenset(["p1"])))
+        eq_(self.cache.load(1, loader), (frozenset(["g1"]), frozenset(["p1"])))
+        eq_(loader.calls, 1)
+        eq_(self.cache.hits, 1)
+        eq_(self.cache.misses, 1)
+    
+    def test_invalidation_while_loading(self):
+        """
+        The credentials must not be cached if they changed while being loaded.
+        
+        """
+        loader = MockLoader([], [], lambda: self.cache.invalidate(2))
+        self.cache.load(1, loader)
+        eq_(self.cache.get(1), None)
+
+
+class BaseSharedCredentialsCacheTester(object):
+    """Base test case for :class:`SharedCredentialsCache`."""
+    
+    def setUp(self):
+        self.cache = SharedCredentialsCache(self._make_django_cache(), 60)
+        self.loader = MockLoader(["g1"], ["p1"])
+    
+    def _make_django_cache(self):
+        raise NotImplementedError
+    
+    def test_miss(self):
+        credentials = self.cache.load(1, self.loader)
+        eq_(credentials, (frozenset(["g1"]), frozenset(["p1"])))
+        eq_(self.loader.calls, 1)
+        eq_(self.cache.misses, 1)
+        eq_(self.cache.hits, 0)
+    
+    def test_hit(self):
+        self.cache.load(1, self.loader)
+        credentials = self.cache.load(1, self.loader)
+        eq_(credentials, (frozenset(["g1"]), frozenset(["p1"])))
+        eq_(self.loader.calls, 1)
+        eq_(self.cache.hits, 1)
+    
+    def test_users_are_cached_separately(self):
+        self.cache.load(1, self.loader)
+        self.cache.load(2, self.loader)
+        eq_(self.loader.calls, 2)
+    
+    def test_invalidation(self):
+        self.cache.load(1, self.loader)
+        self.cache.load(2, self.loader)
+        self.cache.invalidate(1)
+        self.cache.load(1, self.loader)
+        self.cache.load(2, self.loader)
+        eq_(self.loader.calls, 3)
+    
+    def test_clearing(self):
+        self.cache.load(1, self.loader)
+        self.cache.load(2, self.loader)
+        self.cache.clear()
+        self.cache.load(1, self.loader)
+        self.cache.load(2, self.loader)
+        eq_(self.loader.calls, 4)
+    
+    def test_invalidation_before_caching(self):
+        """Invalidating credentials which are not cached must be harmless."""
+        self.cache.invalidate(1)
+        self.cache.clear()
+        self.cache.load(1, self.loader)
+        self.cache.load(1, self.loader)
+        eq_(self.loader.calls, 1)
+    
+    def test_invalidation_while_loading(self):
+        """
+        The credentials must not be valid if they changed while being loaded.
+        
+        """
+        loader = MockLoader([], [], lambda: self.cache.invalidate(1))
+        self.cache.load(1, loader)
+        self.cache.load(1, self.loader)
+        eq_(self.loader.calls, 1)
+    
+    def test_evicted_generation(self):
+        """
+        Old snapshots must not become valid if the generation is evicted.
+        
+        """
+        self.cache.load(1, self.loader)
+        self.cache.invalidate(1)
+        self.cache._cache.delete("repoze.what.credentials.generation.1")
+        self.cache.load(1, self.loader)
+        eq_(self.loader.calls, 2)
+
+
+class TestSharedCredentialsCacheInMemory(BaseSharedCredentialsCacheTester):
+    """Tests for :class:`SharedCredentialsCache` with the locmem backend."""
+    
+    def _make_django_cache(self):
+        return get_cache("locmem://")
+    
+    def test_cache_name(self):
+        cache = SharedCredentialsCache("locmem://")
+        cache.load(1, self.loader)
+        cache.load(1, self.loader)
+        eq_(cache.hits, 1)
+
+
+class TestSharedCredentialsCacheInFilesystem(BaseSharedCredentialsCacheTester):
+    """Tests for :class:`SharedCredentialsCache` with the filebased backend."""
+    
+    def setUp(self):
+        self.cache_directory = mkdtemp()
+        super(TestSharedCredentialsCacheInFilesystem, self).setUp()
+    
+    def tearDown(self):
+        rmtree(self.cache_directory)
+    
+    def _make_django_cache(self):
+        return get_cache("file://%s" % self.cache_directory)
+
+
+class TestInvalidationSignals(object):
+    """Tests for :func:`connect_invalidation_signals`."""
+    
+    def setUp(self):
+        self.cache = MockCache()
+        connect_invalidation_signals(self.cache)
+    
+    def test_user_saved(self):
+        post_save.send(sender=User, instance=MockModel(1), created=False)
+        eq_(self.cache.invalidated, [1])
+    
+    def test_user_deleted(self):
+        post_delete.send(sender=User, instance=MockModel(1))
+        eq_(self.cache.invalidated, [1])
+    
+    def test_group_or_permission_changed(self):
+        post_save.send(sender=Group, instance=MockModel(1), created=False)
+        post_delete.send(sender=Permission, instance=MockModel(1))
+        eq_(self.cache.clearings, 2)
+        eq_(self.cache.invalidated, [])
+    
+    def test_groups_of_user_changed(self):
+        self._send_m2m_changed(User.groups.through, "post_add", False, [3])
+        eq_(self.cache.invalidated, [1])
+    
+    def test_permissions_of_user_changed(self):
+        self._send_m2m_changed(User.user_permissions.through, "post_remove",
+                               False, [3])
+        eq_(self.cache.invalidated, [1])
+    
+    def test_users_of_group_changed(self):
+        self._send_m2m_changed(User.groups.through, "post_add", True, [2, 3])
+        eq_(sorted(self.cache.invalidated), [2, 3])
+    
+    def test_users_of_group_cleared(self):
+        self._send_m2m_changed(User.groups.through, "post_clear", True, None)
+        eq_(self.cache.clearings, 1)
+    
+    def test_permissions_of_group_changed(self):
+        self._send_m2m_changed(Group.permissions.through, "post_add", False,
+                               [3])
+        eq_(self.cache.clearings, 1)
+    
+    def test_pre_change_actions_are_ignored(self):
+        self._send_m2m_changed(User.groups.through, "pre_add", False, [3])
+        eq_(self.cache.invalidated, [])
+    
+    def _send_m2m_changed(self, sender, action, reverse, pk_set):
+        if pk_set is not None:
+            pk_set = set(pk_set)
+        m2m_changed.send(sender=sender, instance=MockModel(1), action=action,
+                         reverse=reverse, model=None, pk_set=pk_set)
+
+
+#{ Mock objects
+
+
+class MockCache(object):
+
+    def __init__(self):
+        self.invalidated = []
+        self.clearings = 0
+    
+    def invalidate(self, user_id):
+        self.invalidated.append(user_id)
+    
+    def clear(self):
+        self.clearings += 1
+
+
+class MockLoader(object):
+
+    def __init__(self, groups, permissions, side_effect=None):
+        self.groups = groups
+        self.permissions = permissions
+        self.side_effect = side_effect
+        self.calls = 0
+    
+    def __call__(self):
+        self.calls += 1
+        if self.side_effect:
+            self.side_effect()
+        return (self.groups, self.permissions)
+
+
+class MockModel(object):
+
+    def __init__(self, pk):
+        self.pk = pk
+
+
+#}
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2010, 2degrees Limited <gustavonarea@2degreesnetwork.com>.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the BSD-like license at
+# http://www.repoze.org/LICENSE.txt.  A copy of the license should accompany
+# this distribution.  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL
+# EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND
+# FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Tests for the compilation of predicates.
+
+"""
+
+from nose.tools import eq_, ok_, assert_false
+
+from repoze.what.predicates import (All, Any, Not, in_group, in_all_groups,
+    in_any_group, has_permission, has_any_permission, not_anonymous)
+
+from repoze.what.plugins.dj import IS_STAFF
+from repoze.what.plugins.dj.compiler import (CompiledPredicate,
+    compile_predicate, get_evaluation_cost, ATTRIBUTE_COST, CREDENTIALS_COST,
+    DEFAULT_COST, _AdaptiveBranches)
+from repoze.what.plugins.dj.credentials import InternedSet
+from repoze.what.plugins.dj.predicates import GROUPS, PERMISSIONS, REQUEST
+
+from tests import MockPredicate
+
+
+class TestEvaluationCost(object):
+    """Tests for :func:`get_evaluation_cost`."""
+    
+    def test_attribute_predicates(self):
+        eq_(get_evaluation_cost(IS_STAFF), ATTRIBUTE_COST)
+        eq_(get_evaluation_cost(not_anonymous()), ATTRIBUTE_COST)
+    
+    def test_credentials_predicates(self):
+        eq_(get_evaluation_cost(in_group("admins")), CREDENTIALS_COST)
+    
+    def test_unknown_predicates(self):
+        eq_(get_evaluation_cost(MockPredicate()), DEFAULT_COST)
+    
+    def test_declared_cost(self):
+        predicate = MockPredicate()
+        predicate.evaluation_cost = 100
+        eq_(get_evaluation_cost(predicate), 100)
+    
+    def test_compound_predicates(self):
+        predicate = All(IS_STAFF, Not(in_group("admins")))
+        eq_(get_evaluation_cost(predicate), ATTRIBUTE_COST + CREDENTIALS_COST)
+
+
+class TestCompiledPredicate(object):
+    """Tests for :class:`CompiledPredicate`."""
+    
+    def test_leaf_predicate(self):
+        ok_(CompiledPredicate(MockPredicate()).check(MockRequest(), {}))
+        assert_false(CompiledPredicate(MockPredicate(False)).check(MockRequest(), {}))
+    
+    def test_all(self):
+        ok_(_evaluate(All(MockPredicate(), MockPredicate())))
+        assert_false(_evaluate(All(MockPredicate(), MockPredicate(False))))
+        ok_(_evaluate(All()))
+    
+    def test_any(self):
+        ok_(_evaluate(Any(MockPredicate(False), MockPredicate())))
+        assert_false(_evaluate(Any(MockPredicate(False),
+                                   MockPredicate(False))))
+        assert_false(_evaluate(Any()))
+    
+    def test_not(self):
+        ok_(_evaluate(Not(MockPredicate(False))))
+        assert_false(_evaluate(Not(MockPredicate())))
+    
+    def test_nested_predicates(self):
+        predicate = Any(All(MockPredicate(), Not(MockPredicate())),
+                        All(MockPredicate(), Any(MockPredicate(False),
+                                                 MockPredicate())))
+        ok_(_evaluate(predicate))
+    
+    def test_cheap_predicates_first(self):
+        calls = []
+        expensive_predicate = RecordingPredicate(calls, "expensive", False)
+        expensive_predicate.evaluation_cost = DEFAULT_COST * 2
+        cheap_predicate = RecordingPredicate(calls, "cheap", False)
+        cheap_predicate.evaluation_cost = ATTRIBUTE_COST
+        assert_false(_evaluate(All(expensive_predicate, cheap_predicate)))
+        eq_(calls, ["cheap"])
+    
+    def test_order_of_predicates_with_same_cost(self):
+        calls = []
+        predicate = Any(RecordingPredicate(calls, "first", False),
+                        RecordingPredicate(calls, "second", False),
+                        RecordingPredicate(calls, "third", True))
+        ok_(_evaluate(predicate))
+        eq_(calls, ["first", "second", "third"])
+    
+    def test_nested_predicates_of_same_type_are_merged(self):
+        calls = []
+        expensive_predicate = RecordingPredicate(calls, "expensive", True)
+        cheap_predicate = RecordingPredicate(calls, "cheap", True)
+        cheap_predicate.evaluation_cost = ATTRIBUTE_COST
+        predicate = Any(All(MockPredicate(), MockPredicate()),
+                        Any(expensive_predicate, cheap_predicate))
+        ok_(_evaluate(predicate))
+        eq_(calls, ["cheap"])
+    
+    def test_dependencies(self):
+        compiled_predicate = CompiledPredicate(All(in_group("admins"),
+                                                   MockPredicate()))
+        eq_(compiled_predicate.environ_dependencies, set([GROUPS, REQUEST]))
+    
+    def test_compiling_compiled_predicate(self):
+        compiled_predicate = compile_predicate(MockPredicate())
+        ok_(compile_predicate(compiled_predicate) is compiled_predicate)
+        nested_predicate = compile_predicate(Not(compiled_predicate))
+        assert_false(nested_predicate.check(MockRequest(), {}))
+
+
+class TestMembershipPredicates(object):
+    """Tests for the compiled predicates on groups and permissions."""
+    
+    def setUp(self):
+        self.credentials = {
+            GROUPS: InternedSet(["admins", "developers"]),
+            PERMISSIONS: InternedSet(["edit-post"]),
+            }
+    
+    def test_groups(self):
+        ok_(self._check(in_group("admins")))
+        assert_false(self._check(in_group("editors")))
+        ok_(self._check(in_all_groups("admins", "developers")))
+        assert_false(self._check(in_all_groups("admins", "editors")))
+        ok_(self._check(in_any_group("editors", "developers")))
+        assert_false(self._check(in_any_group("editors", "reviewers")))
+    
+    def test_permissions(self):
+        ok_(self._check(has_permission("edit-post")))
+        assert_false(self._check(has_permission("delete-post")))
+        ok_(self._check(has_any_permission("delete-post", "edit-post")))
+    
+    def test_plain_sets(self):
+        """Credentials which can't be represented as bitsets are supported."""
+        self.credentials = {GROUPS: set(["admins"]), PERMISSIONS: set()}
+        ok_(self._check(in_any_group("editors", "admins")))
+        assert_false(self._check(in_all_groups("editors", "admins")))
+        assert_false(self._check(has_permission("edit-post")))
+    
+    def test_missing_credentials(self):
+        self.credentials = {}
+        assert_false(self._check(in_group("admins")))
+    
+    def test_predicate_check_is_not_used(self):
+        predicate = in_group("admins")
+        predicate.check = None
+        ok_(self._check(predicate))
+    
+    def _check(self, predicate):
+        compiled_predicate = CompiledPredicate(predicate)
+        return compiled_predicate.check(MockRequest(), self.credentials)
+
+
+class TestAdaptiveMode(object):
+    """Tests for the compiled predicates which reorder their predicates."""
+    
+    def setUp(self):
+        # Every evaluation takes a millisecond:
+        self.original_clock = _AdaptiveBranches._clock
+        _AdaptiveBranches._clock = MockClock(0.001)
+    
+    def tearDown(self):
+        _AdaptiveBranches._clock = staticmethod(self.original_clock)
+    
+    def test_results(self):
+        ok_(_evaluate(All(MockPredicate(), MockPredicate()), 1))
+        assert_false(_evaluate(All(MockPredicate(), MockPredicate(False)), 1))
+        ok_(_evaluate(Any(MockPredicate(False), MockPredicate()), 1))
+        assert_false(_evaluate(Any(MockPredicate(False)), 1))
+        ok_(_evaluate(Not(Any(MockPredicate(False))), 1))
+    
+    def test_reordering(self):
+        calls = []
+        rarely_met_predicate = RecordingPredicate(calls, "rarely met", False)
+        often_met_predicate = RecordingPredicate(calls, "often met", True)
+        compiled_predicate = compile_predicate(
+            Any(rarely_met_predicate, often_met_predicate),
+            reordering_interval=2,
+            )
+        for index in range(2):
+            ok_(compiled_predicate.check(MockRequest(), {}))
+        del calls[:]
+        ok_(compiled_predicate.check(MockRequest(), {}))
+        eq_(calls, ["often met"])
+    
+    def test_no_reordering_before_interval(self):
+        calls = []
+        compiled_predicate = compile_predicate(
+            Any(RecordingPredicate(calls, "rarely met", False),
+                RecordingPredicate(calls, "often met", True)),
+            reordering_interval=10,
+            )
+        for index in range(3):
+            compiled_predicate.check(MockRequest(), {})
+        eq_(calls[-2:], ["rarely met", "often met"])
+    
+    def test_unevaluated_predicates_come_first(self):
+        calls = []
+        compiled_predicate = compile_predicate(
+            All(RecordingPredicate(calls, "first", False),
+                RecordingPredicate(calls, "second", False)),
+            reordering_interval=1,
+            )
+        compiled_predicate.check(MockRequest(), {})
+        del calls[:]
+        compiled_predicate.check(MockRequest(), {})
+        eq_(calls, ["second"])
+    
+    def test_description(self):
+        compiled_predicate = compile_predicate(
+            All(IS_STAFF, Not(Any(MockPredicate(False), MockPredicate())),
+                MockPredicate()),
+            reordering_interval=10,
+            )
+        compiled_predicate.check(MockRequest(), {})
+        eq_(compiled_predicate.describe(),
+            "All (1 evaluations)\n"
+            "  - IsStaff(): met 100.0%, 1.000 ms\n"
+            "  - MockPredicate(result=True): met 100.0%, 1.000 ms\n"
+            "  - Not(): met 0.0%, 5.000 ms\n"
+            "    Not\n"
+            "      Any (1 evaluations)\n"
+            "        - MockPredicate(result=False): met 0.0%, 1.000 ms\n"
+            "        - MockPredicate(result=True): met 100.0%, 1.000 ms")
+    
+    def test_description_in_static_mode(self):
+        eq_(compile_predicate(MockPredicate()).describe(),
+            "MockPredicate(result=True)")
+
+
+def _evaluate(predicate, reordering_interval=None):
+    compiled_predicate = compile_predicate(predicate, reordering_interval)
+    return compiled_predicate.check(MockRequest(), {})
+
+
+#{ Mock objects
+
+
+class RecordingPredicate(MockPredicate):
+    """Predicate which records its evaluation."""
+    
+    def __init__(self, calls, name, result):
+        self.calls = calls
+        self.name = name
+        super(RecordingPredicate, self).__init__(result)
+    
+    def check(self, request, credentials):
+        self.calls.append(self.name)
+        return super(RecordingPredicate, self).check(request, credentials)
+
+
+class MockRequest(object):
+
+    def __init__(self):
+        self.environ = {}
+        self.user = MockUser()
+
+
+class MockUser(object):
+
+    is_staff = True
+
+
+class MockClock(object):
+
+    def __init__(self, step):
+        self.step = step
+        self.now = 0
+    
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+
+#}
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2010, 2degrees Limited <gustavonarea@2degreesnetwork.com>.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the BSD-like license at
+# http://www.repoze.org/LICENSE.txt.  A copy of the license should accompany
+# this distribution.  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL
+# EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND
+# FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Tests for the credentials of Django users.
+
+"""
+
+from nose.tools import eq_, ok_, assert_false, assert_raises
+
+from repoze.what.plugins.dj.credentials import (NameInterner, NAME_INTERNER,
+    InternedSet, make_interned_set, LazyCredentialSet, FrozenCredentials,
+    BaseCredentialsLoader, BackendCredentialsLoader, make_lazy_credentials,
+    get_group_names)
+
+from tests import make_user
+
+
+class TestNameInterner(object):
+    """Tests for :class:`NameInterner`."""
+    
+    def setUp(self):
+        self.interner = NameInterner()
+    
+    def test_indexes(self):
+        eq_(self.interner.get_index("a"), 0)
+        eq_(self.interner.get_index("b"), 1)
+        eq_(self.interner.get_index("a"), 0)
+        eq_(len(self.interner), 2)
+    
+    def test_mask(self):
+        self.interner.get_index("a")
+        eq_(self.interner.get_mask(["c", "a"]), 0b101)
+        eq_(self.interner.get_mask([]), 0)
+        eq_(len(self.interner), 3)
+    
+    def test_large_mask(self):
+        names = ["name%s" % index for index in range(100)]
+        eq_(self.interner.get_mask(names), 2 ** 100 - 1)
+
+
+class TestInternedSet(object):
+    """Tests for :class:`InternedSet`."""
+    
+    def test_set(self):
+        interned_set = InternedSet(["a", "b"])
+        eq_(interned_set, frozenset(["a", "b"]))
+        eq_(hash(interned_set), hash(frozenset(["a", "b"])))
+    
+    def test_bits(self):
+        interned_set = InternedSet(["a", "b"])
+        eq_(interned_set.bits, NAME_INTERNER.get_mask(["a", "b"]))
+        eq_(InternedSet().bits, 0)
+    
+    def test_interning(self):
+        interned_set = InternedSet(["a"])
+        ok_(make_interned_set(interned_set) is interned_set)
+        ok_(isinstance(make_interned_set(["a"]), InternedSet))
+        eq_(make_interned_set(["a"]), interned_set)
+
+
+class TestLazyCredentialSet(object):
+    """Tests for the :class:`LazyCredentialSet`."""
+    
+    def setUp(self):
+        self.loader = MockLoader("a", "b", "c")
+        self.lazy_set = LazyCredentialSet(self.loader)
+    
+    def test_not_loaded_on_construction(self):
+        eq_(self.loader.calls, 0)
+        assert_false(self.lazy_set.loaded)
+    
+    def test_membership(self):
+        ok_("a" in self.lazy_set)
+        assert_false("z" in self.lazy_set)
+        ok_(self.lazy_set.loaded)
+    
+    def test_loaded_once(self):
+        len(self.lazy_set)
+        list(self.lazy_set)
+        "a" in self.lazy_set
+        eq_(self.loader.calls, 1)
+    
+    def test_comparison_with_builtin_sets(self):
+        eq_(self.lazy_set, set(["a", "b", "c"]))
+        eq_(set(["a", "b", "c"]), self.lazy_set)
+        ok_(self.lazy_set != set(["a"]))
+        ok_(set(["a"]) <= self.lazy_set)
+    
+    def test_set_operations(self):
+        intersection = self.lazy_set & set(["a", "z"])
+        eq_(intersection, frozenset(["a"]))
+        ok_(isinstance(intersection, frozenset))
+        eq_(self.lazy_set | set(["z"]), frozenset(["a", "b", "c", "z"]))
+        ok_(self.lazy_set.issuperset(["a", "b"]))
+        ok_(self.lazy_set.issubset(["a", "b", "c", "d"]))
+        eq_(self.lazy_set.intersection(["b", "z"]), frozenset(["b"]))
+    
+    def test_bits(self):
+        eq_(self.lazy_set.bits, NAME_INTERNER.get_mask(["a", "b", "c"]))
+        eq_(self.loader.calls, 1)
+    
+    def test_representation(self):
+        eq_(repr(self.lazy_set), "<LazyCredentialSet 'not loaded'>")
+        len(self.lazy_set)
+        eq_(repr(self.lazy_set), "<LazyCredentialSet ['a', 'b', 'c']>")
+
+
+class TestFrozenCredentials(object):
+    """Tests for :class:`FrozenCredentials`."""
+    
+    def setUp(self):
+        self.credentials = FrozenCredentials({
+            'repoze.what.userid': None,
+            'groups': frozenset(),
+            })
+    
+    def test_mapping(self):
+        eq_(self.credentials['repoze.what.userid'], None)
+        eq_(self.credentials.get('permissions'), None)
+        eq_(len(self.credentials), 2)
+        eq_(set(self.credentials.keys()), set(["repoze.what.userid", "groups"]))
+    
+    def test_immutability(self):
+        assert_raises(TypeError, self.credentials.__setitem__, "groups", None)
+    
+    def test_copy(self):
+        credentials = self.credentials.copy()
+        credentials['groups'] = set(["g1"])
+        eq_(self.credentials['groups'], frozenset())
+    
+    def test_no_instance_dictionary(self):
+        assert_false(hasattr(self.credentials, "__dict__"))
+        assert_raises(AttributeError, setattr, self.credentials, "user", None)
+    
+    def test_items_and_user(self):
+        user = make_user("foo")
+        credentials = FrozenCredentials(
+            {'repoze.what.userid': "foo", 'groups': set(), 'extra': 1},
+            user,
+            groups=frozenset(["g1"]),
+            )
+        ok_(credentials.user is user)
+        eq_(credentials['groups'], frozenset(["g1"]))
+        eq_(credentials['extra'], 1)
+        ok_("extra" in credentials)
+        assert_false("permissions" in credentials)
+        assert_raises(KeyError, credentials.__getitem__, "permissions")
+        eq_(credentials.copy(), {
+            'repoze.what.userid': "foo",
+            'groups': frozenset(["g1"]),
+            'extra': 1,
+            })
+    
+    def test_equality(self):
+        credentials = FrozenCredentials(self.credentials.copy(),
+                                        make_user(None))
+        eq_(credentials, self.credentials)
+        eq_(credentials, self.credentials.copy())
+        eq_(hash(credentials), hash(self.credentials))
+        ok_(credentials != FrozenCredentials({'repoze.what.userid': "foo"}))
+
+
+class TestLazyCredentials(object):
+    """Tests for :func:`make_lazy_credentials`."""
+    
+    def test_credentials_are_loaded_once(self):
+        loader = MockLoader(["g1"], ["p1"])
+        (groups, permissions) = make_lazy_credentials(loader)
+        eq_(loader.calls, 0)
+        eq_(groups, set(["g1"]))
+        eq_(permissions, set(["p1"]))
+        eq_(loader.calls, 1)
+
+
+class TestCredentialsLoaders(object):
+    """Tests for the credentials loaders."""
+    
+    def test_base_loader(self):
+        assert_raises(NotImplementedError, BaseCredentialsLoader(),
+                      make_user("foo"))
+    
+    def test_backend_loader(self):
+        user = make_user("foo", ("g1", "g2"), ("p1", ))
+        (groups, permissions) = BackendCredentialsLoader()(user)
+        eq_(set(groups), set(["g1", "g2"]))
+        eq_(set(permissions), set(["p1"]))
+
+
+def test_group_names():
+    user = make_user("foo", ("g1", "g2"))
+    eq_(get_group_names(user), ["g1", "g2"])
+
+
+#{ Mock objects
+
+
+class MockLoader(object):
+
+    def __init__(self, *items):
+        self.items = items
+        self.calls = 0
+    
+    def __call__(self):
+        self.calls += 1
+        return self.items
+
+
+#}
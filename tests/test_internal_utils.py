@@ -20,7 +20,10 @@ Unit tests for the miscellaneous utilities at
 
 from nose.tools import eq_, assert_raises
 
-from repoze.what.plugins.dj._utils import resolve_object
+from django.core.urlresolvers import RegexURLPattern, RegexURLResolver
+
+from repoze.what.plugins.dj._utils import (resolve_object, LRUCache,
+    get_literal_prefix, iter_views, iter_url_patterns, iter_view_defaults)
 
 from tests.fixtures.misc_objects import my_object
 
@@ -45,3 +48,193 @@ class TestResolveObject(object):
     def test_getting_none_object(self):
         object_ = resolve_object(FIXTURES_MODULE + "my_none")
         eq_(object_, None)
+
+
+class TestLRUCache(object):
+    """Tests for :class:`LRUCache`."""
+    
+    def setUp(self):
+        self.cache = LRUCache(2, 10)
+        self.cache._clock = lambda: self.now
+        self.now = 100
+    
+    def test_invalid_size(self):
+        assert_raises(ValueError, LRUCache, 0)
+    
+    def test_hit(self):
+        self.cache.set("a", 1)
+        eq_(self.cache.get("a"), 1)
+        eq_(self.cache.hits, 1)
+        eq_(self.cache.misses, 0)
+    
+    def test_miss(self):
+        eq_(self.cache.get("a"), None)
+        eq_(self.cache.get("a", "default"), "default")
+        eq_(self.cache.hits, 0)
+        eq_(self.cache.misses, 2)
+    
+    def test_least_recently_used_item_is_evicted(self):
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+        self.cache.get("a")
+        self.cache.set("c", 3)
+        eq_(self.cache.get("b"), None)
+        eq_(self.cache.get("a"), 1)
+        eq_(self.cache.get("c"), 3)
+        eq_(self.cache.evictions, 1)
+        eq_(len(self.cache), 2)
+    
+    def test_replacing_item_does_not_evict(self):
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+        self.cache.set("a", 3)
+        eq_(self.cache.get("a"), 3)
+        eq_(self.cache.get("b"), 2)
+        eq_(self.cache.evictions, 0)
+    
+    def test_expiration(self):
+        self.cache.set("a", 1)
+        self.now = 109
+        eq_(self.cache.get("a"), 1)
+        self.now = 110
+        eq_(self.cache.get("a"), None)
+        eq_(len(self.cache), 0)
+    
+    def test_no_expiration(self):
+        cache = LRUCache(2)
+        cache.set("a", 1)
+        eq_(cache.get("a"), 1)
+    
+    def test_deletion(self):
+        self.cache.set("a", 1)
+        self.cache.delete("a")
+        self.cache.delete("non-existing")
+        eq_(self.cache.get("a"), None)
+    
+    def test_clearing(self):
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+        self.cache.clear()
+        eq_(len(self.cache), 0)
+
+
+class TestLiteralPrefix(object):
+    """Tests for :func:`get_literal_prefix`."""
+    
+    def test_literal_regex(self):
+        eq_(get_literal_prefix(r"^blog/"), ("blog/", True))
+        eq_(get_literal_prefix(r"^blog/$"), ("blog/", True))
+        eq_(get_literal_prefix(r"^$"), ("", True))
+    
+    def test_escaped_characters(self):
+        eq_(get_literal_prefix(r"^feed\.xml$"), ("feed.xml", True))
+    
+    def test_groups(self):
+        eq_(get_literal_prefix(r"^posts/(?P<id>\d+)/$"), ("posts/", False))
+    
+    def test_character_classes(self):
+        eq_(get_literal_prefix(r"^posts/\d+"), ("posts/", False))
+        eq_(get_literal_prefix(r"^posts/[0-9]+"), ("posts/", False))
+    
+    def test_optional_characters(self):
+        eq_(get_literal_prefix(r"^posts?/"), ("post", False))
+        eq_(get_literal_prefix(r"^posts*/"), ("post", False))
+        eq_(get_literal_prefix(r"^posts{0,1}/"), ("post", False))
+    
+    def test_repeated_characters(self):
+        eq_(get_literal_prefix(r"^posts+/"), ("posts", False))
+    
+    def test_alternatives(self):
+        eq_(get_literal_prefix(r"^blog/|^forum/"), ("", False))
+    
+    def test_unanchored_regex(self):
+        eq_(get_literal_prefix(r"blog/"), ("", False))
+
+
+class TestViewIteration(object):
+    """Tests for :func:`iter_views`."""
+    
+    def test_flat_urlconf(self):
+        urlconf = [
+            RegexURLPattern(r"^blog/$", blog_view),
+            RegexURLPattern(r"^forum/", forum_view),
+            ]
+        eq_(list(iter_views(urlconf)), [(blog_view, "/blog/"),
+                                        (forum_view, "/forum/")])
+    
+    def test_included_urlconf(self):
+        urlconf = [
+            RegexURLResolver(r"^blog/", [
+                RegexURLPattern(r"^posts/", blog_view),
+                ]),
+            RegexURLResolver(r"^(?P<forum>\w+)/", [
+                RegexURLPattern(r"^threads/", forum_view),
+                ]),
+            ]
+        eq_(list(iter_views(urlconf)), [(blog_view, "/blog/posts/"),
+                                        (forum_view, "/")])
+    
+    def test_urlconf_name(self):
+        views = list(iter_views("tests.fixtures.sampledjango.urls"))
+        eq_([path_prefix for (view, path_prefix) in views],
+            ["/app1/blog", "/app1/admin", "/app1/secret", "/app2/secret",
+             "/app2/nothing"])
+
+
+class TestURLPatternIteration(object):
+    """Tests for :func:`iter_url_patterns`."""
+    
+    def test_flat_urlconf(self):
+        urlconf = [
+            RegexURLPattern(r"^blog/$", blog_view),
+            ]
+        eq_(list(iter_url_patterns(urlconf)),
+            [(r"^/blog/$", blog_view, "/blog/")])
+    
+    def test_included_urlconf(self):
+        urlconf = [
+            RegexURLResolver(r"^(?P<forum>\w+)/", [
+                RegexURLPattern(r"^threads/$", forum_view),
+                ]),
+            ]
+        eq_(list(iter_url_patterns(urlconf)),
+            [(r"^/(?P<forum>\w+)/threads/$", forum_view, "/")])
+
+
+class TestViewDefaultsIteration(object):
+    """Tests for :func:`iter_view_defaults`."""
+    
+    def test_flat_urlconf(self):
+        urlconf = [
+            RegexURLPattern(r"^blog/$", blog_view, {'page': 1}),
+            RegexURLPattern(r"^forum/$", forum_view),
+            ]
+        eq_([(pattern.callback, default_kwargs) for (pattern, default_kwargs)
+             in iter_view_defaults(urlconf)],
+            [(blog_view, {'page': 1}), (forum_view, {})])
+    
+    def test_included_urlconf(self):
+        urlconf = [
+            RegexURLResolver(r"^blog/", [
+                RegexURLPattern(r"^$", blog_view, {'page': 1}),
+                RegexURLPattern(r"^archive/$", blog_view,
+                                {'section': "archive"}),
+                ], {'section': "blog"}),
+            ]
+        eq_([default_kwargs for (pattern, default_kwargs)
+             in iter_view_defaults(urlconf)],
+            [{'section': "blog", 'page': 1}, {'section': "archive"}])
+
+
+#{ Mock objects
+
+
+def blog_view(request):
+    pass
+
+
+def forum_view(request):
+    pass
+
+
+#}
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2010, 2degrees Limited <gustavonarea@2degreesnetwork.com>.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the BSD-like license at
+# http://www.repoze.org/LICENSE.txt.  A copy of the license should accompany
+# this distribution.  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL
+# EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND
+# FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Tests for the Django management commands of the plugin.
+
+"""
+
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from nose.tools import eq_, ok_, assert_raises
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.core.urlresolvers import RegexURLPattern, RegexURLResolver
+from repoze.what.acl import ACL, ACLCollection
+
+from repoze.what.plugins.dj.management.commands import authz_manifest
+from repoze.what.plugins.dj.management.commands.authz_urls import (Command,
+    describe_url_mapping)
+from repoze.what.plugins.dj._manifest import read_manifest
+
+
+class TestURLMappingDescription(object):
+    """Tests for :func:`describe_url_mapping`."""
+    
+    def setUp(self):
+        self.collection = ACLCollection()
+        self.blog_acl = ACL("/blog")
+        self.collection.add_acl(self.blog_acl)
+        self.urlconf = [
+            RegexURLResolver(r"^blog/", [
+                RegexURLPattern(r"^admin/$", blog_view),
+                ]),
+            RegexURLPattern(r"^about/$", about_view),
+            ]
+    
+    def test_reachable_acls(self):
+        description = describe_url_mapping(self.collection, self.urlconf)
+        eq_(description,
+            "^/blog/admin/$ (tests.test_management.blog_view):\n"
+            "    ACL at /blog\n"
+            "^/about/$ (tests.test_management.about_view):\n"
+            "    No ACL applies\n")
+    
+    def test_unreachable_acls(self):
+        self.collection.add_acl(ACL("/forum"))
+        description = describe_url_mapping(self.collection, self.urlconf)
+        ok_(description.endswith("\nUnreachable ACLs:\n    ACL at /forum\n"))
+    
+    def test_command(self):
+        description = Command().handle_noargs()
+        ok_("^/app1/admin (tests.fixtures.sampledjango.<lambda>):\n"
+            "    ACL at /app1\n" in description)
+        ok_("Unreachable ACLs" not in description)
+
+
+class TestManifestCommand(object):
+    """Tests for the ``authz_manifest`` command."""
+    
+    def setUp(self):
+        self.manifest_directory = mkdtemp()
+        settings.AUTHZ_MANIFEST = os.path.join(self.manifest_directory,
+                                               "authz.json")
+    
+    def tearDown(self):
+        del settings.AUTHZ_MANIFEST
+        rmtree(self.manifest_directory)
+    
+    def test_manifest_is_written(self):
+        output = authz_manifest.Command().handle_noargs()
+        eq_(output,
+            "Secured applications written to %s: "
+            "tests.fixtures.sampledjango.app1, "
+            "tests.fixtures.sampledjango.app2\n" % settings.AUTHZ_MANIFEST)
+        eq_(read_manifest(settings.AUTHZ_MANIFEST, settings.INSTALLED_APPS),
+            ["tests.fixtures.sampledjango.app1",
+             "tests.fixtures.sampledjango.app2"])
+    
+    def test_unwritable_manifest(self):
+        settings.AUTHZ_MANIFEST = os.path.join(self.manifest_directory,
+                                               "non-existing", "authz.json")
+        assert_raises(CommandError, authz_manifest.Command().handle_noargs)
+    
+    def test_undefined_manifest(self):
+        settings.AUTHZ_MANIFEST = None
+        assert_raises(CommandError, authz_manifest.Command().handle_noargs)
+
+
+#{ Mock objects
+
+
+def blog_view(request):
+    pass
+
+
+def about_view(request):
+    pass
+
+
+#}
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2010, 2degrees Limited <gustavonarea@2degreesnetwork.com>.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the BSD-like license at
+# http://www.repoze.org/LICENSE.txt.  A copy of the license should accompany
+# this distribution.  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL
+# EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND
+# FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Tests for the discovery of the authorization controls of the applications.
+
+"""
+
+import json
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from nose.tools import eq_, ok_
+
+from django.conf import settings
+
+from repoze.what.plugins.dj._manifest import (find_authz_controls,
+    load_authz_controls, get_apps_hash, read_manifest, write_manifest,
+    _get_authz_module_mtime)
+
+from tests.fixtures.loggers import LoggingHandlerFixture
+from tests.fixtures.sampledjango.app1.authz import control as app1_control
+from tests.fixtures.sampledjango.app2.authz import control as app2_control
+
+
+APP1 = "tests.fixtures.sampledjango.app1"
+
+APP2 = "tests.fixtures.sampledjango.app2"
+
+UNSECURED_APP = "tests.fixtures.sampledjango.unsecured_app"
+
+UNCONTROLLED_APP = "tests.fixtures.sampledjango.uncontrolled_app"
+
+
+def test_finding_authz_controls():
+    eq_(find_authz_controls(settings.INSTALLED_APPS),
+        [(APP1, app1_control), (APP2, app2_control)])
+
+
+def test_authz_module_mtime():
+    ok_(_get_authz_module_mtime(APP1) is not None)
+    ok_(_get_authz_module_mtime(UNCONTROLLED_APP) is not None)
+    eq_(_get_authz_module_mtime(UNSECURED_APP), None)
+    eq_(_get_authz_module_mtime("tests.fixtures.named_urls"), None)
+    eq_(_get_authz_module_mtime("non_existing_app"), None)
+
+
+def test_apps_hash():
+    eq_(get_apps_hash([APP1, APP2]), get_apps_hash((APP1, APP2)))
+    ok_(get_apps_hash([APP1, APP2]) != get_apps_hash([APP2, APP1]))
+    ok_(get_apps_hash([APP1]) != get_apps_hash([APP1, APP2]))
+
+
+class TestManifest(object):
+    """Tests for the reading and writing of manifests."""
+    
+    def setUp(self):
+        self.log_fixture = LoggingHandlerFixture()
+        self.manifest_directory = mkdtemp()
+        self.manifest_path = os.path.join(self.manifest_directory,
+                                          "authz.json")
+    
+    def tearDown(self):
+        rmtree(self.manifest_directory)
+        self.log_fixture.undo()
+    
+    def test_writing_and_reading(self):
+        write_manifest(self.manifest_path, settings.INSTALLED_APPS, [APP1])
+        eq_(read_manifest(self.manifest_path, settings.INSTALLED_APPS),
+            [APP1])
+        # The temporary file must have been replaced:
+        eq_(os.listdir(self.manifest_directory), ["authz.json"])
+    
+    def test_missing_manifest(self):
+        eq_(read_manifest(self.manifest_path, settings.INSTALLED_APPS), None)
+    
+    def test_stale_manifest(self):
+        write_manifest(self.manifest_path, [APP1], [APP1])
+        eq_(read_manifest(self.manifest_path, settings.INSTALLED_APPS), None)
+        eq_(self.log_fixture.handler.messages['info'],
+            ["The authorization manifest at %s is stale" % self.manifest_path])
+    
+    def test_corrupt_manifest(self):
+        self._write_raw_manifest("{")
+        eq_(read_manifest(self.manifest_path, settings.INSTALLED_APPS), None)
+        self._write_raw_manifest(json.dumps({
+            'installed_apps_hash': get_apps_hash(settings.INSTALLED_APPS),
+            'secured_apps': ["non_existing_app"],
+            }))
+        eq_(read_manifest(self.manifest_path, settings.INSTALLED_APPS), None)
+        eq_(len(self.log_fixture.handler.messages['warning']), 2)
+    
+    def _write_raw_manifest(self, contents):
+        manifest_file = open(self.manifest_path, "w")
+        try:
+            manifest_file.write(contents)
+        finally:
+            manifest_file.close()
+
+
+class TestLoadingAuthzControls(object):
+    """Tests for :func:`load_authz_controls`."""
+    
+    def setUp(self):
+        self.log_fixture = LoggingHandlerFixture()
+        self.manifest_directory = mkdtemp()
+        self.manifest_path = os.path.join(self.manifest_directory,
+                                          "authz.json")
+    
+    def tearDown(self):
+        rmtree(self.manifest_directory)
+        self.log_fixture.undo()
+    
+    def test_first_boot(self):
+        """The manifest must be written if it doesn't exist."""
+        authz_controls = self._load_authz_controls()
+        eq_(authz_controls, [(APP1, app1_control), (APP2, app2_control)])
+        eq_(read_manifest(self.manifest_path, settings.INSTALLED_APPS),
+            [APP1, APP2])
+    
+    def test_listed_apps_are_used(self):
+        write_manifest(self.manifest_path, settings.INSTALLED_APPS,
+                       [APP1, APP2])
+        eq_(self._load_authz_controls(),
+            [(APP1, app1_control), (APP2, app2_control)])
+        eq_(self.log_fixture.handler.messages['warning'], [])
+    
+    def test_unlisted_app_with_authz_module(self):
+        """Authz modules added to installed applications must be found."""
+        self._write_raw_manifest(settings.INSTALLED_APPS, [APP2], {})
+        eq_(self._load_authz_controls(),
+            [(APP1, app1_control), (APP2, app2_control)])
+        eq_(self.log_fixture.handler.messages['warning'],
+            ["The authorization manifest at %s is stale: The authz module of "
+             "%s was added or modified" % (self.manifest_path, APP1)])
+        eq_(read_manifest(self.manifest_path, settings.INSTALLED_APPS),
+            [APP1, APP2])
+    
+    def test_authz_module_without_control(self):
+        """
+        Authz modules without a control must not make the manifest stale.
+        
+        """
+        installed_apps = [APP1, UNCONTROLLED_APP]
+        for attempt in range(2):
+            eq_(load_authz_controls(self.manifest_path, installed_apps),
+                [(APP1, app1_control)])
+        eq_(self.log_fixture.handler.messages['warning'], [])
+        manifest = self._read_raw_manifest()
+        eq_(manifest['unsecured_authz_apps'].keys(), [UNCONTROLLED_APP])
+    
+    def test_modified_authz_module(self):
+        installed_apps = [APP1, UNCONTROLLED_APP]
+        self._write_raw_manifest(installed_apps, [APP1],
+                                 {UNCONTROLLED_APP: 0})
+        eq_(load_authz_controls(self.manifest_path, installed_apps),
+            [(APP1, app1_control)])
+        eq_(len(self.log_fixture.handler.messages['warning']), 1)
+        eq_(self._read_raw_manifest()['unsecured_authz_apps'],
+            {UNCONTROLLED_APP: _get_authz_module_mtime(UNCONTROLLED_APP)})
+    
+    def test_stale_manifest(self):
+        write_manifest(self.manifest_path, [APP2], [APP2])
+        eq_(self._load_authz_controls(),
+            [(APP1, app1_control), (APP2, app2_control)])
+        eq_(read_manifest(self.manifest_path, settings.INSTALLED_APPS),
+            [APP1, APP2])
+    
+    def test_listed_app_without_control(self):
+        write_manifest(self.manifest_path, settings.INSTALLED_APPS,
+                       [APP1, UNSECURED_APP])
+        eq_(self._load_authz_controls(),
+            [(APP1, app1_control), (APP2, app2_control)])
+        eq_(self.log_fixture.handler.messages['warning'],
+            ["The authorization manifest at %s is stale: %s has no "
+             "authorization control" % (self.manifest_path, UNSECURED_APP)])
+    
+    def test_unwritable_manifest(self):
+        self.manifest_path = os.path.join(self.manifest_directory,
+                                          "non-existing", "authz.json")
+        eq_(self._load_authz_controls(),
+            [(APP1, app1_control), (APP2, app2_control)])
+        eq_(len(self.log_fixture.handler.messages['warning']), 1)
+    
+    def _load_authz_controls(self):
+        return load_authz_controls(self.manifest_path, settings.INSTALLED_APPS)
+    
+    def _read_raw_manifest(self):
+        manifest_file = open(self.manifest_path)
+        try:
+            return json.load(manifest_file)
+        finally:
+            manifest_file.close()
+    
+    def _write_raw_manifest(self, installed_apps, secured_apps,
+                            unsecured_authz_apps):
+        manifest = {
+            'installed_apps_hash': get_apps_hash(installed_apps),
+            'secured_apps': secured_apps,
+            'unsecured_authz_apps': unsecured_authz_apps,
+            }
+        manifest_file = open(self.manifest_path, "w")
+        try:
+            json.dump(manifest, manifest_file)
+        finally:
+            manifest_file.close()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2010, 2degrees Limited <gustavonarea@2degreesnetwork.com>.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the BSD-like license at
+# http://www.repoze.org/LICENSE.txt.  A copy of the license should accompany
+# this distribution.  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL
+# EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND
+# FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Tests for the memoization of the results of the predicates.
+
+"""
+
+from nose.tools import eq_
+
+from repoze.what.plugins.dj.predicates import GROUPS, REQUEST, VOLATILE
+from repoze.what.plugins.dj._memo import get_memoized_result
+
+
+class TestMemoizedResults(object):
+    """Tests for :func:`get_memoized_result`."""
+    
+    def setUp(self):
+        self.environ = {
+            'PATH_INFO': "/blog",
+            'repoze.what.credentials': {'repoze.what.userid': "foo"},
+            }
+        self.predicate = object()
+        self.evaluator = MockEvaluator()
+    
+    def test_result_is_reused(self):
+        for index in range(2):
+            result = get_memoized_result(self.environ, self.predicate,
+                                         set([GROUPS]), self.evaluator)
+            eq_(result, True)
+        eq_(self.evaluator.calls, 1)
+    
+    def test_false_result_is_reused(self):
+        self.evaluator.result = False
+        for index in range(2):
+            result = get_memoized_result(self.environ, self.predicate,
+                                         set([GROUPS]), self.evaluator)
+            eq_(result, False)
+        eq_(self.evaluator.calls, 1)
+    
+    def test_predicates_are_memoized_separately(self):
+        get_memoized_result(self.environ, self.predicate, set([GROUPS]),
+                            self.evaluator)
+        get_memoized_result(self.environ, object(), set([GROUPS]),
+                            self.evaluator)
+        eq_(self.evaluator.calls, 2)
+    
+    def test_volatile_predicate(self):
+        for index in range(2):
+            get_memoized_result(self.environ, self.predicate,
+                                set([GROUPS, VOLATILE]), self.evaluator)
+        eq_(self.evaluator.calls, 2)
+    
+    def test_forged_request(self):
+        """
+        Results must be shared with forged requests, unless the predicate
+        depends on the request.
+        
+        """
+        get_memoized_result(self.environ, self.predicate, set([GROUPS]),
+                            self.evaluator)
+        forged_environ = dict(self.environ, PATH_INFO="/forum")
+        get_memoized_result(forged_environ, self.predicate, set([GROUPS]),
+                            self.evaluator)
+        eq_(self.evaluator.calls, 1)
+        
+        get_memoized_result(self.environ, self.predicate, set([REQUEST]),
+                            self.evaluator)
+        get_memoized_result(forged_environ, self.predicate, set([REQUEST]),
+                            self.evaluator)
+        eq_(self.evaluator.calls, 3)
+    
+    def test_routing_args(self):
+        self.environ['wsgiorg.routing_args'] = ((), {'post_id': "1"})
+        for index in range(2):
+            get_memoized_result(self.environ, self.predicate, set([REQUEST]),
+                                self.evaluator)
+        eq_(self.evaluator.calls, 1)
+    
+    def test_unhashable_routing_args(self):
+        self.environ['wsgiorg.routing_args'] = ((), {'post_ids': ["1"]})
+        for index in range(2):
+            get_memoized_result(self.environ, self.predicate, set([REQUEST]),
+                                self.evaluator)
+        eq_(self.evaluator.calls, 2)
+    
+    def test_user_changed(self):
+        get_memoized_result(self.environ, self.predicate, set([GROUPS]),
+                            self.evaluator)
+        self.environ['repoze.what.credentials'] = {'repoze.what.userid': "bar"}
+        get_memoized_result(self.environ, self.predicate, set([GROUPS]),
+                            self.evaluator)
+        eq_(self.evaluator.calls, 2)
+    
+    def test_missing_credentials(self):
+        del self.environ['repoze.what.credentials']
+        for index in range(2):
+            get_memoized_result(self.environ, self.predicate, set([GROUPS]),
+                                self.evaluator)
+        eq_(self.evaluator.calls, 1)
+
+
+#{ Mock objects
+
+
+class MockEvaluator(object):
+
+    def __init__(self):
+        self.result = True
+        self.calls = 0
+    
+    def __call__(self):
+        self.calls += 1
+        return self.result
+
+
+#}
@@ -18,13 +18,31 @@ Tests for the Django middleware for :mod:`repoze.what`.
 
 """
 
-from nose.tools import eq_, ok_
+import json
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from nose.tools import eq_, ok_, assert_false, assert_raises
+from django.conf import settings
 from django.http import HttpResponse
+from repoze.what.acl import ACL, ACLCollection
+from repoze.what.predicates import Any, in_group
 
 from repoze.what.plugins.dj import RepozeWhatMiddleware
-from repoze.what.plugins.dj.utils import _AuthorizationDenial
+from repoze.what.plugins.dj.cache import (LocalCredentialsCache,
+    SharedCredentialsCache)
+from repoze.what.plugins.dj.compiler import CompiledPredicate
+from repoze.what.plugins.dj.credentials import (BaseCredentialsLoader,
+    BackendCredentialsLoader)
+from repoze.what.plugins.dj.predicates import (USERID, GROUPS, REQUEST,
+    VOLATILE, user_attribute)
+from repoze.what.plugins.dj._manifest import get_apps_hash
+from repoze.what.plugins.dj._utils import LRUCache
+from repoze.what.plugins.dj.utils import _AuthorizationDenial, is_met
 
-from tests import Request, make_user
+from tests import Request, make_user, MockPredicate
+from tests.fixtures.sampledjango import mock_view
 from tests.fixtures.loggers import LoggingHandlerFixture
 
 
@@ -56,6 +74,73 @@ class TestAuthzDiscovery(object):
             )
 
 
+class TestAuthzManifest(object):
+    """Tests for the discovery of the secured applications with a manifest."""
+    
+    def setUp(self):
+        self.log_fixture = LoggingHandlerFixture()
+        self.manifest_directory = mkdtemp()
+        settings.AUTHZ_MANIFEST = os.path.join(self.manifest_directory,
+                                               "authz.json")
+    
+    def tearDown(self):
+        del settings.AUTHZ_MANIFEST
+        rmtree(self.manifest_directory)
+        self.log_fixture.undo()
+    
+    def test_manifest_is_written_and_used(self):
+        from tests.fixtures.sampledjango.app1.authz import control as control1
+        from tests.fixtures.sampledjango.app2.authz import control as control2
+        for attempt in range(2):
+            mw = RepozeWhatMiddleware()
+            ok_(control1 in mw.acl_collection._acls)
+            ok_(control2 in mw.acl_collection._acls)
+        ok_(os.path.exists(settings.AUTHZ_MANIFEST))
+    
+    def test_unlisted_apps_are_found(self):
+        """The authz modules added after the manifest was written count."""
+        manifest = {
+            'installed_apps_hash': get_apps_hash(settings.INSTALLED_APPS),
+            'secured_apps': ["tests.fixtures.sampledjango.app2"],
+            }
+        manifest_file = open(settings.AUTHZ_MANIFEST, "w")
+        try:
+            json.dump(manifest, manifest_file)
+        finally:
+            manifest_file.close()
+        RepozeWhatMiddleware()
+        eq_(self.log_fixture.handler.messages['info'],
+            ["The following applications are secured: "
+             "tests.fixtures.sampledjango.app1, "
+             "tests.fixtures.sampledjango.app2"])
+
+
+class TestPredicateCompilation(object):
+    """Tests for the compilation of the predicates in the global ACLs."""
+    
+    def setUp(self):
+        self.acl = ACL("/blog")
+        self.acl.allow("/", Any(MockPredicate(), MockPredicate(False)))
+    
+    def test_predicates_are_compiled(self):
+        middleware = _make_middleware(self.acl)
+        predicate = _get_acl_predicate(middleware)
+        ok_(isinstance(predicate, CompiledPredicate))
+        ok_(isinstance(predicate.predicate, Any))
+    
+    def test_adaptive_mode(self):
+        settings.AUTHZ_ADAPTIVE_REORDERING_INTERVAL = 10
+        try:
+            middleware = _make_middleware(self.acl)
+        finally:
+            del settings.AUTHZ_ADAPTIVE_REORDERING_INTERVAL
+        predicate = _get_acl_predicate(middleware)
+        eq_(predicate.describe(),
+            "Any (0 evaluations)\n"
+            "  - MockPredicate(result=True): not evaluated\n"
+            "  - MockPredicate(result=False): not evaluated")
+
+
 class TestCredentials(object):
     """
     Tests to make sure the repoze.what credentials are set properly.
@@ -98,10 +183,252 @@ class TestCredentials(object):
         eq_(request.environ['repoze.what.credentials']['repoze.what.userid'],
             "foo")\
     
+    def test_credentials_are_loaded_lazily(self):
+        """The groups and permissions must be loaded only when they're used."""
+        user = make_user("foo", ("g1", ), ("p1", ))
+        user.get_all_permissions = _fail
+        user.groups.all = _fail
+        request = Request({}, user)
+        self.middleware._set_request_up(request)
+        credentials = request.environ['repoze.what.credentials']
+        assert_false(credentials['groups'].loaded)
+        assert_false(credentials['permissions'].loaded)
+    
+    def test_credentials_are_immutable(self):
+        user = make_user("foo", ("g1", ))
+        request = Request({}, user)
+        self.middleware._set_request_up(request)
+        credentials = request.environ['repoze.what.credentials']
+        assert_raises(TypeError, credentials.__setitem__, "groups", set())
+        ok_(credentials.user is user)
+    
     def test_no_response_returned(self):
         """The middleware's _set_request_up() shouldn't return a response."""
         request = Request({}, make_user(None))
         eq_(self.middleware._set_request_up(request), None)
+    
+    def test_no_credentials_cache_by_default(self):
+        eq_(self.middleware.credentials_cache, None)
+    
+    def test_default_credentials_loader(self):
+        ok_(isinstance(self.middleware.credentials_loader,
+                       BackendCredentialsLoader))
+    
+    def test_custom_credentials_loader(self):
+        settings.CREDENTIALS_LOADER = "tests.test_middleware.MockLoader"
+        try:
+            middleware = RepozeWhatMiddleware()
+        finally:
+            del settings.CREDENTIALS_LOADER
+        request = Request({}, make_user("foo", ("g1", ), ("p1", )))
+        middleware._set_request_up(request)
+        credentials = request.environ['repoze.what.credentials']
+        eq_(credentials['groups'], set(["foo-group"]))
+        eq_(credentials['permissions'], set(["foo-permission"]))
+
+
+class TestAnonymousRequests(object):
+    """Tests for the handling of anonymous requests."""
+    
+    def setUp(self):
+        self.middleware = RepozeWhatMiddleware()
+    
+    def test_credentials_are_shared(self):
+        request1 = Request({}, make_user(None))
+        request2 = Request({}, make_user(None))
+        self.middleware._set_request_up(request1)
+        self.middleware._set_request_up(request2)
+        ok_(request1.environ['repoze.what.credentials'] is
+            request2.environ['repoze.what.credentials'])
+    
+    def test_credentials_are_immutable(self):
+        request = Request({}, make_user(None))
+        self.middleware._set_request_up(request)
+        credentials = request.environ['repoze.what.credentials']
+        assert_raises(TypeError, credentials.__setitem__, "groups", set())
+    
+    def test_request_specific_items_are_not_shared(self):
+        request1 = Request({'repoze.what.plugins.dj.predicate_results': {}},
+                           make_user(None))
+        request2 = Request({}, make_user(None))
+        self.middleware._set_request_up(request1)
+        self.middleware._set_request_up(request2)
+        ok_("repoze.what.plugins.dj.predicate_results" not in
+            request2.environ)
+    
+    def test_global_control_is_set(self):
+        request = Request({}, make_user(None))
+        self.middleware._set_request_up(request)
+        eq_(request.environ['repoze.what.global_control'],
+            self.middleware.acl_collection)
+    
+    def test_decision_is_reused(self):
+        view = object()
+        for index in range(2):
+            request = Request({'PATH_INFO': "/app1/admin"}, make_user(None))
+            response = self.middleware.process_view(request, view, (), {})
+            eq_(response, "No! Get out!")
+        eq_(self.middleware.decision_cache.hits, 1)
+    
+    def test_request_dependent_decision_is_not_reused(self):
+        predicate = MockPredicate()
+        acl = ACL("/app3")
+        acl.deny("/secret", predicate, reason="Go away")
+        self.middleware = _make_middleware(acl)
+        view = object()
+        request = Request({'PATH_INFO': "/app3/secret"}, make_user(None))
+        ok_(self.middleware.process_view(request, view, (), {}) is not None)
+        predicate.result = False
+        request = Request({'PATH_INFO': "/app3/secret"}, make_user(None))
+        eq_(self.middleware.process_view(request, view, (), {}), None)
+    
+    def test_volatile_decision_is_not_reused(self):
+        predicate = MockPredicate()
+        predicate.environ_dependencies = frozenset([VOLATILE])
+        acl = ACL("/app3")
+        acl.deny("/secret", predicate, reason="Go away")
+        self.middleware = _make_middleware(acl)
+        view = object()
+        request = Request({'PATH_INFO': "/app3/secret"}, make_user(None))
+        ok_(self.middleware.process_view(request, view, (), {}) is not None)
+        predicate.result = False
+        request = Request({'PATH_INFO': "/app3/secret"}, make_user(None))
+        eq_(self.middleware.process_view(request, view, (), {}), None)
+
+
+class TestDecisionCache(object):
+    """Tests for the caching of the authorization decisions."""
+    
+    def setUp(self):
+        self.predicate = CountingPredicate(False)
+        acl = ACL("/app3")
+        acl.deny("/secret", self.predicate, reason="Go away")
+        self.middleware = _make_middleware(acl)
+    
+    def test_decision_depending_on_groups(self):
+        self.predicate.environ_dependencies = frozenset([GROUPS])
+        self._make_request(make_user("foo", ["g1"]))
+        self._make_request(make_user("bar", ["g1"]))
+        eq_(self.predicate.calls, 1)
+        eq_(self.middleware.decision_cache.hits, 1)
+        self._make_request(make_user("foo", ["g2"]))
+        eq_(self.predicate.calls, 2)
+    
+    def test_groups_from_credentials_cache(self):
+        """
+        Decisions on authenticated users must be reused without querying the
+        database when their credentials are cached.
+        
+        """
+        self.middleware.credentials_cache = LocalCredentialsCache()
+        self.predicate.environ_dependencies = frozenset([GROUPS])
+        self._make_request(make_user("foo", ["g1"]))
+        user = make_user("foo")
+        user.groups.all = _fail
+        user.get_all_permissions = _fail
+        self._make_request(user)
+        eq_(self.predicate.calls, 1)
+        eq_(self.middleware.decision_cache.hits, 1)
+        eq_(self.middleware.credentials_cache.hits, 1)
+    
+    def test_decision_depending_on_user_id(self):
+        self.predicate.environ_dependencies = frozenset([USERID])
+        self._make_request(make_user("foo"))
+        self._make_request(make_user("foo"))
+        self._make_request(make_user("bar"))
+        eq_(self.predicate.calls, 2)
+    
+    def test_decision_depending_on_user_attribute(self):
+        self.predicate.environ_dependencies = \
+            frozenset([user_attribute("is_staff")])
+        user = make_user("foo")
+        user.is_staff = False
+        self._make_request(user)
+        self._make_request(user)
+        eq_(self.predicate.calls, 1)
+        user.is_staff = True
+        self._make_request(user)
+        eq_(self.predicate.calls, 2)
+    
+    def test_request_dependent_decision(self):
+        self.predicate.environ_dependencies = frozenset([GROUPS, REQUEST])
+        self._make_request(make_user("foo"))
+        self._make_request(make_user("foo"))
+        eq_(self.predicate.calls, 2)
+    
+    def test_evictions(self):
+        self.middleware.decision_cache = LRUCache(1)
+        self.predicate.environ_dependencies = frozenset([USERID])
+        self._make_request(make_user("foo"))
+        self._make_request(make_user("bar"))
+        eq_(self.middleware.decision_cache.evictions, 1)
+    
+    def test_disabled_cache(self):
+        settings.AUTHZ_DECISION_CACHE_SIZE = 0
+        try:
+            self.middleware = RepozeWhatMiddleware()
+        finally:
+            del settings.AUTHZ_DECISION_CACHE_SIZE
+        eq_(self.middleware.decision_cache, None)
+        request = Request({'PATH_INFO': "/app1/admin"}, make_user("foo"))
+        response = self.middleware.process_view(request, object(), (), {})
+        eq_(response, "No! Get out!")
+    
+    def _make_request(self, user):
+        request = Request({'PATH_INFO': "/app3/secret"}, user)
+        self.middleware.process_view(request, mock_view, (), {})
+
+
+class TestCredentialsCache(object):
+    """Tests for the caching of the credentials in the middleware."""
+    
+    def setUp(self):
+        settings.CREDENTIALS_CACHE_SIZE = 10
+        self.middleware = RepozeWhatMiddleware()
+    
+    def tearDown(self):
+        del settings.CREDENTIALS_CACHE_SIZE
+    
+    def test_cache_is_set_up(self):
+        cache = self.middleware.credentials_cache
+        eq_(cache._cache.max_size, 10)
+        eq_(cache._cache.timeout, 300)
+    
+    def test_credentials_are_cached(self):
+        request = Request({}, make_user("foo", ("g1", ), ("p1", )))
+        self.middleware._set_request_up(request)
+        credentials = request.environ['repoze.what.credentials']
+        eq_(credentials['groups'], set(["g1"]))
+        eq_(self.middleware.credentials_cache.misses, 1)
+        # The credentials for the same user must not be loaded again:
+        user = make_user("foo")
+        user.get_all_permissions = _fail
+        user.groups.all = _fail
+        request = Request({}, user)
+        self.middleware._set_request_up(request)
+        credentials = request.environ['repoze.what.credentials']
+        eq_(credentials['groups'], set(["g1"]))
+        eq_(credentials['permissions'], set(["p1"]))
+        eq_(self.middleware.credentials_cache.hits, 1)
+    
+    def test_shared_cache(self):
+        settings.CREDENTIALS_CACHE = "locmem://"
+        try:
+            middleware = RepozeWhatMiddleware()
+        finally:
+            del settings.CREDENTIALS_CACHE
+        ok_(isinstance(middleware.credentials_cache, SharedCredentialsCache))
+        request = Request({}, make_user("foo", ("g1", ), ("p1", )))
+        middleware._set_request_up(request)
+        credentials = request.environ['repoze.what.credentials']
+        eq_(credentials['permissions'], set(["p1"]))
+        eq_(middleware.credentials_cache.misses, 1)
+    
+    def test_anonymous_users_are_not_cached(self):
+        request = Request({}, make_user(None))
+        self.middleware._set_request_up(request)
+        eq_(len(request.environ['repoze.what.credentials']['groups']), 0)
+        eq_(self.middleware.credentials_cache.misses, 0)
 
 
 class TestAuthorizationEnforcement(object):
@@ -131,6 +458,23 @@ class TestAuthorizationEnforcement(object):
         eq_(self.log_fixture.handler.messages['debug'][0],
             "No authorization decision made on ingress at /app2/nothing")
     
+    def test_authz_decision_by_view(self):
+        """Decisions on views in the URL configuration must be the same."""
+        environ = {'PATH_INFO': "/app1/admin"}
+        request = Request(environ, make_user("foo"))
+        response = self.middleware.process_view(request, mock_view, (), {})
+        eq_(response, "No! Get out!")
+        ok_(self.middleware._view_index.get_collection(mock_view) is not None)
+    
+    def test_authz_decision_with_custom_urlconf(self):
+        """Views must not be looked up if the URL configuration is custom."""
+        environ = {'PATH_INFO': "/app1/admin"}
+        request = Request(environ, make_user("foo"))
+        request.urlconf = "tests.fixtures.sampledjango.app1.urls"
+        self.middleware._view_index = None
+        response = self.middleware.process_view(request, mock_view, (), {})
+        eq_(response, "No! Get out!")
+    
     def test_authz_granted(self):
         """When authorization is granted nothing must be done."""
         environ = {'PATH_INFO': "/app1/blog"}
@@ -177,6 +521,35 @@ class TestAuthorizationEnforcement(object):
             repr(request.user))
         eq_(len(self.log_fixture.handler.messages['debug']), 0)
     
+    def test_path_not_covered_by_acls(self):
+        """
+        Nothing must be done if no ACL applies to the path, not even touching
+        the user.
+        
+        """
+        environ = {'PATH_INFO': "/unsecured_app/view"}
+        request = Request(environ, make_user(None))
+        request.user = UntouchableUser()
+        response = self.middleware.process_view(request, object(), (), {})
+        eq_(response, None)
+        ok_("repoze.what.credentials" not in request.environ)
+        eq_(len(self.log_fixture.handler.messages['debug']), 1)
+        eq_(self.log_fixture.handler.messages['debug'][0],
+            "No authorization decision made on ingress at /unsecured_app/view")
+    
+    def test_deferred_setup(self):
+        """
+        The request must be set up when it's checked in the view, if the
+        middleware skipped it.
+        
+        """
+        environ = {'PATH_INFO': "/unsecured_app/view"}
+        request = Request(environ, make_user("foo", ("g1", )))
+        self.middleware.process_view(request, object(), (), {})
+        ok_(is_met(MockPredicate(), request))
+        eq_(request.environ['repoze.what.credentials']['groups'],
+            set(["g1"]))
+    
     def test_middleware_skips_media_dir(self):
         """The middleware must do nothing in the media directory."""
         environ = {'PATH_INFO': "/media/photo.jpg"}
@@ -190,7 +563,7 @@ class TestAuthorizationEnforcement(object):
         eq_(len(self.log_fixture.handler.messages['warning']), 0)
         eq_(len(self.log_fixture.handler.messages['debug']), 1)
         eq_(self.log_fixture.handler.messages['debug'][0],
-            "Authorization checks disabled for media file at /media/photo.jpg")
+            "Authorization checks disabled for exempt path /media/photo.jpg")
     
     def test_middleware_skips_media_admin_dir(self):
         """The middleware must do nothing in the media admin directory."""
@@ -205,7 +578,199 @@ class TestAuthorizationEnforcement(object):
         eq_(len(self.log_fixture.handler.messages['warning']), 0)
         eq_(len(self.log_fixture.handler.messages['debug']), 1)
         eq_(self.log_fixture.handler.messages['debug'][0],
-            "Authorization checks disabled for media file at /admin-media/photo")
+            "Authorization checks disabled for exempt path /admin-media/photo")
+
+
+class TestExemptPaths(object):
+    """Tests for the paths exempt from authorization checks."""
+    
+    def setUp(self):
+        settings.AUTHZ_EXEMPT_PATHS = ("/health", "/app1/admin/static/*")
+        try:
+            self.middleware = RepozeWhatMiddleware()
+        finally:
+            del settings.AUTHZ_EXEMPT_PATHS
+        self.log_fixture = LoggingHandlerFixture()
+    
+    def tearDown(self):
+        self.log_fixture.undo()
+    
+    def test_exact_path(self):
+        request = Request({'PATH_INFO': "/health"}, make_user(None))
+        eq_(self.middleware.process_view(request, object(), (), {}), None)
+        ok_("repoze.what.credentials" not in request.environ)
+        eq_(self.log_fixture.handler.messages['debug'],
+            ["Authorization checks disabled for exempt path /health"])
+    
+    def test_path_under_exact_path(self):
+        request = Request({'PATH_INFO': "/healthy"}, make_user(None))
+        self.middleware.process_view(request, object(), (), {})
+        eq_(self.log_fixture.handler.messages['debug'],
+            ["No authorization decision made on ingress at /healthy"])
+    
+    def test_path_prefix(self):
+        """Exempt paths must not be checked even if an ACL covers them."""
+        request = Request({'PATH_INFO': "/app1/admin/static/logo.png"},
+                          make_user(None))
+        eq_(self.middleware.process_view(request, mock_view, (), {}), None)
+        ok_("repoze.what.credentials" not in request.environ)
+    
+    def test_media_paths_are_still_exempt(self):
+        request = Request({'PATH_INFO': "/media/photo.jpg"}, make_user(None))
+        eq_(self.middleware.process_view(request, object(), (), {}), None)
+        ok_("repoze.what.credentials" not in request.environ)
+    
+    def test_empty_media_url(self):
+        """An empty MEDIA_URL must not exempt every path."""
+        original_media_url = settings.MEDIA_URL
+        settings.MEDIA_URL = ""
+        try:
+            middleware = RepozeWhatMiddleware()
+        finally:
+            settings.MEDIA_URL = original_media_url
+        request = Request({'PATH_INFO': "/app1/admin"}, make_user(None))
+        response = middleware.process_view(request, mock_view, (), {})
+        eq_(response, "No! Get out!")
+
+
+class TestEarlyRejection(object):
+    """Tests for the rejection of requests before their URL is resolved."""
+    
+    def setUp(self):
+        self.predicate = CountingPredicate()
+        self.log_fixture = LoggingHandlerFixture()
+    
+    def tearDown(self):
+        self.log_fixture.undo()
+    
+    def test_disabled_by_default(self):
+        middleware = RepozeWhatMiddleware()
+        request = Request({'PATH_INFO': "/app1/admin"}, make_user(None))
+        eq_(middleware.process_request(request), None)
+    
+    def test_path_only_decision(self):
+        """Decisions which only depend on the path apply to every user."""
+        middleware = self._make_middleware(GROUPS)
+        user = make_user("foo")
+        user.get_all_permissions = _fail
+        user.groups.all = _fail
+        request = Request({'PATH_INFO': "/app1/admin"}, user)
+        eq_(middleware.process_request(request), "No! Get out!")
+        ok_("repoze.what.credentials" not in request.environ)
+        eq_(self.log_fixture.handler.messages['warning'],
+            ["Authorization denied before URL resolution to %s at "
+             "/app1/admin: Get out!" % repr(user)])
+    
+    def test_anonymous_user(self):
+        middleware = self._make_middleware(GROUPS)
+        for index in range(2):
+            request = Request({'PATH_INFO': "/app3/secret"}, make_user(None))
+            ok_(middleware.process_request(request) is not None)
+        eq_(self.predicate.calls, 1)
+        ok_("repoze.what.credentials" not in request.environ)
+    
+    def test_authenticated_user(self):
+        """Decisions on credentials are left to process_view()."""
+        middleware = self._make_middleware(GROUPS)
+        request = Request({'PATH_INFO': "/app3/secret"}, make_user("foo"))
+        eq_(middleware.process_request(request), None)
+        eq_(self.predicate.calls, 0)
+        ok_(middleware.process_view(request, mock_view, (), {}) is not None)
+    
+    def test_request_dependent_decision(self):
+        middleware = self._make_middleware(GROUPS, REQUEST)
+        request = Request({'PATH_INFO': "/app3/secret"}, make_user(None))
+        eq_(middleware.process_request(request), None)
+        eq_(self.predicate.calls, 0)
+    
+    def test_disabled_decision_cache(self):
+        settings.AUTHZ_DECISION_CACHE_SIZE = 0
+        try:
+            middleware = self._make_middleware(GROUPS)
+        finally:
+            del settings.AUTHZ_DECISION_CACHE_SIZE
+        request = Request({'PATH_INFO': "/app3/secret"}, make_user(None))
+        ok_(middleware.process_request(request) is not None)
+    
+    def test_path_not_covered_by_acls(self):
+        middleware = self._make_middleware(GROUPS)
+        request = Request({'PATH_INFO': "/unsecured_app/view"},
+                          make_user(None))
+        eq_(middleware.process_request(request), None)
+    
+    def test_exempt_path(self):
+        middleware = self._make_middleware(GROUPS)
+        request = Request({'PATH_INFO': "/media/photo.jpg"}, make_user(None))
+        eq_(middleware.process_request(request), None)
+        ok_("repoze.what.credentials" not in request.environ)
+    
+    def _make_middleware(self, *dependencies):
+        self.predicate.environ_dependencies = frozenset(dependencies)
+        acl = ACL("/app3")
+        acl.deny("/secret", self.predicate, reason="Go away")
+        settings.AUTHZ_EARLY_REJECTION = True
+        try:
+            return _make_middleware(acl)
+        finally:
+            del settings.AUTHZ_EARLY_REJECTION
+
+
+class TestInPlaceEnviron(object):
+    """Tests for the requests set up without replacing their environ."""
+    
+    def setUp(self):
+        settings.AUTHZ_INPLACE_ENVIRON = True
+        try:
+            self.middleware = RepozeWhatMiddleware()
+        finally:
+            del settings.AUTHZ_INPLACE_ENVIRON
+    
+    def test_disabled_by_default(self):
+        environ = {}
+        request = Request(environ, make_user("foo"))
+        RepozeWhatMiddleware()._set_request_up(request)
+        ok_("repoze.what.credentials" in request.environ)
+        assert_false(request.environ is environ)
+    
+    def test_environ_is_kept(self):
+        environ = {}
+        request = Request(environ, make_user("foo", ("g1", ), ("p1", )))
+        self.middleware._set_request_up(request)
+        ok_(request.environ is environ)
+        credentials = environ['repoze.what.credentials']
+        eq_(credentials[USERID], "foo")
+        eq_(credentials['groups'], set(["g1"]))
+        eq_(credentials['permissions'], set(["p1"]))
+        ok_(credentials.user is request.user)
+    
+    def test_same_items_as_setup_request(self):
+        request = Request({}, make_user("foo", ("g1", )))
+        self.middleware._set_request_up(request)
+        expected_request = Request({}, make_user("foo", ("g1", )))
+        RepozeWhatMiddleware()._set_request_up(expected_request)
+        eq_(_get_repoze_what_items(request),
+            _get_repoze_what_items(expected_request))
+    
+    def test_credentials_are_loaded_lazily(self):
+        user = make_user("foo", ("g1", ), ("p1", ))
+        user.get_all_permissions = _fail
+        user.groups.all = _fail
+        request = Request({}, user)
+        self.middleware._set_request_up(request)
+        credentials = request.environ['repoze.what.credentials']
+        assert_false(credentials['groups'].loaded)
+    
+    def test_predicates(self):
+        request = Request({}, make_user("foo", ("g1", )))
+        self.middleware._set_request_up(request)
+        ok_(is_met(in_group("g1"), request))
+        assert_false(is_met(in_group("g2"), request))
+    
+    def test_anonymous_credentials_are_kept(self):
+        self.middleware._set_request_up(Request({}, make_user("foo")))
+        request = Request({}, make_user(None))
+        self.middleware._set_request_up(request)
+        eq_(request.environ['repoze.what.credentials'][USERID], None)
 
 
 class TestAuthorizationDeniedInView(object):
@@ -268,3 +833,72 @@ class TestAuthorizationDeniedInView(object):
         response = self.middleware.process_exception(request, exception)
         eq_(response, None)
 
+
+#{ Mock objects
+
+
+#: The global ACL collection of the middleware made by _make_middleware().
+MOCK_GLOBAL_COLLECTION = None
+
+
+def _make_middleware(*acls):
+    """
+    Return a middleware whose global ACL collection only contains ``acls``,
+    apart from the ACLs of the applications.
+    
+    """
+    global MOCK_GLOBAL_COLLECTION
+    MOCK_GLOBAL_COLLECTION = ACLCollection()
+    for acl in acls:
+        MOCK_GLOBAL_COLLECTION.add_acl(acl)
+    
+    original_collection_name = settings.GLOBAL_ACL_COLLECTION
+    settings.GLOBAL_ACL_COLLECTION = \
+        "tests.test_middleware.MOCK_GLOBAL_COLLECTION"
+    try:
+        return RepozeWhatMiddleware()
+    finally:
+        settings.GLOBAL_ACL_COLLECTION = original_collection_name
+
+
+def _get_repoze_what_items(request):
+    items = dict([(key, value) for (key, value) in request.environ.items()
+                  if key.startswith("repoze.what.")])
+    items['repoze.what.credentials'] = items['repoze.what.credentials'].copy()
+    return items
+
+
+def _get_acl_predicate(middleware):
+    return middleware.acl_collection._acls[0]._aces[0].predicate
+
+
+def _fail():
+    raise AssertionError("The credentials must not be loaded")
+
+
+class CountingPredicate(MockPredicate):
+    """Predicate which counts the times it's evaluated."""
+    
+    def __init__(self, *args, **kwargs):
+        self.calls = 0
+        super(CountingPredicate, self).__init__(*args, **kwargs)
+    
+    def check(self, request, credentials):
+        self.calls += 1
+        return super(CountingPredicate, self).check(request, credentials)
+
+
+class UntouchableUser(object):
+
+    def __getattr__(self, name):
+        raise AssertionError("The user must not be used")
+
+
+class MockLoader(BaseCredentialsLoader):
+
+    def load(self, user):
+        return (["%s-group" % user.username],
+                ["%s-permission" % user.username])
+
+
+#}
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2010, 2degrees Limited <gustavonarea@2degreesnetwork.com>.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the BSD-like license at
+# http://www.repoze.org/LICENSE.txt.  A copy of the license should accompany
+# this distribution.  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL
+# EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND
+# FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Tests for the namespace of the package.
+
+"""
+
+import os
+from subprocess import PIPE, Popen
+import sys
+
+from nose.tools import eq_, ok_, assert_false, assert_raises
+
+import repoze.what.plugins.dj
+from repoze.what.plugins.dj import middleware, predicates, utils
+
+
+_PROJECT_DIRECTORY = os.path.dirname(os.path.dirname(__file__))
+
+
+class TestLazyNamespace(object):
+    """Tests for the objects imported on demand into the package."""
+    
+    def test_public_objects(self):
+        for module in (middleware, predicates, utils):
+            for name in module.__all__:
+                if name in repoze.what.plugins.dj.__all__:
+                    ok_(getattr(repoze.what.plugins.dj, name) is
+                        getattr(module, name))
+    
+    def test_all_public_objects_are_importable(self):
+        namespace = {}
+        exec "from repoze.what.plugins.dj import *" in namespace
+        for name in repoze.what.plugins.dj.__all__:
+            ok_(name in namespace)
+    
+    def test_unknown_attribute(self):
+        assert_raises(AttributeError, getattr, repoze.what.plugins.dj,
+                      "non_existing")
+    
+    def test_directory(self):
+        ok_("require" in dir(repoze.what.plugins.dj))
+    
+    def test_importing_predicates_is_lightweight(self):
+        """
+        The predicates must be importable without the middleware, the
+        in-view utilities or their dependencies on Django.
+        
+        """
+        loaded_modules = _get_modules_loaded_by(
+            "from repoze.what.plugins.dj import IS_STAFF, IsActive")
+        ok_("repoze.what.plugins.dj.predicates" in loaded_modules)
+        for module_name in ("repoze.what.plugins.dj.middleware",
+                            "repoze.what.plugins.dj.utils",
+                            "django.conf",
+                            "django.core.urlresolvers"):
+            assert_false(module_name in loaded_modules,
+                         "%s was imported" % module_name)
+
+
+def _get_modules_loaded_by(import_statement):
+    """
+    Return the names of the modules loaded by ``import_statement`` in a new
+    interpreter.
+    
+    """
+    code = "import sys; %s; print '\\n'.join(sys.modules)" % import_statement
+    process = Popen([sys.executable, "-c", code], stdout=PIPE, stderr=PIPE,
+                    cwd=_PROJECT_DIRECTORY)
+    (output, error_output) = process.communicate()
+    eq_(process.returncode, 0, error_output)
+    return set(output.split())
@@ -19,12 +19,15 @@ Unit tests for the Django-specific repoze.what predicates.
 
 from nose.tools import eq_, ok_, assert_false
 
-from repoze.what.predicates import NotAuthorizedError
+from repoze.what.predicates import (NotAuthorizedError, All, Any, Not,
+    in_group, has_permission, is_user, not_anonymous)
 
 from repoze.what.plugins.dj import (RepozeWhatMiddleware, IsStaff, IsActive,
                                     IsSuperuser, IS_STAFF, IS_ACTIVE,
                                     IS_SUPERUSER)
-from tests import Request, make_user
+from repoze.what.plugins.dj.predicates import (USERID, GROUPS, PERMISSIONS,
+    REQUEST, user_attribute, get_dependencies)
+from tests import Request, make_user, MockPredicate
 
 
 class BasePredicateTester(object):
@@ -108,3 +111,37 @@ class TestIsSuperuser(BasePredicateTester):
     def test_alias(self):
         ok_(isinstance(IS_SUPERUSER, IsSuperuser))
 
+
+class TestDependencies(object):
+    """Tests for :func:`get_dependencies`."""
+    
+    def test_user_attribute(self):
+        eq_(user_attribute("is_staff"), "user.is_staff")
+    
+    def test_django_predicates(self):
+        eq_(get_dependencies(IS_STAFF), set([user_attribute("is_staff")]))
+        eq_(get_dependencies(IS_ACTIVE), set([user_attribute("is_active")]))
+        eq_(get_dependencies(IS_SUPERUSER),
+            set([user_attribute("is_superuser")]))
+    
+    def test_core_predicates(self):
+        eq_(get_dependencies(in_group("admins")), set([GROUPS]))
+        eq_(get_dependencies(has_permission("edit")), set([PERMISSIONS]))
+        eq_(get_dependencies(is_user("foo")), set([USERID]))
+        eq_(get_dependencies(not_anonymous()), set([USERID]))
+    
+    def test_compound_predicates(self):
+        predicate = All(in_group("admins"), Any(has_permission("edit"),
+                                                Not(IS_STAFF)))
+        eq_(get_dependencies(predicate),
+            set([GROUPS, PERMISSIONS, user_attribute("is_staff")]))
+    
+    def test_unknown_predicate(self):
+        eq_(get_dependencies(MockPredicate()), set([REQUEST]))
+        eq_(get_dependencies(All(in_group("admins"), MockPredicate())),
+            set([GROUPS, REQUEST]))
+    
+    def test_declared_dependencies(self):
+        predicate = MockPredicate()
+        predicate.environ_dependencies = (GROUPS, )
+        eq_(get_dependencies(predicate), set([GROUPS]))
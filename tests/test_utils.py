@@ -20,14 +20,24 @@ Tests for the utilities denied at :mod:`repoze.what.plugins.dj.utils`.
 
 from nose.tools import eq_, ok_, assert_false, assert_raises
 
-from django.core.urlresolvers import Resolver404
+from django.conf import settings
+from django.core.urlresolvers import (Resolver404, RegexURLPattern,
+    NoReverseMatch)
+from repoze.what.acl import ACL, ACLCollection
 from repoze.what.plugins.dj import (is_met, not_met, enforce, require,
-                                    can_access, RepozeWhatMiddleware)
+                                    can_access, can_access_many,
+                                    can_access_view, accessible_urls,
+                                    RepozeWhatMiddleware)
+from repoze.what.plugins.dj.compiler import compile_predicate
+from repoze.what.plugins.dj.predicates import GROUPS, REQUEST, VOLATILE
+from repoze.what.plugins.dj import utils
 from repoze.what.plugins.dj.utils import _AuthorizationDenial
+from repoze.what.plugins.dj._utils import LRUCache
 
 from tests import Request, make_user, MockPredicate
 from tests.fixtures.loggers import LoggingHandlerFixture
 from tests.fixtures.sampledjango import mock_view
+from tests.fixtures.named_urls import admin_view
 
 
 class TestIsMet(object):
@@ -40,6 +50,51 @@ class TestIsMet(object):
     def test_with_predicate_unmet(self):
         req = Request({}, make_user(None))
         assert_false(is_met(MockPredicate(False), req))
+    
+    def test_result_is_reused(self):
+        req = Request({}, make_user(None))
+        predicate = CountingPredicate()
+        ok_(is_met(predicate, req))
+        ok_(is_met(predicate, req))
+        eq_(predicate.calls, 1)
+    
+    def test_result_is_shared_with_compiled_predicate(self):
+        req = Request({}, make_user(None))
+        predicate = CountingPredicate()
+        ok_(compile_predicate(predicate)(req))
+        ok_(is_met(predicate, req))
+        ok_(is_met(compile_predicate(predicate), req))
+        eq_(predicate.calls, 1)
+    
+    def test_volatile_predicate(self):
+        req = Request({}, make_user(None))
+        predicate = CountingPredicate()
+        predicate.environ_dependencies = frozenset([VOLATILE])
+        ok_(is_met(predicate, req))
+        ok_(is_met(predicate, req))
+        eq_(predicate.calls, 2)
+
+
+class TestDeferredSetup(object):
+    """The utilities must set the request up if the middleware didn't."""
+    
+    def setUp(self):
+        self.request = Request({'PATH_INFO': "/"}, make_user("foo", ("g1", )))
+        self.request._repoze_what_deferred_setup = \
+            RepozeWhatMiddleware()._set_request_up
+    
+    def test_is_met(self):
+        ok_(is_met(MockPredicate(), self.request))
+        ok_("repoze.what.credentials" in self.request.environ)
+        ok_(not hasattr(self.request, "_repoze_what_deferred_setup"))
+    
+    def test_not_met(self):
+        assert_false(not_met(MockPredicate(), self.request))
+        ok_("repoze.what.credentials" in self.request.environ)
+    
+    def test_can_access(self):
+        ok_(can_access("/app1/blog", self.request))
+        ok_("repoze.what.credentials" in self.request.environ)
 
 
 class TestNotMet(object):
@@ -92,7 +147,7 @@ class TestEnforcer(object):
             eq_(authz_denial.handler, expected_denial_handler)
         else:
             raise AssertionError("Authorization denial not raised")
-    
+
 
 class TestRequire(object):
     """Tests for the @require decorator."""
@@ -153,9 +208,12 @@ class TestCanAccess(object):
         mw.process_view(self.request, None, None, None)
         # Let's enabled logging after the middleware has been set:
         self.log_fixture = LoggingHandlerFixture()
+        self.original_resolution_cache = utils._RESOLUTION_CACHE
+        utils._RESOLUTION_CACHE = LRUCache(10)
     
     def tearDown(self):
         self.log_fixture.undo()
+        utils._RESOLUTION_CACHE = self.original_resolution_cache
     
     def test_no_authz_decision_made(self):
         """Authorization would be granted if no decision was made."""
@@ -189,6 +247,31 @@ class TestCanAccess(object):
         assert_raises(Resolver404, can_access, "/app1/non-existing",
                       self.request)
     
+    def test_resolved_view_is_cached(self):
+        ok_(can_access("/app1/blog", self.request))
+        ok_(can_access("/app1/blog", self.request))
+        eq_(utils._RESOLUTION_CACHE.misses, 1)
+        eq_(utils._RESOLUTION_CACHE.hits, 1)
+    
+    def test_non_existing_path_is_cached(self):
+        for index in range(2):
+            assert_raises(Resolver404, can_access, "/app1/non-existing",
+                          self.request)
+        eq_(utils._RESOLUTION_CACHE.misses, 1)
+        eq_(utils._RESOLUTION_CACHE.hits, 1)
+    
+    def test_custom_urlconf(self):
+        """Paths must be cached separately for each URL configuration."""
+        ok_(can_access("/app1/blog", self.request))
+        self.request.urlconf = "tests.fixtures.sampledjango.app1.urls"
+        ok_(can_access("/blog", self.request))
+        assert_raises(Resolver404, can_access, "/app1/blog", self.request)
+    
+    def test_unhashable_urlconf(self):
+        self.request.urlconf = [RegexURLPattern(r"^blog", mock_view)]
+        ok_(can_access("/blog", self.request))
+        eq_(utils._RESOLUTION_CACHE.misses, 0)
+    
     def test_authz_granted_with_view_resolved(self):
         """
         The view shouldn't be resolved if we are passing the view by hand.
@@ -218,6 +301,289 @@ class TestCanAccess(object):
             repr(self.request.user))
 
 
+class TestCanAccessMany(object):
+    """Tests for the can_access_many() function."""
+    
+    def setUp(self):
+        mw = RepozeWhatMiddleware()
+        self.request = Request({'PATH_INFO': "/"}, make_user(None))
+        mw.process_view(self.request, None, None, None)
+    
+    def test_same_results_as_can_access(self):
+        paths = ["/app1/blog", "/app1/admin", "/app1/secret", "/app2/secret",
+                 "/app2/nothing"]
+        expected_access = dict([(path, can_access(path, self.request))
+                                for path in paths])
+        eq_(can_access_many(paths, self.request), expected_access)
+    
+    def test_repeated_paths(self):
+        eq_(can_access_many(["/app1/blog", "/app1/blog"], self.request),
+            {"/app1/blog": True})
+    
+    def test_no_paths(self):
+        eq_(can_access_many([], self.request), {})
+    
+    def test_non_existing_path(self):
+        assert_raises(Resolver404, can_access_many,
+                      ["/app1/blog", "/app1/non-existing"], self.request)
+    
+    def test_predicates_are_evaluated_once(self):
+        """Predicates which don't depend on the path must be shared."""
+        predicate = CountingPredicate()
+        predicate.environ_dependencies = frozenset([GROUPS])
+        compiled_predicate = compile_predicate(predicate)
+        acl = ACL("/app1")
+        acl.deny("/blog", compiled_predicate)
+        acl.deny("/secret", compiled_predicate)
+        collection = ACLCollection()
+        collection.add_acl(acl)
+        self.request.environ['repoze.what.global_control'] = collection
+        eq_(can_access_many(["/app1/blog", "/app1/secret"], self.request),
+            {"/app1/blog": False, "/app1/secret": False})
+        eq_(predicate.calls, 1)
+    
+    def test_request_is_forged_once(self):
+        forged_paths = []
+        original_forge_request = utils.forge_request
+        def forge_request(environ, path, view_args, view_kwargs):
+            forged_paths.append(path)
+            return original_forge_request(environ, path, view_args,
+                                          view_kwargs)
+        utils.forge_request = forge_request
+        try:
+            access = can_access_many(["/app1/blog", "/app1/admin"],
+                                     self.request)
+        finally:
+            utils.forge_request = original_forge_request
+        eq_(access, {"/app1/blog": True, "/app1/admin": False})
+        eq_(len(forged_paths), 1)
+    
+    def test_index_is_reused(self):
+        collection = self.request.environ['repoze.what.global_control']
+        path_index = utils._get_path_index(collection)
+        ok_(utils._get_path_index(collection) is path_index)
+    
+    def test_index_is_updated_with_new_acls(self):
+        collection = ACLCollection()
+        self.request.environ['repoze.what.global_control'] = collection
+        eq_(can_access_many(["/app1/blog"], self.request),
+            {"/app1/blog": True})
+        acl = ACL("/app1")
+        acl.deny("/blog", MockPredicate())
+        collection.add_acl(acl)
+        eq_(can_access_many(["/app1/blog"], self.request),
+            {"/app1/blog": False})
+
+
+class TestCanAccessView(object):
+    """Tests for the can_access_view() function."""
+    
+    def setUp(self):
+        mw = RepozeWhatMiddleware()
+        self.request = Request({'PATH_INFO': "/"}, make_user(None))
+        self.request.urlconf = "tests.fixtures.named_urls"
+        mw.process_view(self.request, None, None, None)
+        self.predicate = RecordingPredicate()
+        acl = ACL("/admin")
+        acl.deny("/")
+        blog_acl = ACL("/blog")
+        blog_acl.deny("/", self.predicate)
+        collection = ACLCollection()
+        collection.add_acl(acl)
+        collection.add_acl(blog_acl)
+        self.request.environ['repoze.what.global_control'] = collection
+        
+        self.original_caches = (utils._RESOLUTION_CACHE, utils._VIEW_CACHE)
+        utils._RESOLUTION_CACHE = LRUCache(10)
+        utils._VIEW_CACHE = LRUCache(10)
+    
+    def tearDown(self):
+        (utils._RESOLUTION_CACHE, utils._VIEW_CACHE) = self.original_caches
+    
+    def test_authz_denied(self):
+        assert_false(can_access_view("admin", self.request))
+    
+    def test_authz_granted(self):
+        ok_(can_access_view("blog-post", self.request,
+                            kwargs={'post_id': "16"}))
+        eq_(self.predicate.environ_items,
+            [("/blog/16/", "", ((), {'post_id': "16"}))])
+    
+    def test_default_arguments(self):
+        """The default arguments in the URL pattern must be passed on."""
+        ok_(can_access_view("blog-index", self.request))
+        eq_(self.predicate.environ_items,
+            [("/blog/", "", ((), {'page': "1"}))])
+    
+    def test_dotted_name(self):
+        """Names with dots must not be mistaken for import paths."""
+        ok_(can_access_view("blog.archive", self.request))
+        eq_(self.predicate.environ_items, [("/blog/archive/", "", ((), {}))])
+    
+    def test_view(self):
+        assert_false(can_access_view(admin_view, self.request))
+        eq_(utils._RESOLUTION_CACHE.misses, 0)
+    
+    def test_view_import_path(self):
+        assert_false(can_access_view("tests.fixtures.named_urls.admin_view",
+                                     self.request))
+        eq_(utils._RESOLUTION_CACHE.misses, 0)
+    
+    def test_view_is_found_once(self):
+        """New argument values must not require resolving the path."""
+        for post_id in ("1", "2"):
+            can_access_view("blog-post", self.request,
+                            kwargs={'post_id': post_id})
+        eq_(utils._VIEW_CACHE.hits, 1)
+        eq_(utils._RESOLUTION_CACHE.misses, 0)
+    
+    def test_same_results_as_can_access(self):
+        eq_(can_access_view("admin", self.request),
+            can_access("/admin/", self.request))
+    
+    def test_unknown_view(self):
+        assert_raises(NoReverseMatch, can_access_view, "non-existing",
+                      self.request)
+
+
+class TestAccessibleURLs(object):
+    """Tests for the accessible_urls() function."""
+    
+    def setUp(self):
+        self.middleware = RepozeWhatMiddleware()
+        self.predicate = CountingPredicate()
+        acl = ACL("/app1")
+        acl.deny("/blog", compile_predicate(self.predicate))
+        self.collection = ACLCollection()
+        self.collection.add_acl(acl)
+        
+        self.original_caches = (utils._CANDIDATE_DEPENDENCIES_CACHE,
+                                utils._ACCESSIBLE_URLS_CACHE)
+        utils._CANDIDATE_DEPENDENCIES_CACHE = LRUCache(10)
+        utils._ACCESSIBLE_URLS_CACHE = LRUCache(10)
+    
+    def tearDown(self):
+        (utils._CANDIDATE_DEPENDENCIES_CACHE,
+         utils._ACCESSIBLE_URLS_CACHE) = self.original_caches
+    
+    def test_accessible_paths(self):
+        request = Request({'PATH_INFO': "/"}, make_user(None))
+        self.middleware._set_request_up(request)
+        paths = ["/app2/nothing", "/app1/admin", "/app1/blog"]
+        eq_(accessible_urls(request, paths), ["/app2/nothing", "/app1/blog"])
+    
+    def test_access_is_reused_for_same_credentials(self):
+        self.predicate.environ_dependencies = frozenset([GROUPS])
+        candidates = ["/app1/blog", "/app1/secret"]
+        eq_(accessible_urls(self._make_request("foo", ["g1"]), candidates),
+            ["/app1/secret"])
+        eq_(accessible_urls(self._make_request("bar", ["g1"]), candidates),
+            ["/app1/secret"])
+        eq_(self.predicate.calls, 1)
+        accessible_urls(self._make_request("foo", ["g2"]), candidates)
+        eq_(self.predicate.calls, 2)
+    
+    def test_request_dependent_paths_are_checked_every_time(self):
+        self.predicate.environ_dependencies = frozenset([GROUPS, REQUEST])
+        for index in range(2):
+            eq_(accessible_urls(self._make_request("foo"), ["/app1/blog"]),
+                [])
+        eq_(self.predicate.calls, 2)
+    
+    def test_acls_added_later(self):
+        self.predicate.environ_dependencies = frozenset([GROUPS])
+        candidates = ["/app1/secret"]
+        eq_(accessible_urls(self._make_request("foo"), candidates),
+            ["/app1/secret"])
+        acl = ACL("/app1")
+        acl.deny("/secret")
+        self.collection.add_acl(acl)
+        eq_(accessible_urls(self._make_request("foo"), candidates), [])
+    
+    def test_access_is_not_reused_across_url_configurations(self):
+        self.predicate.environ_dependencies = frozenset([GROUPS])
+        candidates = ["/app1/blog"]
+        eq_(accessible_urls(self._make_request("foo"), candidates), [])
+        request = self._make_request("foo")
+        request.urlconf = "tests.fixtures.named_urls"
+        assert_raises(Resolver404, accessible_urls, request, candidates)
+    
+    def _make_request(self, username, groups=()):
+        request = Request({'PATH_INFO': "/"}, make_user(username, groups))
+        self.middleware._set_request_up(request)
+        request.environ['repoze.what.global_control'] = self.collection
+        return request
+
+
+class TestLightweightForgedRequests(object):
+    """Tests for the requests forged on top of the current environ."""
+    
+    def setUp(self):
+        settings.AUTHZ_LIGHTWEIGHT_FORGED_REQUESTS = True
+        mw = RepozeWhatMiddleware()
+        self.request = Request({'PATH_INFO': "/", 'QUERY_STRING': "q=1"},
+                               make_user(None))
+        mw.process_view(self.request, None, None, None)
+    
+    def tearDown(self):
+        del settings.AUTHZ_LIGHTWEIGHT_FORGED_REQUESTS
+    
+    def test_same_results_as_copied_requests(self):
+        paths = ["/app1/blog", "/app1/admin", "/app2/secret", "/app2/nothing"]
+        access = can_access_many(paths, self.request)
+        del settings.AUTHZ_LIGHTWEIGHT_FORGED_REQUESTS
+        try:
+            eq_(access, can_access_many(paths, self.request))
+        finally:
+            settings.AUTHZ_LIGHTWEIGHT_FORGED_REQUESTS = True
+    
+    def test_forged_items(self):
+        predicate = RecordingPredicate()
+        self._deny_app1_blog(predicate)
+        ok_(can_access("/app1/blog?page=2", self.request, mock_view,
+                       ("a", ), {'b': "c"}))
+        eq_(predicate.environ_items,
+            [("/app1/blog", "page=2", (("a", ), {'b': "c"}))])
+    
+    def test_environ_is_not_modified(self):
+        """The current environ must not change, even during the checks."""
+        paths_seen = []
+        predicate = RecordingPredicate()
+        predicate.check = lambda request, credentials: paths_seen.append(
+            self.request.environ['PATH_INFO'])
+        self._deny_app1_blog(predicate)
+        can_access("/app1/blog?page=2", self.request, mock_view, (), {})
+        eq_(paths_seen, ["/"])
+        eq_(self.request.environ['QUERY_STRING'], "q=1")
+        ok_("wsgiorg.routing_args" not in self.request.environ)
+    
+    def test_forged_environ(self):
+        environ = {'PATH_INFO': "/", 'QUERY_STRING': "q=1", 'HTTP_HOST': "x"}
+        forged_environ = utils._forge_environ("/blog?page=2", environ, (),
+                                              {'b': "c"})
+        eq_(forged_environ.copy(), {
+            'PATH_INFO': "/blog",
+            'QUERY_STRING': "page=2",
+            'HTTP_HOST': "x",
+            'wsgiorg.routing_args': ((), {'b': "c"}),
+            })
+        eq_(len(forged_environ), 4)
+        forged_environ['REMOTE_USER'] = "foo"
+        del forged_environ['HTTP_HOST']
+        eq_(forged_environ.get('HTTP_HOST'), None)
+        ok_("HTTP_HOST" not in forged_environ)
+        eq_(forged_environ['REMOTE_USER'], "foo")
+        eq_(environ,
+            {'PATH_INFO': "/", 'QUERY_STRING': "q=1", 'HTTP_HOST': "x"})
+    
+    def _deny_app1_blog(self, predicate):
+        acl = ACL("/app1")
+        acl.deny("/blog", predicate)
+        collection = ACLCollection()
+        collection.add_acl(acl)
+        self.request.environ['repoze.what.global_control'] = collection
+
+
 #{ Mock objects
 
 
@@ -225,5 +591,36 @@ def mock_view(request):
     return "Got it"
 
 
+class RecordingPredicate(MockPredicate):
+    """Predicate which records the parts of the request it's evaluated on."""
+    
+    def __init__(self, *args, **kwargs):
+        self.environ_items = []
+        super(RecordingPredicate, self).__init__(False, *args, **kwargs)
+    
+    def check(self, request, credentials):
+        environ = request.environ
+        self.environ_items.append((environ['PATH_INFO'],
+                                   environ['QUERY_STRING'],
+                                   environ['wsgiorg.routing_args']))
+        return super(RecordingPredicate, self).check(request, credentials)
+
+
+def _fail(*args, **kwargs):
+    raise AssertionError("This must not be called")
+
+
+class CountingPredicate(MockPredicate):
+    """Predicate which counts the times it's evaluated."""
+    
+    def __init__(self, *args, **kwargs):
+        self.calls = 0
+        super(CountingPredicate, self).__init__(*args, **kwargs)
+    
+    def check(self, request, credentials):
+        self.calls += 1
+        return super(CountingPredicate, self).check(request, credentials)
+
+
 #}
 
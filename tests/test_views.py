@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2010, 2degrees Limited <gustavonarea@2degreesnetwork.com>.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the BSD-like license at
+# http://www.repoze.org/LICENSE.txt.  A copy of the license should accompany
+# this distribution.  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL
+# EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND
+# FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Tests for the Django views of the plugin.
+
+"""
+
+from nose.tools import eq_, assert_raises
+
+from repoze.what.acl import ACL, ACLCollection
+from repoze.what.predicates import Any
+
+from repoze.what.plugins.dj import RepozeWhatMiddleware
+from repoze.what.plugins.dj.compiler import compile_predicate
+from repoze.what.plugins.dj.utils import _AuthorizationDenial
+from repoze.what.plugins.dj.views import predicate_order
+
+from tests import Request, make_user, MockPredicate
+
+
+class TestPredicateOrder(object):
+    """Tests for the :func:`predicate_order` view."""
+    
+    def setUp(self):
+        self.request = Request({}, make_user("foo"))
+        self.request.user.is_superuser = True
+        RepozeWhatMiddleware()._set_request_up(self.request)
+        self.collection = ACLCollection()
+        self.request.environ['repoze.what.global_control'] = self.collection
+    
+    def test_compiled_predicates(self):
+        acl = ACL("/blog")
+        acl.allow("/", compile_predicate(Any(MockPredicate(False),
+                                             MockPredicate()), 10))
+        acl.allow("/feed", MockPredicate())
+        self.collection.add_acl(acl)
+        response = predicate_order(self.request)
+        eq_(response['Content-Type'], "text/plain")
+        eq_(response.content,
+            "ACL at /blog:\n"
+            "    Any (0 evaluations)\n"
+            "      - MockPredicate(result=False): not evaluated\n"
+            "      - MockPredicate(result=True): not evaluated\n")
+    
+    def test_no_compiled_predicates(self):
+        self.collection.add_acl(ACL("/blog"))
+        response = predicate_order(self.request)
+        eq_(response.content,
+            "There are no compiled predicates in the global ACLs.")
+    
+    def test_superusers_only(self):
+        self.request.user.is_superuser = False
+        assert_raises(_AuthorizationDenial, predicate_order, self.request)